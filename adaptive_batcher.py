@@ -0,0 +1,259 @@
+"""Адаптивное формирование батчей для кодирования по бюджету токенов.
+
+Батч набирается из текстов близкой длины так, чтобы число токенов с учётом
+паддинга (длина самого длинного × размер батча) не превышало бюджет. Бюджет
+не задаётся вручную, а подстраивается по наблюдаемой памяти: после каждого
+батча измеряется пик (CUDA — max_memory_allocated, CPU — максимум RSS,
+который фоновый поток снимает через psutil во время батча, и рост ru_maxrss,
+где он есть: после encode активации уже освобождены, и RSS по окончании
+батча пика не показывает), оценивается расход байт на токен и вычисляется бюджет, который
+помещается в заданную долю памяти. OOM остаётся страховкой: бюджет
+уменьшается, а оценка расхода на токен увеличивается, чтобы ошибка не
+повторялась на следующих батчах.
+"""
+
+import gc
+import sys
+import logging
+import threading
+from contextlib import contextmanager, nullcontext
+
+try:
+    import torch
+except ImportError:  # планирование батчей работает и без torch
+    torch = None
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+import config
+
+logger = logging.getLogger(__name__)
+
+# Батчи меньше этого числа токенов слишком шумные для оценки расхода памяти
+MIN_OBSERVED_TOKENS = 256
+# Период опроса RSS во время батча на CPU, секунд
+RSS_SAMPLE_SECONDS = 0.005
+
+
+def is_oom_error(error) -> bool:
+    """Нехватка памяти при кодировании (CUDA или CPU)."""
+    if isinstance(error, MemoryError):
+        return True
+    if torch is not None and isinstance(error, torch.cuda.OutOfMemoryError):
+        return True
+    return isinstance(error, RuntimeError) and (
+        "out of memory" in str(error).lower() or "can't allocate memory" in str(error).lower()
+    )
+
+
+def max_rss():
+    """Наибольший RSS процесса за всё время работы (ru_maxrss) в байтах или None."""
+    if resource is None:
+        return None
+    value = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux отдаёт килобайты, macOS — байты
+    return value if sys.platform == "darwin" else value * 1024
+
+
+@contextmanager
+def track_rss_peak(baseline, interval=RSS_SAMPLE_SECONDS):
+    """Максимум RSS за время блока: фоновый поток опрашивает psutil каждые interval секунд.
+
+    Короткий всплеск между опросами ловит ru_maxrss — если за блок он вырос,
+    новый пик процесса пришёлся на этот блок. Возвращает список из одного
+    элемента: после выхода из блока в нём пик в байтах.
+    """
+    peak = [baseline]
+    process = psutil.Process()
+    stop = threading.Event()
+
+    def sample():
+        while not stop.wait(interval):
+            peak[0] = max(peak[0], process.memory_info().rss)
+
+    before = max_rss()
+    sampler = threading.Thread(target=sample, name="rss-sampler", daemon=True)
+    sampler.start()
+    try:
+        yield peak
+    finally:
+        stop.set()
+        sampler.join()
+    peak[0] = max(peak[0], process.memory_info().rss)
+    after = max_rss()
+    if before is not None and after > before:
+        peak[0] = max(peak[0], after)
+
+
+def count_tokens(model, texts, log=logger.info):
+    """Длины текстов в токенах модели (с учётом обрезки до max_seq_length).
+
+    Если токенизатор недоступен, длина оценивается по числу символов.
+    """
+    max_length = model.max_seq_length
+    try:
+        encoded = model.tokenizer(
+            texts,
+            add_special_tokens=True,
+            truncation=True,
+            max_length=max_length,
+            return_attention_mask=False,
+            return_token_type_ids=False,
+        )
+        return [len(ids) for ids in encoded["input_ids"]]
+    except Exception as e:
+        log(f"  ⚠️ Не удалось посчитать токены ({e}), оцениваем длину по символам.")
+        return [min(max_length, len(text) // 3 + 2) for text in texts]
+
+
+class AdaptiveBatcher:
+    """Бюджет токенов на батч, подстраиваемый по наблюдаемому пику памяти.
+
+    Один экземпляр живёт весь запуск (pipeline) или всё время жизни процессора,
+    чтобы выученная оценка переносилась между вызовами encode_texts.
+    """
+
+    def __init__(self, device="cpu", token_budget=None, min_budget=None, max_budget=None,
+                 max_batch_size=None, memory_fraction=None):
+        self.device = torch.device(device) if torch is not None else device
+        self.token_budget = token_budget or config.PIPELINE_ENCODE_TOKEN_BUDGET
+        self.min_budget = min_budget or config.PIPELINE_ENCODE_MIN_TOKEN_BUDGET
+        self.max_budget = max_budget or config.PIPELINE_ENCODE_MAX_TOKEN_BUDGET
+        self.max_batch_size = max_batch_size or config.PIPELINE_ENCODE_MAX_BATCH_SIZE
+        self.memory_fraction = memory_fraction or config.PIPELINE_ENCODE_MEMORY_FRACTION
+        self.bytes_per_token = None
+        self.oom_count = 0
+        # Наибольший пик за все замеренные батчи: max_memory_allocated сбрасывается перед каждым
+        self.peak_bytes = 0
+
+    @property
+    def is_cuda(self):
+        return getattr(self.device, "type", self.device) == "cuda"
+
+    def can_measure(self):
+        return (self.is_cuda and torch is not None and torch.cuda.is_available()) or (not self.is_cuda and psutil is not None)
+
+    def next_batch(self, order, lengths, start):
+        """Срез order[start:...] для следующего батча по текущему бюджету.
+
+        order отсортирован по убыванию длины, поэтому самый длинный текст
+        батча — первый, и паддинг считается по нему.
+        """
+        return order[start:start + self.batch_size_for(lengths[order[start]])]
+
+    def batch_size_for(self, length):
+        """Сколько текстов заданной длины помещается в текущий бюджет."""
+        return max(1, min(self.max_batch_size, self.token_budget // max(length, 1)))
+
+    def _memory_state(self):
+        """(занято сейчас, лимит) в байтах для текущего устройства."""
+        if self.is_cuda:
+            total = torch.cuda.get_device_properties(self.device).total_memory
+            return torch.cuda.memory_allocated(self.device), total * self.memory_fraction
+        rss = psutil.Process().memory_info().rss
+        return rss, rss + psutil.virtual_memory().available * self.memory_fraction
+
+    @contextmanager
+    def measure(self, padded_tokens):
+        """Измеряет пик памяти на время кодирования батча и обновляет бюджет."""
+        if not self.can_measure() or padded_tokens < MIN_OBSERVED_TOKENS:
+            yield
+            return
+        baseline, limit = self._memory_state()
+        if self.is_cuda:
+            torch.cuda.reset_peak_memory_stats(self.device)
+            yield
+            peak = torch.cuda.max_memory_allocated(self.device)
+        else:
+            with track_rss_peak(baseline) as sampled:
+                yield
+            peak = sampled[0]
+        self.peak_bytes = max(self.peak_bytes, peak)
+        used = peak - baseline
+        if used > 0:
+            self.observe(padded_tokens, used, limit - baseline)
+
+    def observe(self, padded_tokens, used_bytes, headroom_bytes):
+        """Учитывает расход памяти батча и пересчитывает бюджет токенов."""
+        observed = used_bytes / padded_tokens
+        if self.bytes_per_token is None or observed > self.bytes_per_token:
+            # Рост расхода принимаем сразу, снижение — постепенно
+            self.bytes_per_token = observed
+        else:
+            self.bytes_per_token = 0.8 * self.bytes_per_token + 0.2 * observed
+        fitted = int(headroom_bytes / self.bytes_per_token)
+        # Бюджет растёт не более чем вдвое за шаг, чтобы не прыгнуть в OOM
+        self.token_budget = max(self.min_budget, min(self.max_budget, fitted, self.token_budget * 2))
+
+    def on_oom(self, padded_tokens):
+        """После OOM: бюджет вдвое ниже неудавшегося батча, оценка расхода выше.
+
+        Нижняя граница min_budget здесь не применяется: иначе батч, не
+        помещающийся в min_budget, повторялся бы бесконечно.
+        """
+        self.oom_count += 1
+        self.token_budget = max(1, min(self.token_budget, padded_tokens) // 2)
+        if self.bytes_per_token is not None:
+            self.bytes_per_token *= 2
+        if self.is_cuda and torch is not None:
+            torch.cuda.empty_cache()
+        gc.collect()
+
+
+def encode_texts(model, texts, batcher, log=logger.info, **encode_kwargs):
+    """Кодирует тексты батчами по бюджету токенов; эмбеддинги — в исходном порядке.
+
+    Тексты сортируются по убыванию длины: первыми идут самые требовательные
+    к памяти батчи, и оценка расхода сразу получается консервативной.
+
+    Returns:
+        Список векторов (по одному на текст) или None, если не удалось
+        закодировать даже один текст.
+    """
+    lengths = count_tokens(model, texts, log)
+    order = sorted(range(len(texts)), key=lengths.__getitem__, reverse=True)
+    embeddings = [None] * len(texts)
+    start = 0
+    batches = 0
+    padded_total = 0
+    while start < len(order):
+        indices = batcher.next_batch(order, lengths, start)
+        padded = lengths[indices[0]] * len(indices)
+        try:
+            with batcher.measure(padded), (torch.no_grad() if torch is not None else nullcontext()):
+                vectors = model.encode(
+                    [texts[i] for i in indices],
+                    batch_size=len(indices),
+                    show_progress_bar=False,
+                    **encode_kwargs
+                )
+        except Exception as e:
+            if not is_oom_error(e):
+                raise
+            if len(indices) == 1:
+                log("  ❌ Не удалось закодировать реплики даже с батчем 1.")
+                return None
+            batcher.on_oom(padded)
+            log(f"  ⚠️ OOM на батче {len(indices)}×{lengths[indices[0]]} токенов. Бюджет уменьшен до {batcher.token_budget}.")
+            continue
+        # Раскладываем векторы обратно по позициям исходных текстов
+        for i, vector in zip(indices, vectors):
+            embeddings[i] = vector
+        start += len(indices)
+        batches += 1
+        padded_total += padded
+
+    if texts:
+        log(
+            f"  🧠 Закодировано {len(texts)} текстов за {batches} батчей, "
+            f"паддинг {1 - sum(lengths) / max(padded_total, 1):.0%}, бюджет {batcher.token_budget} токенов"
+        )
+    return embeddings
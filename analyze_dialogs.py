@@ -2,7 +2,7 @@
 import json
 import config
 from pathlib import Path
-from striprtf.striprtf import rtf_to_text
+from rtf_decoder import rtf_to_text
 import ollama # Для будущего использования или подсчета токенов
 
 # --- Настройки для анализа ---
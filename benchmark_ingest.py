@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+"""Сквозной бенчмарк: разбор → запись → кодирование → индексация → поиск.
+
+Для каждого масштаба (число файлов на тему) во временной папке TEMP_ROOT
+генерируются синтетические экспорты (synthetic_exports.py), по ним
+выполняются pipeline и indexer с отдельной БД и индексами, затем — поиск
+по индексу "all" репликами из БД. Рабочие Input, processed, БД и индексы
+проекта не затрагиваются.
+
+Выводится:
+    - задержка разбора одного файла (p50/p95/p99, мс);
+    - пропускная способность pipeline (файлов, диалогов, реплик в секунду)
+      и самые долгие этапы по pipeline_metrics;
+    - скорость построения индексов (векторов/с);
+    - время открытия индекса "all" так, как его открывает GUI (FAISS_MMAP);
+    - задержка кодирования запроса и поиска top-k (p50/p95/p99, мс) и запросов/с.
+
+Кодирование идёт маленькой моделью BENCHMARK_MODEL_NAME (путь к локальной
+папке модели тоже подходит), чтобы замеры были быстрыми и воспроизводимыми
+без GPU. Запуск:
+    python benchmark_ingest.py [--scales 50 200 1000] [--model ...] [--queries 200] [--json out.json]
+"""
+
+import sys
+import json
+import time
+import random
+import shutil
+import sqlite3
+import argparse
+import tempfile
+from pathlib import Path
+
+import faiss
+import numpy as np
+
+import config
+import pipeline
+from indexer import build_all_indexes
+from synthetic_exports import write_exports
+from dialog_parser import parse_rtf_file
+from matryoshka import truncate_embeddings
+from index_types import INDEX_TYPES, read_index, apply_search_parameters
+from pipeline_metrics import load_runs
+
+PERCENTILES = (50, 95, 99)
+
+# Пути, которые на время замера переводятся во временную папку
+WORKSPACE_PATHS = {
+    "INPUT_ROOT": "Input",
+    "PROCESSED_ROOT": "processed",
+    "DATABASE_PATH": "database.db",
+    "FAISS_INDEX_DIR": "faiss_index",
+    "PIPELINE_RUNS_LOG": "pipeline_runs.jsonl",
+}
+
+
+def percentiles(samples):
+    """{"p50": ..., ...} в миллисекундах по замерам в секундах."""
+    if not samples:
+        return {f"p{p}": None for p in PERCENTILES}
+    values = np.percentile(np.asarray(samples) * 1000, PERCENTILES)
+    return {f"p{p}": round(float(v), 2) for p, v in zip(PERCENTILES, values)}
+
+
+def format_percentiles(stats):
+    return " / ".join(f"{stats[f'p{p}']}" for p in PERCENTILES) + f" мс (p{'/p'.join(map(str, PERCENTILES))})"
+
+
+def use_workspace(workspace):
+    """Переводит пути config в workspace; возвращает прежние значения."""
+    saved = {name: getattr(config, name) for name in WORKSPACE_PATHS}
+    for name, relative in WORKSPACE_PATHS.items():
+        setattr(config, name, workspace / relative)
+    for name in ("INPUT_ROOT", "PROCESSED_ROOT", "FAISS_INDEX_DIR"):
+        getattr(config, name).mkdir(parents=True, exist_ok=True)
+    return saved
+
+
+def measure_parse(files, sample):
+    """Задержки разбора отдельных файлов в текущем процессе."""
+    timings = []
+    for path in files[:sample]:
+        start = time.perf_counter()
+        parse_rtf_file(str(path), path.parent.name)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def measure_index(conn):
+    """(векторов в индексе "all", секунд на построение всех индексов)."""
+    start = time.perf_counter()
+    build_all_indexes(conn)
+    elapsed = time.perf_counter() - start
+    index_path, = conn.execute("SELECT index_path FROM faiss_indexes WHERE theme = 'all'").fetchone()
+    return faiss.read_index(index_path).ntotal, elapsed
+
+
+def measure_search(conn, model, queries, k, seed):
+    """Открытие индекса и задержки кодирования и поиска для запросов по одному, как в GUI."""
+    row = conn.execute("SELECT index_path, index_type, search_params FROM faiss_indexes WHERE theme = 'all'").fetchone()
+    start = time.perf_counter()
+    index, mapped = read_index(row[0], row[1])
+    load_seconds = time.perf_counter() - start
+    apply_search_parameters(index, row[2])
+    texts = [row[0] for row in conn.execute("SELECT DISTINCT text FROM utterances")]
+    rng = random.Random(seed)
+    texts = [rng.choice(texts) for _ in range(queries)]
+
+    encode_timings, search_timings = [], []
+    for text in texts:
+        start = time.perf_counter()
+        vector = np.asarray(model.encode([text], normalize_embeddings=True), dtype=np.float32)
+        encoded = time.perf_counter()
+        vector = truncate_embeddings(vector, index.d)
+        index.search(vector, k)
+        search_timings.append(time.perf_counter() - encoded)
+        encode_timings.append(encoded - start)
+    return row[1], (load_seconds, mapped), encode_timings, search_timings
+
+
+def run_scale(files, args, model):
+    """Полный прогон на files файлов в каждой теме; возвращает словарь результатов."""
+    workspace = Path(tempfile.mkdtemp(prefix=f"benchmark_ingest_{files}_", dir=config.TEMP_ROOT))
+    saved = use_workspace(workspace)
+    try:
+        generated = write_exports(
+            config.INPUT_ROOT, args.themes, files, args.calls, args.replies, seed=args.seed
+        )
+        rtf_files = sorted(config.INPUT_ROOT.rglob("*.rtf"))
+        parse = measure_parse(rtf_files, args.parse_sample)
+
+        start = time.perf_counter()
+        pipeline.process_thematic_folders()
+        ingest_seconds = time.perf_counter() - start
+
+        conn = sqlite3.connect(config.DATABASE_PATH)
+        try:
+            dialogs, utterances = (
+                conn.execute("SELECT COUNT(*) FROM dialogs").fetchone()[0],
+                conn.execute("SELECT COUNT(*) FROM utterances").fetchone()[0],
+            )
+            runs = load_runs(conn, 1)
+            vectors, index_seconds = measure_index(conn)
+            index_type, (load_seconds, mapped), encode_timings, search_timings = measure_search(
+                conn, model, args.queries, args.k, args.seed
+            )
+        finally:
+            conn.close()
+    finally:
+        for name, value in saved.items():
+            setattr(config, name, value)
+        if not args.keep:
+            shutil.rmtree(workspace, ignore_errors=True)
+
+    query_seconds = sum(encode_timings) + sum(search_timings)
+    return {
+        "files_per_theme": files,
+        "generated": generated,
+        "workspace": str(workspace) if args.keep else None,
+        "parse_ms": percentiles(parse),
+        "ingest": {
+            "seconds": round(ingest_seconds, 3),
+            "files_per_s": round(generated["files"] / ingest_seconds, 1),
+            "dialogs_per_s": round(dialogs / ingest_seconds, 1),
+            "utterances_per_s": round(utterances / ingest_seconds, 1),
+            "dialogs": dialogs,
+            "utterances": utterances,
+            "stages": runs[0]["stages"] if runs else {},
+        },
+        "index": {
+            "seconds": round(index_seconds, 3),
+            "vectors": vectors,
+            "type": index_type,
+            "vectors_per_s": round(vectors / index_seconds, 1) if index_seconds else None,
+            "load_ms": round(load_seconds * 1000, 2),
+            "mmap": mapped,
+        },
+        "search": {
+            "queries": len(search_timings),
+            "k": args.k,
+            "encode_ms": percentiles(encode_timings),
+            "search_ms": percentiles(search_timings),
+            "queries_per_s": round(len(search_timings) / query_seconds, 1) if query_seconds else None,
+        },
+    }
+
+
+def print_result(result):
+    generated, ingest, index, search = result["generated"], result["ingest"], result["index"], result["search"]
+    print(
+        f"\n📦 Масштаб {result['files_per_theme']} файлов/тема: файлов {generated['files']}, "
+        f"диалогов {generated['dialogs']}, реплик {generated['utterances']}, {generated['bytes'] / 1024 ** 2:.1f} МБ"
+    )
+    print(f"   📄 разбор файла: {format_percentiles(result['parse_ms'])}")
+    print(
+        f"   ⚙️ pipeline: {ingest['seconds']:.2f} с | {ingest['files_per_s']} файлов/с, "
+        f"{ingest['dialogs_per_s']} диалогов/с, {ingest['utterances_per_s']} реплик/с"
+    )
+    slowest = sorted(ingest["stages"].items(), key=lambda item: -item[1]["wall_s"])[:4]
+    if slowest:
+        print("      этапы: " + ", ".join(f"{name} {stage['wall_s']:.2f} с" for name, stage in slowest))
+    if ingest["utterances"] != generated["utterances"]:
+        print(f"   ⚠️ В БД реплик {ingest['utterances']}, сгенерировано {generated['utterances']}")
+    print(f"   🗂️ индексы: {index['seconds']:.2f} с | {index['vectors']} векторов ({index['type']}), {index['vectors_per_s']} векторов/с")
+    print(f"   📂 открытие индекса 'all': {index['load_ms']} мс ({'mmap' if index['mmap'] else 'чтение в память'})")
+    print(f"   🔎 кодирование запроса: {format_percentiles(search['encode_ms'])}")
+    print(
+        f"   🔎 поиск top-{search['k']}: {format_percentiles(search['search_ms'])} | "
+        f"{search['queries_per_s']} запросов/с"
+    )
+    if result["workspace"]:
+        print(f"   📁 рабочая папка: {result['workspace']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сквозной бенчмарк приёма и поиска на синтетических экспортах")
+    parser.add_argument("--scales", type=int, nargs="+", default=[50, 200], help="Файлов на тему для каждого прогона")
+    parser.add_argument("--themes", type=int, default=2, help="Число тем")
+    parser.add_argument("--calls", type=int, default=3, help="Максимум звонков в файле")
+    parser.add_argument("--replies", type=int, default=40, help="Среднее число реплик в звонке")
+    parser.add_argument("--model", default=config.BENCHMARK_MODEL_NAME, help="Модель эмбеддингов (имя или локальная папка)")
+    parser.add_argument("--output-dimension", type=int, default=None, help="Matryoshka-усечение векторов (по умолчанию — полная размерность)")
+    parser.add_argument("--index-type", choices=INDEX_TYPES, default=None, help="Тип индекса (по умолчанию FAISS_INDEX_TYPE)")
+    parser.add_argument("--queries", type=int, default=200, help="Число поисковых запросов")
+    parser.add_argument("--k", type=int, default=10, help="Глубина поиска")
+    parser.add_argument("--parse-sample", type=int, default=200, help="Сколько файлов разобрать для задержки разбора")
+    parser.add_argument("--seed", type=int, default=42, help="Зерно генератора экспортов и запросов")
+    parser.add_argument("--keep", action="store_true", help="Не удалять рабочие папки прогонов")
+    parser.add_argument("--json", help="Сохранить результаты в JSON")
+    args = parser.parse_args()
+    config.FAISS_INDEX_TYPE = args.index_type or config.FAISS_INDEX_TYPE
+
+    # Модель загружается один раз для запросов; pipeline загружает свою копию
+    config.EMBEDDING_MODEL_NAME = args.model
+    model, _device = pipeline.load_embedding_model()
+    dimension = len(model.encode(["Алло"])[0])
+    config.EMBEDDING_MODEL_DIMENSION = dimension
+    config.EMBEDDING_OUTPUT_DIMENSION = min(args.output_dimension or dimension, dimension)
+    print(f"ℹ️ Модель {args.model}: {dimension} изм., в БД — {config.EMBEDDING_OUTPUT_DIMENSION}")
+
+    results = []
+    for files in args.scales:
+        result = run_scale(files, args, model)
+        print_result(result)
+        results.append(result)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(
+                {"model": args.model, "dimension": config.EMBEDDING_OUTPUT_DIMENSION, "results": results},
+                f, ensure_ascii=False, indent=2,
+            )
+        print(f"\n💾 Результаты сохранены: {args.json}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""Полнота поиска при усечении эмбеддингов по Matryoshka.
+
+Для каждой размерности векторы усекаются (matryoshka.truncate_embeddings),
+по выборке строится точный поиск (IndexFlatIP) и результаты сравниваются с
+полными векторами: recall@k — доля top-k соседей полной размерности, найденных
+в top-k усечённых. Также выводятся байты на вектор в БД и время поиска.
+
+Запуск:
+    python benchmark_matryoshka.py [--vectors N] [--queries N] [--k 10] [--dims 64 128 256 512]
+
+Векторы берутся из utterance_embeddings, если они записаны в полной
+размерности; иначе синтетические фразы кодируются моделью.
+"""
+
+import sys
+import time
+import random
+import sqlite3
+import argparse
+
+import faiss
+import numpy as np
+
+import config
+from matryoshka import truncate_embeddings
+from vector_codec import decode_matrix, HEADER_SIZE
+from synthetic_exports import PHRASES
+
+
+def load_vectors(count):
+    """Полноразмерные векторы из БД или закодированные синтетические фразы."""
+    full = config.EMBEDDING_MODEL_DIMENSION
+    try:
+        conn = sqlite3.connect(config.DATABASE_PATH)
+        rows = conn.execute(
+            "SELECT vector FROM utterance_embeddings ORDER BY RANDOM() LIMIT ?", (count,)
+        ).fetchall()
+        conn.close()
+    except sqlite3.Error:
+        rows = []
+    vectors, valid = decode_matrix([row[0] for row in rows], full)
+    if len(vectors) >= 2:
+        print(f"📄 Векторов из БД: {len(vectors)} (пропущено других размерностей: {int((~valid).sum())})")
+        return vectors
+
+    from adaptive_batcher import AdaptiveBatcher, encode_texts
+    from embedding_backend import load_sentence_transformer
+
+    print("ℹ️ Полноразмерных векторов в БД нет, кодируем синтетические фразы.")
+    rng = random.Random(42)
+    texts = [" ".join(rng.choices(PHRASES, k=rng.randint(1, 4))) for _ in range(count)]
+    model = load_sentence_transformer(device="cpu", log=print)
+    model.max_seq_length = config.EMBEDDING_MODEL_MAX_LENGTH
+    return np.asarray(encode_texts(model, texts, AdaptiveBatcher("cpu")), dtype=np.float32)
+
+
+def search(vectors, queries, k):
+    """(индексы top-k, время поиска в секундах) точным поиском по скалярному произведению."""
+    index = faiss.IndexFlatIP(vectors.shape[1])
+    index.add(vectors)
+    start = time.perf_counter()
+    _, indices = index.search(queries, k)
+    return indices, time.perf_counter() - start
+
+
+def recall_at_k(reference, candidate):
+    k = reference.shape[1]
+    return float(np.mean([len(set(a) & set(b)) / k for a, b in zip(reference, candidate)]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк Matryoshka-усечения эмбеддингов")
+    parser.add_argument("--vectors", type=int, default=20000, help="Размер выборки векторов")
+    parser.add_argument("--queries", type=int, default=500, help="Сколько векторов выборки использовать как запросы")
+    parser.add_argument("--k", type=int, default=10, help="Глубина поиска для recall@k")
+    parser.add_argument("--dims", type=int, nargs="+", default=[64, 128, 256, 512], help="Размерности для сравнения")
+    args = parser.parse_args()
+
+    full = config.EMBEDDING_MODEL_DIMENSION
+    vectors = truncate_embeddings(load_vectors(args.vectors), full)
+    faiss.normalize_L2(vectors)
+    k = min(args.k, len(vectors))
+    queries = vectors[np.random.default_rng(0).choice(len(vectors), min(args.queries, len(vectors)), replace=False)]
+    itemsize = np.dtype(config.EMBEDDING_STORAGE_DTYPE).itemsize
+
+    reference, full_time = search(vectors, queries, k)
+    print(f"⚙️ {full:>5} изм. | {HEADER_SIZE + full * itemsize:6d} байт/вектор | поиск {full_time * 1000:8.1f} мс | эталон")
+    for dim in sorted(d for d in args.dims if d < full):
+        indices, elapsed = search(truncate_embeddings(vectors, dim), truncate_embeddings(queries, dim), k)
+        print(
+            f"⚙️ {dim:>5} изм. | {HEADER_SIZE + dim * itemsize:6d} байт/вектор | поиск {elapsed * 1000:8.1f} мс | "
+            f"recall@{k}: {recall_at_k(reference, indices):.1%}"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""Сравнение бэкендов модели эмбеддингов на CPU: PyTorch, ONNX и ONNX int8.
+
+Для каждого бэкенда замеряется скорость кодирования (реплик/с), а векторы
+сравниваются с PyTorch fp32: косинусное сходство (среднее и минимум) и
+совпадение 10 ближайших соседей внутри выборки — то, что важно для поиска.
+
+Запуск:
+    python benchmark_onnx.py [--texts N] [--backends torch onnx onnx-int8]
+
+Реплики берутся из БД; если БД пуста — синтетические фразы.
+"""
+
+import sys
+import time
+import random
+import sqlite3
+import argparse
+
+import numpy as np
+
+import config
+from adaptive_batcher import AdaptiveBatcher, encode_texts
+from embedding_backend import BACKENDS, load_sentence_transformer
+from synthetic_exports import PHRASES
+
+# Минимальное косинусное сходство с PyTorch, при котором бэкенд считается совместимым
+PARITY_THRESHOLDS = {"onnx": 0.999, "onnx-int8": 0.95}
+TOP_K = 10
+
+
+def load_texts(count):
+    """Случайная выборка реплик из БД или синтетические фразы."""
+    try:
+        conn = sqlite3.connect(config.DATABASE_PATH)
+        rows = conn.execute("SELECT text FROM utterances ORDER BY RANDOM() LIMIT ?", (count,)).fetchall()
+        conn.close()
+    except sqlite3.Error:
+        rows = []
+    if rows:
+        return [row[0] for row in rows]
+    rng = random.Random(42)
+    print("ℹ️ Реплик в БД нет, используем синтетические фразы.")
+    return [" ".join(rng.choices(PHRASES, k=rng.randint(1, 4))) for _ in range(count)]
+
+
+def encode(backend, texts):
+    """(векторы, время кодирования) на CPU; загрузка и экспорт модели в замер не входят."""
+    model = load_sentence_transformer(device="cpu", backend=backend, log=print)
+    model.max_seq_length = config.EMBEDDING_MODEL_MAX_LENGTH
+    encode_texts(model, texts[:8], AdaptiveBatcher("cpu"))  # прогрев
+    start = time.perf_counter()
+    vectors = encode_texts(model, texts, AdaptiveBatcher("cpu"))
+    elapsed = time.perf_counter() - start
+    return np.asarray(vectors, dtype=np.float32), elapsed
+
+
+def normalize(matrix):
+    return matrix / np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+
+
+def neighbour_overlap(reference, candidate, k=TOP_K):
+    """Средняя доля совпадающих top-k соседей (без самой реплики)."""
+    k = min(k, len(reference) - 1)
+    if k <= 0:
+        return 1.0
+
+    def top_k(matrix):
+        scores = matrix @ matrix.T
+        np.fill_diagonal(scores, -np.inf)
+        return np.argpartition(-scores, k, axis=1)[:, :k]
+
+    ref, cand = top_k(reference), top_k(candidate)
+    return float(np.mean([len(set(a) & set(b)) / k for a, b in zip(ref, cand)]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк бэкендов эмбеддингов на CPU")
+    parser.add_argument("--texts", type=int, default=512, help="Сколько реплик кодировать")
+    parser.add_argument("--backends", nargs="+", default=list(BACKENDS), choices=BACKENDS, help="Бэкенды для сравнения")
+    args = parser.parse_args()
+
+    texts = load_texts(args.texts)
+    print(f"📄 Реплик: {len(texts)}, модель: {config.EMBEDDING_MODEL_NAME}")
+
+    backends = ["torch"] + [b for b in args.backends if b != "torch"]
+    reference = None
+    torch_time = None
+    failed = False
+    for backend in backends:
+        vectors, elapsed = encode(backend, texts)
+        vectors = normalize(vectors)
+        line = f"⚙️ {backend:<10} {elapsed:7.2f} с, {len(texts) / elapsed:7.1f} реплик/с"
+        if reference is None:
+            reference, torch_time = vectors, elapsed
+            print(line)
+            continue
+        cosine = np.sum(reference * vectors, axis=1)
+        overlap = neighbour_overlap(reference, vectors)
+        ok = cosine.min() >= PARITY_THRESHOLDS[backend]
+        failed |= not ok
+        print(
+            f"{line}, x{torch_time / elapsed:.1f} к PyTorch | косинус: среднее {cosine.mean():.4f}, "
+            f"минимум {cosine.min():.4f} {'✅' if ok else '❌'} | top-{TOP_K} соседей: {overlap:.1%}"
+        )
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
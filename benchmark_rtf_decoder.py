@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""Бенчмарк извлечения текста из RTF: rtf_decoder против striprtf.
+
+Запуск:
+    python benchmark_rtf_decoder.py [файлы или папки ...] [--repeat N]
+
+Без аргументов берутся экспорты из Input/ и processed/; если их нет —
+синтетические экспорты в формате телефонии (synthetic_exports.py).
+"""
+
+import sys
+import time
+import random
+import argparse
+from pathlib import Path
+
+import config
+from striprtf.striprtf import rtf_to_text as striprtf_to_text
+from rtf_decoder import rtf_to_text, fast_rtf_to_text, UnsupportedRTF
+from synthetic_exports import synthetic_export
+
+
+def collect_documents(paths):
+    files = []
+    for path in paths:
+        path = Path(path)
+        files.extend(sorted(path.rglob("*.rtf")) if path.is_dir() else [path])
+    return [(f.name, f.read_text(encoding="utf-8", errors="ignore")) for f in files]
+
+
+def measure(func, documents, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _name, text in documents:
+            func(text)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк rtf_decoder против striprtf")
+    parser.add_argument("paths", nargs="*", help="RTF-файлы или папки")
+    parser.add_argument("--repeat", type=int, default=3, help="Число повторов (берётся лучшее время)")
+    parser.add_argument("--synthetic", type=int, default=200, help="Сколько синтетических экспортов, если файлов нет")
+    args = parser.parse_args()
+
+    paths = args.paths or [config.INPUT_ROOT, config.PROCESSED_ROOT]
+    documents = collect_documents(paths)
+    if not documents:
+        rng = random.Random(42)
+        documents = [(f"synthetic_{i}", synthetic_export(rng)) for i in range(args.synthetic)]
+        print(f"ℹ️ RTF-файлы не найдены, используем {len(documents)} синтетических экспортов.")
+
+    total_mb = sum(len(text) for _name, text in documents) / 1024 ** 2
+    print(f"📄 Документов: {len(documents)}, объём: {total_mb:.2f} МБ")
+
+    mismatches = 0
+    fallbacks = 0
+    for name, text in documents:
+        try:
+            fast_rtf_to_text(text)
+        except UnsupportedRTF:
+            fallbacks += 1
+        except Exception:
+            pass
+        try:
+            if rtf_to_text(text) != striprtf_to_text(text):
+                mismatches += 1
+                print(f"❌ Расхождение в {name}")
+        except Exception:
+            pass
+
+    striprtf_time = measure(striprtf_to_text, documents, args.repeat)
+    fast_time = measure(rtf_to_text, documents, args.repeat)
+
+    print(f"🐢 striprtf:    {striprtf_time:.3f} с ({len(documents) / striprtf_time:.1f} файлов/с, {total_mb / striprtf_time:.2f} МБ/с)")
+    print(f"🚀 rtf_decoder: {fast_time:.3f} с ({len(documents) / fast_time:.1f} файлов/с, {total_mb / fast_time:.2f} МБ/с)")
+    print(f"📈 Ускорение: x{striprtf_time / fast_time:.1f}")
+    print(f"↩️ Ушло в striprtf: {fallbacks}, расхождений: {mismatches}")
+    return 0 if mismatches == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -24,9 +24,22 @@ DATABASE_PATH = PROJECT_ROOT / "database.db"
 ## Основная модель эмбеддингов (для реплик и диалогов)
 EMBEDDING_MODEL_NAME = "Qwen/Qwen3-Embedding-0.6B"
 EMBEDDING_MODEL_DEVICE = "cuda"          # "cuda" или "cpu"
+EMBEDDING_MODEL_BACKEND = "torch"        # "torch", "onnx" или "onnx-int8" — ONNX Runtime для узлов без GPU
+EMBEDDING_ONNX_QUANTIZATION = "avx2"     # Профиль int8: "avx2", "avx512", "avx512_vnni" или "arm64"
+EMBEDDING_ONNX_THREADS = 0               # Потоков ONNX Runtime (0 — по числу физических ядер)
+EMBEDDING_ONNX_DIR = CACHE_ROOT / "onnx"  # Экспортированные ONNX-модели
 EMBEDDING_MODEL_PRECISION = "float16"    # "float16" для GPU, "float32" для CPU
 EMBEDDING_MODEL_MAX_LENGTH = 4096
 EMBEDDING_MODEL_DIMENSION = 1024
+EMBEDDING_STORAGE_DTYPE = "float32"      # Тип векторов в БД: "float32" или "float16" (вдвое меньше места)
+EMBEDDING_OUTPUT_DIMENSION = 1024         # Matryoshka: хранить и индексировать первые N компонент (256/512/1024)
+# Векторы диалогов собираются из векторов реплик (dialog_vectors.py), без повторного кодирования
+DIALOG_VECTOR_POOLING = "mean"            # "mean", "speaker" (веса ролей) или "attention"
+DIALOG_VECTOR_SPEAKER_WEIGHTS = {"client": 1.0, "operator": 0.5}
+DIALOG_VECTOR_ATTENTION_TEMPERATURE = 0.1
+DIALOG_VECTOR_BATCH_DIALOGS = 200         # Диалогов на один запрос к БД
+# Маленькая модель для benchmark_ingest.py (имя или путь к локальной папке модели)
+BENCHMARK_MODEL_NAME = "cointegrated/rubert-tiny2"
 
 ## Reranker (опционально)
 RERANKER_MODEL_NAME = "BAAI/bge-reranker-large"
@@ -39,18 +52,44 @@ LLM_API_URL = os.getenv("LLM_API_URL", "http://localhost:11434/api/generate")  #
 
 # --- Параметры обработки ---
 PIPELINE_BATCH_SIZE = 32               # Размер батча при обработке файлов
+PIPELINE_PARSE_WORKERS = max(1, (os.cpu_count() or 2) - 1)  # Процессов для парсинга RTF (0 — в основном процессе)
+PIPELINE_PARSE_QUEUE_SIZE = PIPELINE_BATCH_SIZE * 4         # Сколько файлов может ждать кодирования (ограничение очереди)
+PIPELINE_ENCODE_TOKEN_BUDGET = 32768      # Начальный бюджет токенов (с паддингом) на микробатч кодирования
+PIPELINE_ENCODE_MIN_TOKEN_BUDGET = 1024   # Границы, в которых бюджет подстраивается по пику памяти
+PIPELINE_ENCODE_MAX_TOKEN_BUDGET = 262144
+PIPELINE_ENCODE_MEMORY_FRACTION = 0.85   # Доля памяти GPU (или свободной RAM на CPU), которую может занять батч
+PIPELINE_WRITER_QUEUE_SIZE = 4           # Сколько батчей может ждать записи в БД (поток db_writer)
+PIPELINE_ENCODE_MAX_BATCH_SIZE = 256     # Максимум реплик в микробатче (для самых коротких)
+PIPELINE_ENCODE_WORKERS = 0              # Процессов кодирования на CPU (0 — в основном процессе); у каждого своя копия модели
+PIPELINE_ENCODE_THREADS_PER_WORKER = 0   # Ядер/потоков на процесс кодирования (0 — поровну между процессами)
+PIPELINE_ENCODE_CHUNK_SIZE = 64          # Текстов в порции, отправляемой процессу кодирования
+DAEMON_POLL_SECONDS = 2.0               # ingest_daemon: период опроса Input (без watchdog)
+DAEMON_SETTLE_SECONDS = 3.0             # ingest_daemon: файлы обрабатываются после стольких секунд без изменений
+DAEMON_INDEX_SAVE_SECONDS = 30.0        # ingest_daemon: дописанные индексы сохраняются на диск не чаще (и при остановке)
 PIPELINE_LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 PIPELINE_LOG_JSON_FORMAT = False         # True для JSON-логов (ELK, Grafana)
+PIPELINE_RUNS_LOG = LOGS_ROOT / "pipeline_runs.jsonl"  # Замеры этапов каждого запуска (также таблица pipeline_runs)
 
 # --- Параметры индексации FAISS ---
-FAISS_INDEX_TYPE = "IndexFlatIP"         # Тип индекса FAISS
-FAISS_NLIST = 100                        # Для IVF индексов (если будешь менять тип)
-FAISS_M = 32                             # Для HNSW (если понадобится)
+FAISS_INDEX_TYPE = "IndexIVFFlat"        # "IndexFlatIP", "IndexIVFFlat", "IndexIVFPQ", "OPQ+IndexIVFPQ" или "IndexHNSWFlat"
+FAISS_NLIST = 0                          # Кластеров IVF (0 — ~4·√N по размеру индекса)
+FAISS_NPROBE = 32                        # Сколько кластеров IVF просматривать при поиске
+FAISS_PQ_M = 64                          # Байт на вектор в IVF-PQ (должно делить размерность)
+FAISS_PQ_NBITS = 8
+FAISS_M = 32                             # Связей на узел HNSW
+FAISS_EF_CONSTRUCTION = 200              # Ширина поиска при построении HNSW
+FAISS_EF_SEARCH = 128                    # Ширина поиска HNSW при запросе
+FAISS_TRAIN_SAMPLE = 200000              # Размер случайной выборки для обучения IVF/PQ/OPQ
+FAISS_FLAT_MAX_VECTORS = 20000           # Индексы меньшего размера строятся точными (IndexFlatIP)
+FAISS_MMAP = True                        # GUI открывает индексы отображением файла в память (только чтение, общий страничный кэш)
+INDEXER_WORKERS = 4                      # Потоков для построения индексов тем (0 или 1 — последовательно)
 
 # --- Параметры поиска и GUI ---
 GUI_DEFAULT_TOP_K = 5                    # Сколько реплик показывать
 GUI_DEFAULT_CHUNK_SIZE = 10              # Размер чанка для analysis_methods
 GUI_DEFAULT_METHOD = "hierarchical"
+GUI_INDEX_RELOAD_SECONDS = 10            # Как часто GUI проверяет обновление индексов (0 — не проверять)
+GUI_INDEX_MEMORY_MB = 2048               # Бюджет памяти под индексы тем: давно не использованные выгружаются (0 — без ограничения)
 ANALYSIS_METHODS = ["hierarchical", "rolling", "facts", "classification", "callback_classifier", "fast_phrase_classifier"]
 
 # --- Настройки HyDE ---
@@ -6,6 +6,7 @@ from pathlib import Path
 from typing import Dict, List, Any, Optional
 import config
 from utils import get_db_connection
+from dialog_metadata import filter_sql
 import logging
 
 # Проверяем наличие pandas
@@ -74,21 +75,29 @@ class DataManager:
             logger.error(f"Ошибка получения количества QA-пар: {e}")
             return 0
     
-    def get_dialogs_data(self, limit: int = 100, offset: int = 0):
-        """Получить данные диалогов."""
+    def get_dialogs_data(self, limit: int = 100, offset: int = 0, **filters):
+        """Получить данные диалогов.
+
+        filters — фильтры по колонкам метаданных (см. dialog_metadata.FILTERS),
+        например operator_login="ivanov", date_from="2024-02-01".
+        """
         try:
-            query = """
-                SELECT id, text, metadata, source_theme, processed_at
-                FROM dialogs
-                ORDER BY processed_at DESC
+            where, params = filter_sql(filters)
+            query = f"""
+                SELECT d.id, d.text, d.metadata, d.source_theme, d.processed_at,
+                       d.call_datetime, d.operator_login, d.client_number, d.dialog_type
+                FROM dialogs d
+                WHERE {where}
+                ORDER BY d.processed_at DESC
                 LIMIT ? OFFSET ?
             """
+            params = (*params, limit, offset)
             if PANDAS_AVAILABLE:
-                return pd.read_sql_query(query, self.conn, params=(limit, offset))
+                return pd.read_sql_query(query, self.conn, params=params)
             else:
                 # Возвращаем список словарей если pandas недоступен
                 cursor = self.conn.cursor()
-                cursor.execute(query, (limit, offset))
+                cursor.execute(query, params)
                 columns = [description[0] for description in cursor.description]
                 return [dict(zip(columns, row)) for row in cursor.fetchall()]
         except Exception as e:
@@ -163,6 +172,16 @@ class DataManager:
             """)
             stats['themes'] = dict(cursor.fetchall())
             
+            # Статистика по операторам
+            cursor.execute("""
+                SELECT operator_login, COUNT(*) as count
+                FROM dialogs
+                WHERE operator_login IS NOT NULL
+                GROUP BY operator_login
+                ORDER BY count DESC
+            """)
+            stats['operators'] = dict(cursor.fetchall())
+            
             # Статистика по категориям фраз
             cursor.execute("""
                 SELECT category, COUNT(*) as count
@@ -187,17 +206,19 @@ class DataManager:
             logger.error(f"Ошибка получения статистики: {e}")
             return {}
     
-    def search_dialogs(self, query: str, limit: int = 10) -> List[Dict[str, Any]]:
-        """Поиск диалогов по тексту."""
+    def search_dialogs(self, query: str, limit: int = 10, **filters) -> List[Dict[str, Any]]:
+        """Поиск диалогов по тексту с фильтрами по метаданным."""
         try:
             cursor = self.conn.cursor()
-            cursor.execute("""
-                SELECT id, text, metadata, source_theme, processed_at
-                FROM dialogs
-                WHERE text LIKE ?
-                ORDER BY processed_at DESC
+            where, params = filter_sql(filters)
+            cursor.execute(f"""
+                SELECT d.id, d.text, d.metadata, d.source_theme, d.processed_at,
+                       d.call_datetime, d.operator_login, d.client_number, d.dialog_type
+                FROM dialogs d
+                WHERE {where} AND d.text LIKE ?
+                ORDER BY d.processed_at DESC
                 LIMIT ?
-            """, (f"%{query}%", limit))
+            """, (*params, f"%{query}%", limit))
             
             columns = [description[0] for description in cursor.description]
             results = []
@@ -210,19 +231,20 @@ class DataManager:
             logger.error(f"Ошибка поиска диалогов: {e}")
             return []
     
-    def search_utterances(self, query: str, limit: int = 10) -> List[Dict[str, Any]]:
-        """Поиск реплик по тексту."""
+    def search_utterances(self, query: str, limit: int = 10, **filters) -> List[Dict[str, Any]]:
+        """Поиск реплик по тексту с фильтрами по метаданным диалога."""
         try:
             cursor = self.conn.cursor()
-            cursor.execute("""
+            where, params = filter_sql(filters)
+            cursor.execute(f"""
                 SELECT u.id, u.dialog_id, u.speaker, u.text, u.turn_order,
-                       d.source_theme, d.processed_at
+                       d.source_theme, d.processed_at, d.call_datetime, d.operator_login
                 FROM utterances u
                 JOIN dialogs d ON u.dialog_id = d.id
-                WHERE u.text LIKE ?
+                WHERE {where} AND u.text LIKE ?
                 ORDER BY d.processed_at DESC, u.turn_order
                 LIMIT ?
-            """, (f"%{query}%", limit))
+            """, (*params, f"%{query}%", limit))
             
             columns = [description[0] for description in cursor.description]
             results = []
@@ -304,6 +326,20 @@ class DataManager:
             logger.error(f"Ошибка экспорта данных: {e}")
             return False
     
+    def get_operator_list(self) -> List[str]:
+        """Получить список операторов."""
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute("""
+                SELECT DISTINCT operator_login FROM dialogs
+                WHERE operator_login IS NOT NULL
+                ORDER BY operator_login
+            """)
+            return [row[0] for row in cursor.fetchall()]
+        except Exception as e:
+            logger.error(f"Ошибка получения списка операторов: {e}")
+            return []
+    
     def get_theme_list(self) -> List[str]:
         """Получить список тем."""
         try:
@@ -0,0 +1,208 @@
+"""Фоновая запись результатов pipeline в SQLite.
+
+Поток-писатель получает из очереди готовые батчи и записывает каждый одной
+транзакцией: диалоги, реплики, эмбеддинги, кэш эмбеддингов, манифест файлов
+и состояние батча в журнале ingest_journal. Кодирование в основном потоке не
+ждёт fsync — оно только кладёт батч в ограниченную очередь. Файлы переносятся
+в processed после commit, поэтому при ошибке записи они остаются в Input.
+
+БД переводится в режим WAL: читатели (GUI, основной поток pipeline) не
+блокируются писателем.
+"""
+
+import queue
+import sqlite3
+import threading
+from pathlib import Path
+
+from pipeline_metrics import RunMetrics
+
+# synchronous=NORMAL в режиме WAL не теряет целостность при сбое ОС,
+# но не делает fsync на каждый commit
+WRITER_PRAGMAS = (
+    "PRAGMA journal_mode=WAL;",
+    "PRAGMA synchronous=NORMAL;",
+    "PRAGMA cache_size=-65536;",  # 64 МБ страничного кэша
+    "PRAGMA temp_store=MEMORY;",
+)
+
+INSERT_DIALOGS_SQL = """
+    INSERT INTO dialogs (id, text, metadata, source_theme, processed_at,
+                         call_datetime, operator_login, client_number, dialog_type, participants)
+    VALUES (:id, :text, :metadata, :source_theme, :processed_at,
+            :call_datetime, :operator_login, :client_number, :dialog_type, :participants)
+"""
+INSERT_UTTERANCES_SQL = """
+    INSERT INTO utterances (id, dialog_id, speaker, text, turn_order)
+    VALUES (:id, :dialog_id, :speaker, :text, :turn_order)
+"""
+INSERT_EMBEDDINGS_SQL = """
+    INSERT OR REPLACE INTO utterance_embeddings (utterance_id, vector)
+    VALUES (?, ?)
+"""
+INSERT_CACHE_SQL = """
+    INSERT OR REPLACE INTO embedding_cache (model, text_hash, vector)
+    VALUES (?, ?, ?)
+"""
+INSERT_MANIFEST_SQL = """
+    INSERT OR REPLACE INTO file_manifest (path, theme, size, mtime, md5, status, recorded_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+"""
+INSERT_JOURNAL_SQL = """
+    INSERT OR REPLACE INTO ingest_journal (batch_id, theme, state, dialog_ids, moves, files_moved, error, created_at, updated_at)
+    VALUES (:batch_id, :theme, :state, :dialog_ids, :moves, 0, :error, :now, :now)
+"""
+UPDATE_JOURNAL_SQL = """
+    UPDATE ingest_journal SET state = :state, updated_at = :now WHERE batch_id = :batch_id
+"""
+
+# Ключ батча -> запрос; порядок важен (реплики ссылаются на диалоги)
+BATCH_STATEMENTS = (
+    ("dialogs", INSERT_DIALOGS_SQL),
+    ("utterances", INSERT_UTTERANCES_SQL),
+    ("embeddings", INSERT_EMBEDDINGS_SQL),
+    ("cache", INSERT_CACHE_SQL),
+    ("manifest", INSERT_MANIFEST_SQL),
+    ("journal", INSERT_JOURNAL_SQL),
+    ("journal_state", UPDATE_JOURNAL_SQL),
+)
+
+
+def open_connection(db_path, pragmas=WRITER_PRAGMAS):
+    """Соединение с настроенными pragma. timeout — ожидание блокировки другими писателями."""
+    conn = sqlite3.connect(str(db_path), timeout=60, check_same_thread=False)
+    for pragma in pragmas:
+        conn.execute(pragma)
+    return conn
+
+
+def chunked(items, size=500):
+    """Порции для IN (...) — в старых сборках SQLite не больше 999 параметров."""
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def existing_ids(cursor, table, ids):
+    """Какие из ids уже есть в таблице (один запрос на порцию вместо запроса на id)."""
+    ids = list(ids)
+    found = set()
+    for chunk in chunked(ids):
+        placeholders = ",".join("?" * len(chunk))
+        cursor.execute(f"SELECT id FROM {table} WHERE id IN ({placeholders})", chunk)
+        found.update(row[0] for row in cursor.fetchall())
+    return found
+
+
+class DBWriter:
+    """Поток-писатель SQLite с очередью батчей.
+
+    Батч — словарь со списками строк по ключам BATCH_STATEMENTS и списком
+    переносов файлов "moves" [(откуда, куда)], выполняемых после commit.
+    Если указан "batch_id", после переносов в журнале отмечается files_moved;
+    батчи с batch_id, чья первая запись (строка "journal") не удалась,
+    пропускаются, чтобы не переносить файлы без данных в БД.
+    """
+
+    def __init__(self, db_path, queue_size=4, log=print, metrics=None):
+        self.db_path = db_path
+        self.log = log
+        # Этапы db_write и file_moves замеряются в потоке писателя
+        self.metrics = metrics or RunMetrics()
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.thread = threading.Thread(target=self._run, name="DBWriter", daemon=True)
+        self.fatal_error = None
+        self.written_batches = 0
+        self.failed_batches = 0
+        self.failed_batch_ids = set()
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def submit(self, batch):
+        """Ставит батч в очередь. Блокирует, только если писатель отстал на queue_size батчей."""
+        if self.fatal_error is not None:
+            raise RuntimeError(f"Поток записи в БД остановлен: {self.fatal_error}")
+        self.queue.put(batch)
+
+    def flush(self):
+        """Ждёт, пока все поставленные батчи будут записаны."""
+        self.queue.join()
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+        if self.fatal_error is not None:
+            raise RuntimeError(f"Поток записи в БД остановлен: {self.fatal_error}")
+
+    def _run(self):
+        try:
+            conn = open_connection(self.db_path)
+        except Exception as e:
+            self.fatal_error = e
+            self._drain()
+            return
+        try:
+            while True:
+                batch = self.queue.get()
+                try:
+                    if batch is None:
+                        return
+                    self._write(conn, batch)
+                finally:
+                    self.queue.task_done()
+        finally:
+            conn.close()
+
+    def _drain(self):
+        """Опустошает очередь после фатальной ошибки, чтобы не блокировать submit/flush."""
+        while True:
+            batch = self.queue.get()
+            self.queue.task_done()
+            if batch is None:
+                return
+
+    def _write(self, conn, batch):
+        if batch.get("batch_id") in self.failed_batch_ids:
+            self.log(f"  ⏭️ Батч {batch['batch_id']} пропущен: его данные не были записаны.")
+            return
+        rows_count = sum(len(batch.get(key) or ()) for key, _ in BATCH_STATEMENTS)
+        try:
+            with self.metrics.stage("db_write", items=rows_count), conn:  # одна транзакция на батч
+                for key, sql in BATCH_STATEMENTS:
+                    rows = batch.get(key)
+                    if rows:
+                        conn.executemany(sql, rows)
+        except Exception as e:
+            self.failed_batches += 1
+            self.log(f"  ❌ Ошибка записи батча в БД (файлы остаются в Input): {e}")
+            self._record_failure(conn, batch, e)
+            return
+        self.written_batches += 1
+
+        # Файлы переносятся только после успешного commit
+        moves = batch.get("moves", ())
+        with self.metrics.stage("file_moves", items=len(moves)):
+            for source, target in moves:
+                source, target = Path(source), Path(target)
+                if not source.exists() and target.exists():
+                    continue  # перенесён до сбоя
+                try:
+                    source.rename(target)
+                except Exception as e:
+                    self.log(f"  ❌ Не удалось перенести {source} в {target}: {e}")
+        if batch.get("batch_id"):
+            with conn:
+                conn.execute("UPDATE ingest_journal SET files_moved = 1 WHERE batch_id = ?", (batch["batch_id"],))
+
+    def _record_failure(self, conn, batch, error):
+        """Батч, данные которого не записались, остаётся в журнале в состоянии parsed с текстом ошибки."""
+        rows = [dict(row, state="parsed", error=str(error)) for row in batch.get("journal", ())]
+        self.failed_batch_ids.update(row["batch_id"] for row in rows)
+        if not rows:
+            return
+        try:
+            with conn:
+                conn.executemany(INSERT_JOURNAL_SQL, rows)
+        except Exception as e:
+            self.log(f"  ❌ Не удалось записать ошибку батча в журнал: {e}")
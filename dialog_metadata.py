@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""Типизированные колонки метаданных диалога.
+
+Оператор, время звонка, номер клиента, тип диалога и строка участников
+хранятся не только в JSON dialogs.metadata, но и в отдельных колонках с
+B-tree индексами: фильтр "оператор X за прошлую неделю" — диапазонный
+поиск по индексу (operator_login, call_datetime), а не json.loads каждой
+строки. call_datetime — ISO 8601, поэтому строки сравниваются как даты.
+
+Колонки заполняет pipeline при записи диалога. В существующей БД
+ensure_dialog_columns добавляет колонки и индексы, а backfill_dialog_columns
+заполняет их из JSON. init_db и pipeline вызывают ensure_dialog_metadata:
+решение о заполнении принимается по данным (есть ли диалоги с JSON, но
+пустыми колонками), а не по тому, кто добавил колонки, поэтому прерванное
+заполнение тоже продолжается. Ручной запуск (можно прерывать и повторять):
+    python dialog_metadata.py [--batch-size N]
+"""
+
+import sys
+import json
+import sqlite3
+import argparse
+from datetime import date, datetime
+
+import config
+
+# Колонка -> тип SQLite
+DIALOG_COLUMNS = {
+    "call_datetime": "TEXT",
+    "operator_login": "TEXT",
+    "client_number": "TEXT",
+    "dialog_type": "TEXT",
+    "participants": "TEXT",
+}
+
+DIALOG_INDEXES_SQL = (
+    "CREATE INDEX IF NOT EXISTS idx_dialogs_operator_datetime ON dialogs(operator_login, call_datetime);",
+    "CREATE INDEX IF NOT EXISTS idx_dialogs_call_datetime ON dialogs(call_datetime);",
+    "CREATE INDEX IF NOT EXISTS idx_dialogs_client_number ON dialogs(client_number);",
+    "CREATE INDEX IF NOT EXISTS idx_dialogs_theme_datetime ON dialogs(source_theme, call_datetime);",
+    # Реплики отфильтрованных диалогов — по индексу, а не полным просмотром utterances
+    "CREATE INDEX IF NOT EXISTS idx_utterances_dialog_id ON utterances(dialog_id, turn_order);",
+)
+
+# Фильтр -> условие по таблице диалогов (alias подставляется при сборке запроса)
+FILTERS = {
+    "operator_login": "{d}.operator_login = ?",
+    "client_number": "{d}.client_number = ?",
+    "dialog_type": "{d}.dialog_type = ?",
+    "theme": "{d}.source_theme = ?",
+    "date_from": "{d}.call_datetime >= ?",  # включительно
+    "date_to": "{d}.call_datetime < ?",     # не включительно
+}
+
+
+def dialog_columns(metadata: dict) -> dict:
+    """Значения типизированных колонок из метаданных парсера."""
+    participants = metadata.get("participants") or {}
+    call_datetime = metadata.get("dialog_datetime")
+    if not call_datetime and metadata.get("date_from_filename") and metadata.get("time_from_filename"):
+        call_datetime = f"{metadata['date_from_filename']}T{metadata['time_from_filename']}"
+    return {
+        "call_datetime": call_datetime,
+        "operator_login": participants.get("operator_login") or metadata.get("operator_login_from_filename"),
+        "client_number": participants.get("client_number") or metadata.get("client_number_from_filename"),
+        "dialog_type": metadata.get("dialog_type"),
+        "participants": metadata.get("participants_raw"),
+    }
+
+
+def filter_sql(filters, alias="d"):
+    """(условие WHERE, параметры) для фильтров по колонкам диалога.
+
+    Args:
+        filters: {имя из FILTERS: значение}; None и пустые значения пропускаются.
+            date_from/date_to — строка ISO, date или datetime.
+        alias: Псевдоним таблицы dialogs в запросе.
+    """
+    clauses, params = [], []
+    for name, value in (filters or {}).items():
+        if name not in FILTERS:
+            raise ValueError(f"Неизвестный фильтр диалогов: {name} (допустимо: {', '.join(FILTERS)})")
+        if value is None or value == "":
+            continue
+        if isinstance(value, (date, datetime)):
+            value = value.isoformat()
+        clauses.append(FILTERS[name].format(d=alias))
+        params.append(value)
+    return " AND ".join(clauses) or "1", params
+
+
+def ensure_dialog_columns(conn):
+    """Добавляет недостающие колонки и индексы; возвращает список добавленных колонок."""
+    existing = {row[1] for row in conn.execute("PRAGMA table_info(dialogs)")}
+    added = [name for name in DIALOG_COLUMNS if name not in existing]
+    for name in added:
+        conn.execute(f"ALTER TABLE dialogs ADD COLUMN {name} {DIALOG_COLUMNS[name]}")
+    for sql in DIALOG_INDEXES_SQL:
+        conn.execute(sql)
+    conn.commit()
+    return added
+
+
+def _empty_columns_sql():
+    return " AND ".join(f"{name} IS NULL" for name in DIALOG_COLUMNS)
+
+
+def needs_backfill(conn) -> bool:
+    """Есть ли диалоги с JSON-метаданными, у которых все типизированные колонки пусты."""
+    return conn.execute(
+        f"SELECT EXISTS(SELECT 1 FROM dialogs WHERE {_empty_columns_sql()} AND metadata IS NOT NULL AND metadata NOT IN ('', '{{}}'))"
+    ).fetchone()[0] == 1
+
+
+def ensure_dialog_metadata(conn, batch_size=5000):
+    """Колонки и индексы метаданных + заполнение из JSON, если есть незаполненные диалоги.
+
+    Returns:
+        Число диалогов, в которых колонки заполнены.
+    """
+    ensure_dialog_columns(conn)
+    return backfill_dialog_columns(conn, batch_size) if needs_backfill(conn) else 0
+
+
+def backfill_dialog_columns(conn, batch_size=5000):
+    """Заполняет колонки из JSON metadata для диалогов, где они пусты. Возвращает число обновлённых."""
+    empty = _empty_columns_sql()
+    assignments = ", ".join(f"{name} = :{name}" for name in DIALOG_COLUMNS)
+    updated = failed = 0
+    last_rowid = -1
+    while True:
+        rows = conn.execute(
+            f"SELECT rowid, metadata FROM dialogs WHERE rowid > ? AND {empty} ORDER BY rowid LIMIT ?",
+            (last_rowid, batch_size)
+        ).fetchall()
+        if not rows:
+            break
+        last_rowid = rows[-1][0]
+
+        updates = []
+        for rowid, metadata in rows:
+            try:
+                values = dialog_columns(json.loads(metadata))
+            except (TypeError, ValueError, AttributeError):
+                failed += 1
+                continue
+            # В JSON нет ни одного из полей — колонки остаются пустыми, писать нечего
+            if any(value is not None for value in values.values()):
+                updates.append({**values, "rowid": rowid})
+        conn.executemany(f"UPDATE dialogs SET {assignments} WHERE rowid = :rowid", updates)
+        conn.commit()
+        updated += len(updates)
+        if updated or failed:
+            print(f"\r  dialogs: заполнено {updated}, не разобрано {failed}", end="")
+    if updated or failed:
+        print()
+    return updated
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Заполнение типизированных колонок метаданных диалогов")
+    parser.add_argument("--batch-size", type=int, default=5000, help="Строк за одну транзакцию")
+    args = parser.parse_args()
+
+    print(f"🔄 Колонки метаданных диалогов в {config.DATABASE_PATH}")
+    conn = sqlite3.connect(config.DATABASE_PATH)
+    try:
+        added = ensure_dialog_columns(conn)
+        if added:
+            print(f"➕ Добавлены колонки: {', '.join(added)}")
+        backfill_dialog_columns(conn, args.batch_size)
+    finally:
+        conn.close()
+    print("✅ Готово.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,265 @@
+"""Парсинг RTF-экспортов звонков: извлечение текста, метаданных и реплик.
+
+Модуль не зависит от torch/sentence-transformers, поэтому его функции можно
+безопасно выполнять в процессах пула (см. pipeline.process_thematic_folders).
+"""
+
+import re
+import hashlib
+from collections import deque
+from itertools import chain
+from datetime import datetime
+from pathlib import Path
+
+# === Для обработки RTF ===
+from rtf_decoder import rtf_to_text
+
+
+def hash_file(path: Path) -> str:
+    return hashlib.md5(path.read_bytes()).hexdigest()
+
+
+def extract_metadata_from_filename(filename_stem: str) -> dict:
+    pattern = r'^(\d{4})(\d{2})(\d{2})(\d{2})(\d{2})(\d{2})_([A-Za-z0-9_]+)_([0-9]+)$'
+    match = re.match(pattern, filename_stem)
+    if match:
+        year, month, day, hour, minute, second, operator_login, client_number = match.groups()
+        if re.match(r'^\d{10,11}$', client_number):
+            return {
+                "date_from_filename": f"{year}-{month}-{day}",
+                "time_from_filename": f"{hour}:{minute}:{second}",
+                "operator_login_from_filename": operator_login,
+                "client_number_from_filename": client_number
+            }
+    return {}
+
+
+# Заголовок звонка: "<id> (dd.mm.yyyy hh:mm:ss)"
+DIALOG_HEADER_RE = re.compile(r'^(\d+)\s*\((\d{2}\.\d{2}\.\d{4}\s\d{1,2}:\d{2}:\d{2})\)')
+# Строка участников: "operator@domain -> client" (или "<-")
+PARTICIPANTS_RE = re.compile(r'([A-Za-z0-9@._\-]+)\s*(->|<-)\s*([0-9a-fA-F\-]+)')
+# Служебные строки экспорта, не относящиеся к репликам
+SERVICE_LINE_RE = re.compile(r'^(rtf export, \d+ call\(s\)|порог чувствительности:.*)$', re.IGNORECASE)
+LINE_TIME_RE = re.compile(r'\t(\d+:\d+:\d+)$')
+# Те же разделители строк, что у str.splitlines()
+_LINE_RE = re.compile(r'[^\n\r\v\f\x1c\x1d\x1e\x85\u2028\u2029]+')
+
+
+def iter_nonempty_lines(text):
+    """Лениво перебирает непустые строки текста (с обрезанными концевыми пробелами)."""
+    for match in _LINE_RE.finditer(text):
+        line = match.group().rstrip()
+        if line:
+            yield line
+
+
+def parse_participants(participants_line: str) -> dict:
+    participants = {}
+    p_match = PARTICIPANTS_RE.search(participants_line)
+    if p_match:
+        op_raw = p_match.group(1)
+        arrow = p_match.group(2)
+        client_raw = p_match.group(3)
+        op_login = op_raw.split('@')[0] if '@' in op_raw else op_raw
+        participants["operator_login"] = op_login
+        participants["operator_raw"] = op_raw
+        participants["arrow"] = arrow
+        participants["client_id"] = client_raw
+        if client_raw.isdigit() and len(client_raw) >= 10:
+            participants["client_number"] = client_raw
+    return participants
+
+
+def append_dialog_line(dialog_lines: list, line: str):
+    """Добавляет строку экспорта в список реплик в формате 'Speaker: text [hh:mm:ss]'."""
+    time_match = LINE_TIME_RE.search(line)
+    line_text = line
+    line_time = None
+    if time_match:
+        line_time = time_match.group(1)
+        line_text = line[:time_match.start()].rstrip("\t")
+    line_text = line_text.strip()
+    if not line_text:
+        return
+    parts = line_text.split('\t', 1)
+    potential_speaker = parts[0].strip()
+    replica_text = parts[1].strip() if len(parts) > 1 else line_text
+    if potential_speaker and len(potential_speaker) < 100 and replica_text:
+        speaker = potential_speaker.split('@')[0] if '@' in potential_speaker else potential_speaker
+        time_str = f" [{line_time}]" if line_time else ""
+        dialog_lines.append(f"{speaker}: {replica_text}{time_str}")
+    elif dialog_lines and replica_text:
+        dialog_lines[-1] += f" {replica_text}"
+    else:
+        dialog_lines.append(line_text)
+
+
+def iter_dialog_records(text, file_metadata_from_name, file_id):
+    """Потоково разбивает текст экспорта на звонки.
+
+    Для "Rtf export, N call(s)" выдаёт по одной записи (dialog_lines, metadata)
+    на каждый звонок. Текст без заголовков звонков считается одним диалогом
+    с идентификатором file_id.
+    """
+    lines = iter_nonempty_lines(text)
+    first_line = next(lines, None)
+    if first_line is None:
+        return
+    is_export = "Rtf export" in first_line and "call(s)" in first_line
+
+    def finalize(call):
+        dialog_type = call["dialog_type"]
+        if is_export:
+            dialog_type = "chat"
+        final_metadata = file_metadata_from_name.copy()
+        final_metadata.update({
+            "dialog_id": call["dialog_id"],
+            "dialog_datetime": call["dialog_datetime"],
+            "participants_raw": call["participants_raw"],
+            "dialog_type": dialog_type,
+            "participants": call["participants"],
+            "call_index": call["call_index"]
+        })
+        return call["dialog_lines"], final_metadata
+
+    call = None
+    call_index = 0
+    expect_participants = False
+    preamble = []  # строки до первого заголовка: нужны, только если заголовков нет вовсе
+    for line in chain((first_line,), lines):
+        stripped = line.strip()
+        header_match = DIALOG_HEADER_RE.match(stripped)
+        if header_match:
+            if call is not None:
+                yield finalize(call)
+            preamble = None
+            call_index += 1
+            call = {
+                "dialog_id": header_match.group(1),
+                "dialog_datetime": None,
+                "dialog_type": "unknown",
+                "participants_raw": None,
+                "participants": {},
+                "call_index": call_index,
+                "dialog_lines": []
+            }
+            try:
+                dt_obj = datetime.strptime(header_match.group(2), '%d.%m.%Y %H:%M:%S')
+                call["dialog_datetime"] = dt_obj.isoformat()
+                call["dialog_type"] = "voice"
+            except ValueError:
+                pass
+            expect_participants = True
+            continue
+        if expect_participants:
+            call["participants_raw"] = stripped
+            call["participants"] = parse_participants(stripped)
+            expect_participants = False
+            continue
+        if SERVICE_LINE_RE.match(stripped):
+            continue
+        if call is None:
+            preamble.append(line)
+        else:
+            append_dialog_line(call["dialog_lines"], line)
+
+    if call is not None:
+        yield finalize(call)
+        return
+
+    # Заголовков звонков нет: весь текст — один диалог
+    call = {
+        "dialog_id": file_id,
+        "dialog_datetime": None,
+        "dialog_type": "unknown",
+        "participants_raw": None,
+        "participants": {},
+        "call_index": 1,
+        "dialog_lines": []
+    }
+    for line in preamble:
+        append_dialog_line(call["dialog_lines"], line)
+    yield finalize(call)
+
+
+def clean_dialog_text_no_filter(text, file_metadata_from_name, file_id):
+    """Первый звонок экспорта (совместимость). Для всех звонков — iter_dialog_records."""
+    return next(iter_dialog_records(text, file_metadata_from_name, file_id), ([], file_metadata_from_name))
+
+
+def split_utterance_line(line: str):
+    """Разбивает строку диалога вида 'Speaker: text [hh:mm:ss]' на (speaker, text)."""
+    if ": " in line:
+        speaker_part, text_part = line.split(": ", 1)
+        if " [" in text_part:
+            text_part = text_part.split(" [")[0]
+    else:
+        speaker_part = "Unknown"
+        text_part = line
+    return speaker_part, text_part
+
+
+def parse_rtf_file(path_str: str, theme_name: str) -> dict:
+    """Разбирает один RTF-файл. Выполняется в процессе пула, поэтому принимает
+    и возвращает только сериализуемые (pickle) значения.
+
+    Returns:
+        Словарь {path, md5, size, mtime, dialogs, error}, где dialogs — список
+        звонков файла {dialog_id, dialog_lines, utterances, metadata}.
+        При ошибке заполнено поле error; md5/size/mtime — если файл удалось прочитать.
+    """
+    file = Path(path_str)
+    result = {"path": path_str, "md5": None, "error": None}
+    try:
+        # Файл читается с диска ровно один раз: и для хеша, и для текста
+        result["mtime"] = file.stat().st_mtime
+        raw_bytes = file.read_bytes()
+        result["size"] = len(raw_bytes)
+        result["md5"] = hashlib.md5(raw_bytes).hexdigest()
+        file_hash = result["md5"][:16]
+
+        file_metadata = extract_metadata_from_filename(file.stem)
+        file_metadata["source_theme"] = theme_name
+
+        raw_text = rtf_to_text(raw_bytes.decode("utf-8", errors="ignore"))
+        dialogs = []
+        for dialog_lines, dialog_metadata in iter_dialog_records(raw_text, file_metadata, file_hash):
+            dialogs.append({
+                "dialog_id": dialog_metadata.get("dialog_id", file_hash),
+                "dialog_lines": dialog_lines,
+                "utterances": [split_utterance_line(line) for line in dialog_lines],
+                "metadata": dialog_metadata,
+            })
+        result["dialogs"] = dialogs
+    except Exception as e:
+        result["error"] = str(e)
+    return result
+
+
+def iter_parsed_files(files, theme_name: str, executor=None, max_pending: int = 64, observe=None):
+    """Лениво разбирает файлы в пуле процессов, сохраняя исходный порядок.
+
+    Одновременно в работе (и в очереди готовых результатов) находится не более
+    max_pending файлов: пул парсит следующие файлы, пока потребитель (кодировщик)
+    обрабатывает уже выданные. Без executor файлы разбираются в текущем процессе.
+    observe(n) вызывается перед выдачей результата с числом уже разобранных файлов в очереди.
+    """
+    if executor is None:
+        for file in files:
+            yield parse_rtf_file(str(file), theme_name)
+        return
+
+    files_iter = iter(files)
+    pending = deque()
+    for file in files_iter:
+        pending.append(executor.submit(parse_rtf_file, str(file), theme_name))
+        if len(pending) >= max_pending:
+            break
+    while pending:
+        if observe is not None:
+            observe(sum(future.done() for future in pending))
+        result = pending.popleft().result()
+        next_file = next(files_iter, None)
+        if next_file is not None:
+            pending.append(executor.submit(parse_rtf_file, str(next_file), theme_name))
+        yield result
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""Векторы диалогов из уже посчитанных векторов реплик.
+
+Вместо повторного кодирования полного текста диалога (до 2048 токенов на
+диалог) вектор диалога собирается из utterance_embeddings одной сегментной
+редукцией NumPy по репликам, отсортированным по диалогу:
+
+    "mean"      — среднее векторов реплик;
+    "speaker"   — взвешенное среднее, веса ролей из DIALOG_VECTOR_SPEAKER_WEIGHTS;
+    "attention" — веса softmax(cos(реплика, среднее диалога) / T): реплики,
+                  близкие к теме диалога, весят больше, случайные — меньше.
+
+Результат L2-нормализуется и записывается в таблицу embeddings в формате
+vector_codec, в размерности векторов реплик.
+
+Запуск: python dialog_vectors.py [--method mean|speaker|attention]
+"""
+
+import re
+import sys
+import logging
+import argparse
+
+import numpy as np
+
+import config
+from db_writer import chunked
+from matryoshka import output_dimension
+from vector_codec import decode_matrix, encode_vector
+
+logger = logging.getLogger(__name__)
+
+POOLING_METHODS = ("mean", "speaker", "attention")
+
+# Клиент в выгрузках телефонии — номер телефона, оператор — логин
+_PHONE_RE = re.compile(r"\+?\d[\d\s()-]*")
+
+
+def speaker_role(speaker) -> str:
+    """"client" для номера телефона, иначе "operator"."""
+    return "client" if _PHONE_RE.fullmatch(speaker.strip()) else "operator"
+
+
+def segment_sum(matrix, starts):
+    """Суммы строк matrix по сегментам, начинающимся с позиций starts."""
+    if matrix.ndim == 1:
+        return np.add.reduceat(matrix, starts)
+    # np.add.reduceat по оси 0 C-массива обходит столбцы с шагом в строку и
+    # на порядок медленнее суммы непрерывного блока строк
+    ends = np.append(starts[1:], len(matrix))
+    out = np.empty((len(starts), matrix.shape[1]), dtype=matrix.dtype)
+    for i, (start, end) in enumerate(zip(starts, ends)):
+        np.add.reduce(matrix[start:end], axis=0, out=out[i])
+    return out
+
+
+def segment_pool(vectors, starts, method="mean", weights=None, temperature=None):
+    """Пулинг строк vectors по сегментам, начинающимся с позиций starts.
+
+    Args:
+        vectors: Матрица (n, dim); строки одного диалога идут подряд.
+        starts: Возрастающие индексы начала сегментов (starts[0] == 0, сегменты непустые).
+        method: "mean", "speaker" или "attention".
+        weights: Веса строк для "speaker".
+        temperature: Температура softmax для "attention".
+
+    Returns:
+        L2-нормализованная матрица (len(starts), dim).
+    """
+    if method not in POOLING_METHODS:
+        raise ValueError(f"Неизвестный метод пулинга: {method} (допустимо: {', '.join(POOLING_METHODS)})")
+    vectors = np.asarray(vectors, dtype=np.float32)
+    starts = np.asarray(starts, dtype=np.intp)
+    counts = np.diff(np.append(starts, len(vectors)))
+    segment = np.repeat(np.arange(len(starts)), counts)
+
+    if method == "mean":
+        weights = None
+    elif method == "speaker":
+        weights = np.asarray(weights, dtype=np.float32)
+    else:
+        temperature = temperature or config.DIALOG_VECTOR_ATTENTION_TEMPERATURE
+        centroids = segment_sum(vectors, starts)
+        centroids /= np.maximum(np.linalg.norm(centroids, axis=1, keepdims=True), 1e-12)
+        scores = np.einsum("ij,ij->i", vectors, centroids[segment]) / temperature
+        # Устойчивый softmax внутри сегмента: вычитаем максимум сегмента
+        scores -= np.maximum.reduceat(scores, starts)[segment]
+        weights = np.exp(scores)
+
+    pooled = segment_sum(vectors if weights is None else vectors * weights[:, None], starts)
+    pooled /= np.maximum(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12)
+    return pooled
+
+
+def build_dialog_vectors(conn, method=None, dialog_ids=None, log=logger.info):
+    """Записывает векторы диалогов в embeddings; возвращает число записанных.
+
+    Args:
+        conn: Соединение с БД.
+        method: Метод пулинга (по умолчанию DIALOG_VECTOR_POOLING).
+        dialog_ids: Какие диалоги обработать (по умолчанию все).
+    """
+    method = method or config.DIALOG_VECTOR_POOLING
+    if method not in POOLING_METHODS:
+        raise ValueError(f"Неизвестный метод пулинга: {method} (допустимо: {', '.join(POOLING_METHODS)})")
+    cursor = conn.cursor()
+    if dialog_ids is None:
+        dialog_ids = [row[0] for row in cursor.execute("SELECT id FROM dialogs ORDER BY id")]
+    dimension = output_dimension()
+    speaker_weights = config.DIALOG_VECTOR_SPEAKER_WEIGHTS
+    log(f"🔄 Векторы диалогов ({method}) из векторов реплик: {len(dialog_ids)} диалогов")
+
+    written = skipped = 0
+    for chunk in chunked(list(dialog_ids), config.DIALOG_VECTOR_BATCH_DIALOGS):
+        placeholders = ",".join("?" * len(chunk))
+        rows = cursor.execute(f"""
+            SELECT u.dialog_id, u.speaker, ue.vector
+            FROM utterances u
+            JOIN utterance_embeddings ue ON ue.utterance_id = u.id
+            WHERE u.dialog_id IN ({placeholders})
+            ORDER BY u.dialog_id, u.turn_order
+        """, chunk).fetchall()
+        vectors, valid = decode_matrix([row[2] for row in rows], dimension, truncate=True)
+        rows = [row for row, ok in zip(rows, valid) if ok]
+        if not rows:
+            skipped += len(chunk)
+            continue
+
+        owners = [row[0] for row in rows]
+        starts = [i for i in range(len(owners)) if i == 0 or owners[i] != owners[i - 1]]
+        weights = [speaker_weights.get(speaker_role(row[1]), 1.0) for row in rows] if method == "speaker" else None
+        pooled = segment_pool(vectors, starts, method, weights)
+
+        cursor.executemany(
+            "INSERT OR REPLACE INTO embeddings (dialog_id, vector) VALUES (?, ?)",
+            [(owners[start], encode_vector(vector, config.EMBEDDING_STORAGE_DTYPE)) for start, vector in zip(starts, pooled)],
+        )
+        conn.commit()
+        written += len(starts)
+        skipped += len(chunk) - len(starts)
+
+    if skipped:
+        log(f"⚠️ Диалогов без векторов реплик: {skipped} — сначала создайте эмбеддинги реплик")
+    log(f"✅ Записано векторов диалогов: {written}")
+    return written
+
+
+def main():
+    from utils import get_db_connection
+
+    parser = argparse.ArgumentParser(description="Векторы диалогов из векторов реплик")
+    parser.add_argument("--method", choices=POOLING_METHODS, default=config.DIALOG_VECTOR_POOLING, help="Метод пулинга")
+    args = parser.parse_args()
+
+    conn = get_db_connection()
+    try:
+        build_dialog_vectors(conn, args.method, log=print)
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,140 @@
+"""Бэкенд модели эмбеддингов: PyTorch или ONNX Runtime (в том числе int8) на CPU.
+
+EMBEDDING_MODEL_BACKEND:
+    "torch"     — SentenceTransformer на PyTorch (GPU или CPU);
+    "onnx"      — модель экспортируется в ONNX и исполняется ONNX Runtime;
+    "onnx-int8" — то же с динамическим квантованием весов в int8.
+
+Экспорт выполняется один раз и сохраняется в EMBEDDING_ONNX_DIR/<модель>,
+следующие запуски загружают готовый .onnx. ONNX-бэкенды используются только
+на CPU: если выбрано устройство cuda и GPU доступен, остаётся PyTorch.
+Нужны sentence-transformers>=3.2 и optimum[onnxruntime]. Сходство с векторами
+PyTorch и скорость проверяет benchmark_onnx.py.
+"""
+
+import os
+import re
+import logging
+
+from sentence_transformers import SentenceTransformer
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+import config
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ("torch", "onnx", "onnx-int8")
+ONNX_FILE_NAME = "onnx/model.onnx"
+
+
+def resolve_backend(device, backend=None) -> str:
+    """Бэкенд, который реально будет использован на устройстве device."""
+    backend = backend or config.EMBEDDING_MODEL_BACKEND
+    if backend not in BACKENDS:
+        raise ValueError(f"Неизвестный бэкенд эмбеддингов: {backend} (допустимо: {', '.join(BACKENDS)})")
+    if backend != "torch" and getattr(device, "type", str(device)) == "cuda":
+        return "torch"
+    return backend
+
+
+def cache_model_name(device, model_name=None) -> str:
+    """Имя модели для кэша эмбеддингов.
+
+    Векторы int8-модели заметно отличаются от fp32, поэтому кэшируются
+    отдельно; ONNX fp32 совпадает с PyTorch и делит с ним кэш.
+    """
+    model_name = model_name or config.EMBEDDING_MODEL_NAME
+    if resolve_backend(device) == "onnx-int8":
+        return f"{model_name}|onnx-int8-{config.EMBEDDING_ONNX_QUANTIZATION}"
+    return model_name
+
+
+def onnx_export_dir(model_name):
+    return config.EMBEDDING_ONNX_DIR / re.sub(r"[^\w.-]+", "__", model_name)
+
+
+def quantized_file_name() -> str:
+    # Имя, под которым export_dynamic_quantized_onnx_model сохраняет модель
+    return f"onnx/model_qint8_{config.EMBEDDING_ONNX_QUANTIZATION}.onnx"
+
+
+def onnx_threads() -> int:
+    """Потоков ONNX Runtime: из конфига или по числу физических ядер."""
+    if config.EMBEDDING_ONNX_THREADS > 0:
+        return config.EMBEDDING_ONNX_THREADS
+    physical = psutil.cpu_count(logical=False) if psutil is not None else None
+    return physical or os.cpu_count() or 1
+
+
+def session_options(threads=None):
+    """Настройки сессии ONNX Runtime: один граф, все ядра внутри оператора."""
+    import onnxruntime as ort
+
+    options = ort.SessionOptions()
+    options.intra_op_num_threads = threads or onnx_threads()
+    # Батч — один последовательный граф, межоператорный параллелизм только мешает
+    options.inter_op_num_threads = 1
+    options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    return options
+
+
+def export_onnx(model_name, backend, log=logger.info):
+    """Экспортирует модель в ONNX (и int8), если это ещё не сделано.
+
+    Returns:
+        (папка модели, путь к .onnx внутри неё)
+    """
+    export_dir = onnx_export_dir(model_name)
+    if not (export_dir / ONNX_FILE_NAME).exists():
+        log(f"⏳ Экспорт {model_name} в ONNX: {export_dir} (выполняется один раз)...")
+        # Без готового .onnx sentence-transformers экспортирует модель сам
+        model = SentenceTransformer(model_name, backend="onnx", device="cpu")
+        model.save_pretrained(str(export_dir))
+    if backend == "onnx":
+        return export_dir, ONNX_FILE_NAME
+
+    file_name = quantized_file_name()
+    if not (export_dir / file_name).exists():
+        from sentence_transformers import export_dynamic_quantized_onnx_model
+
+        log(f"⏳ Квантование ONNX-модели в int8 ({config.EMBEDDING_ONNX_QUANTIZATION})...")
+        model = SentenceTransformer(str(export_dir), backend="onnx", device="cpu",
+                                    model_kwargs={"file_name": ONNX_FILE_NAME})
+        export_dynamic_quantized_onnx_model(model, config.EMBEDDING_ONNX_QUANTIZATION, str(export_dir))
+    return export_dir, file_name
+
+
+def load_sentence_transformer(model_name=None, device="cpu", backend=None, model_kwargs=None, log=logger.info, **kwargs):
+    """SentenceTransformer на выбранном бэкенде.
+
+    Args:
+        model_name: Модель (по умолчанию EMBEDDING_MODEL_NAME).
+        device: Устройство; для ONNX-бэкендов всегда CPU.
+        backend: Бэкенд (по умолчанию EMBEDDING_MODEL_BACKEND).
+        model_kwargs: Параметры загрузки для PyTorch (например, torch_dtype).
+        **kwargs: Прочие аргументы SentenceTransformer (cache_folder и т.п.).
+    """
+    model_name = model_name or config.EMBEDDING_MODEL_NAME
+    backend = resolve_backend(device, backend)
+    if backend == "torch":
+        return SentenceTransformer(model_name, device=str(device), model_kwargs=model_kwargs or {}, **kwargs)
+
+    export_dir, file_name = export_onnx(model_name, backend, log)
+    threads = onnx_threads()
+    model = SentenceTransformer(
+        str(export_dir),
+        backend="onnx",
+        device="cpu",
+        model_kwargs={
+            "file_name": file_name,
+            "provider": "CPUExecutionProvider",
+            "session_options": session_options(threads),
+        },
+    )
+    log(f"✅ ONNX Runtime: {file_name}, потоков {threads}")
+    return model
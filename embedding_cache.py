@@ -0,0 +1,143 @@
+"""Кэш эмбеддингов по содержимому текста.
+
+В расшифровках звонков много точных повторов ("Алло", "Да", "Спасибо, до
+свидания"). Вектор такой реплики считается один раз и хранится в SQLite под
+ключом (модель, хеш нормализованного текста); повторы внутри батча и между
+запусками берутся из кэша, а модель кодирует только новые тексты.
+"""
+
+import hashlib
+import unicodedata
+
+import numpy as np
+
+from vector_codec import encode_vector, read_header, HEADER_SIZE
+
+# Лимит параметров в одном запросе SQLite (999 в старых сборках)
+LOOKUP_CHUNK_SIZE = 500
+# Сколько недавно закодированных векторов держать в памяти при отложенной записи
+RECENT_LIMIT = 20000
+
+CREATE_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS embedding_cache (
+        model TEXT NOT NULL,
+        text_hash TEXT NOT NULL,
+        vector BLOB NOT NULL,
+        PRIMARY KEY (model, text_hash)
+    );
+"""
+
+
+def normalize_text(text: str) -> str:
+    """Нормализация для ключа кэша: NFC и схлопывание пробелов.
+
+    Регистр и пунктуация сохраняются — модель видит их и даёт разные векторы.
+    """
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha1(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+def model_key(model_name: str, normalized: bool = False) -> str:
+    """Ключ модели в кэше. Нормализованные и сырые векторы хранятся раздельно."""
+    return f"{model_name}|normalized" if normalized else model_name
+
+
+class EmbeddingCache:
+    """Кэш векторов одной модели поверх соединения SQLite.
+
+    Кэш не делает commit: записи попадают в БД вместе с транзакцией вызывающего
+    кода. При defer_writes=True новые записи не пишутся в conn, а копятся до
+    take_pending() (в pipeline их записывает поток db_writer вместе с батчем);
+    пока они не видны в БД, повторы находятся в памяти (recent).
+    """
+
+    def __init__(self, conn, model: str, defer_writes: bool = False):
+        self.conn = conn
+        self.model = model
+        self.defer_writes = defer_writes
+        self.pending = []
+        self.recent = {}
+        self.hits = 0
+        self.misses = 0
+        if not defer_writes:
+            conn.execute(CREATE_TABLE_SQL)
+
+    def get_many(self, hashes) -> dict:
+        """Возвращает {text_hash: вектор float32} для найденных в кэше хешей."""
+        found = {}
+        lookup = []
+        for key in hashes:
+            if key in self.recent:
+                found[key] = self.recent[key]
+            else:
+                lookup.append(key)
+        for i in range(0, len(lookup), LOOKUP_CHUNK_SIZE):
+            chunk = lookup[i:i + LOOKUP_CHUNK_SIZE]
+            placeholders = ",".join("?" * len(chunk))
+            rows = self.conn.execute(
+                f"SELECT text_hash, vector FROM embedding_cache WHERE model = ? AND text_hash IN ({placeholders})",
+                [self.model, *chunk]
+            ).fetchall()
+            for key, blob in rows:
+                header = read_header(blob)
+                if header is None:
+                    # Запись старого формата (до migrate_vectors.py) — считаем промахом
+                    continue
+                found[key] = np.frombuffer(blob, dtype=header[0], count=header[1], offset=HEADER_SIZE).astype(np.float32)
+        return found
+
+    def put_many(self, items):
+        """Сохраняет пары (text_hash, вектор)."""
+        rows = [(self.model, key, encode_vector(vector, "float32")) for key, vector in items]
+        if not self.defer_writes:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO embedding_cache (model, text_hash, vector) VALUES (?, ?, ?)",
+                rows
+            )
+            return
+        self.pending.extend(rows)
+        if len(self.recent) > RECENT_LIMIT:
+            self.recent.clear()
+        for key, vector in items:
+            self.recent[key] = np.asarray(vector, dtype=np.float32)
+
+    def take_pending(self):
+        """Строки (model, text_hash, vector) для записи, накопленные с прошлого вызова."""
+        rows, self.pending = self.pending, []
+        return rows
+
+    def encode(self, texts, encode_fn):
+        """Векторы для texts в исходном порядке; модель кодирует только промахи кэша.
+
+        Args:
+            texts: Тексты для кодирования (с повторами).
+            encode_fn: Функция list[str] -> последовательность векторов того же
+                порядка; может вернуть None при ошибке кодирования.
+
+        Returns:
+            Список векторов (по одному на текст) или None, если encode_fn вернула None.
+        """
+        hashes = [text_hash(text) for text in texts]
+        vectors = self.get_many(set(hashes))
+
+        # Каждый новый текст кодируется один раз, даже если повторяется в батче
+        missing = {}
+        for key, text in zip(hashes, texts):
+            if key not in vectors and key not in missing:
+                missing[key] = text
+        # hits — сколько текстов не пришлось кодировать, misses — сколько закодировано
+        self.hits += len(texts) - len(missing)
+        self.misses += len(missing)
+
+        if missing:
+            encoded = encode_fn(list(missing.values()))
+            if encoded is None:
+                return None
+            new_items = list(zip(missing.keys(), encoded))
+            self.put_many(new_items)
+            for key, vector in new_items:
+                vectors[key] = np.asarray(vector, dtype=np.float32)
+        return [vectors[key] for key in hashes]
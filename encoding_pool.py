@@ -0,0 +1,143 @@
+"""Пул процессов для кодирования эмбеддингов на CPU.
+
+Один вызов SentenceTransformer.encode на коротких репликах не загружает больше
+нескольких ядер. Пул запускает N процессов, каждый со своей копией модели,
+привязанный к своему подмножеству ядер и с ограниченным числом потоков
+(torch intra-op или потоки ONNX Runtime). Тексты сортируются по длине, режутся
+на порции, порции раздаются свободным процессам, результаты собираются в
+исходном порядке.
+
+Каждый процесс держит свою копию модели: при fp32 это ~2.5 ГБ RAM на процесс
+для Qwen3-Embedding-0.6B, при ONNX int8 — примерно вчетверо меньше.
+"""
+
+import os
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+import config
+
+logger = logging.getLogger(__name__)
+
+# Состояние рабочего процесса: модель и батчер загружаются один раз в инициализаторе
+_WORKER = {}
+
+
+def available_cores():
+    """Ядра, доступные текущему процессу."""
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def pin_to_cores(cores):
+    """Привязывает текущий процесс к ядрам; False, если ОС это не поддерживает."""
+    try:
+        if hasattr(os, "sched_setaffinity"):
+            os.sched_setaffinity(0, cores)
+            return True
+        if psutil is not None:  # Windows
+            psutil.Process().cpu_affinity(list(cores))
+            return True
+    except (OSError, ValueError, AttributeError):
+        pass
+    return False
+
+
+def _init_worker(counter, cores, threads, model_name, max_length, memory_fraction):
+    with counter.get_lock():
+        slot = counter.value
+        counter.value += 1
+    # Заменённый после сбоя процесс получает следующий слот — по кругу
+    start = (slot * threads) % len(cores)
+    pin_to_cores([cores[(start + i) % len(cores)] for i in range(threads)])
+
+    import torch
+    torch.set_num_threads(threads)
+    # Процесс получает свою копию config — число потоков ONNX Runtime задаётся здесь
+    config.EMBEDDING_ONNX_THREADS = threads
+
+    from embedding_backend import load_sentence_transformer
+    from adaptive_batcher import AdaptiveBatcher
+
+    model = load_sentence_transformer(model_name, device="cpu")
+    model.max_seq_length = max_length
+    _WORKER["model"] = model
+    # Свободная RAM общая на все процессы пула — каждому достаётся своя доля бюджета
+    _WORKER["batcher"] = AdaptiveBatcher("cpu", memory_fraction=memory_fraction)
+
+
+def _encode_chunk(texts, encode_kwargs):
+    from adaptive_batcher import encode_texts
+
+    vectors = encode_texts(_WORKER["model"], texts, _WORKER["batcher"], log=logger.debug, **encode_kwargs)
+    if vectors is None:
+        return None
+    # Один массив вместо списка тензоров — дешевле передавать между процессами
+    return np.asarray(vectors, dtype=np.float32)
+
+
+class EncodingPool:
+    """N процессов кодирования на CPU с привязкой к ядрам."""
+
+    def __init__(self, workers=None, threads_per_worker=None, chunk_size=None,
+                 model_name=None, max_length=None, log=logger.info):
+        cores = available_cores()
+        self.workers = workers or config.PIPELINE_ENCODE_WORKERS
+        self.threads = threads_per_worker or config.PIPELINE_ENCODE_THREADS_PER_WORKER or max(1, len(cores) // self.workers)
+        self.chunk_size = chunk_size or config.PIPELINE_ENCODE_CHUNK_SIZE
+        model_name = model_name or config.EMBEDDING_MODEL_NAME
+        max_length = max_length or config.EMBEDDING_MODEL_MAX_LENGTH
+
+        from embedding_backend import resolve_backend, export_onnx
+        backend = resolve_backend("cpu")
+        if backend != "torch":
+            # Экспорт в ONNX — один раз здесь, а не одновременно в каждом процессе
+            export_onnx(model_name, backend, log)
+
+        # spawn: CUDA/OpenMP-состояние родителя не наследуется
+        context = multiprocessing.get_context("spawn")
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=context,
+            initializer=_init_worker,
+            initargs=(context.Value("i", 0), cores, self.threads, model_name, max_length,
+                      config.PIPELINE_ENCODE_MEMORY_FRACTION / self.workers),
+        )
+        log(f"⚙️ Пул кодирования: {self.workers} процессов × {self.threads} потоков, порции по {self.chunk_size} текстов ({backend})")
+
+    def encode(self, texts, **encode_kwargs):
+        """Векторы для texts в исходном порядке или None, если порцию не удалось закодировать.
+
+        encode_kwargs передаются в model.encode (например, normalize_embeddings).
+        """
+        if not texts:
+            return []
+        encode_kwargs.setdefault("convert_to_tensor", False)
+        # Порции из текстов близкой длины; не меньше двух порций на процесс
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]), reverse=True)
+        size = max(1, min(self.chunk_size, -(-len(texts) // (self.workers * 2))))
+        chunks = [order[i:i + size] for i in range(0, len(order), size)]
+        results = self.executor.map(
+            _encode_chunk,
+            [[texts[i] for i in chunk] for chunk in chunks],
+            [encode_kwargs] * len(chunks),
+        )
+        embeddings = [None] * len(texts)
+        for chunk, vectors in zip(chunks, results):
+            if vectors is None:
+                return None
+            for i, vector in zip(chunk, vectors):
+                embeddings[i] = vector
+        return embeddings
+
+    def close(self):
+        self.executor.shutdown(cancel_futures=True)
@@ -27,6 +27,11 @@ logger = setup_logger('GUI', config.LOGS_ROOT / "gui.log")
 
 # === Импорт моделей ===
 from sentence_transformers import SentenceTransformer
+from embedding_backend import load_sentence_transformer
+from matryoshka import truncate_embeddings
+from dialog_metadata import filter_sql
+from index_types import selector_parameters
+from index_manager import IndexManager
 try:
     from sentence_transformers import CrossEncoder
     RERANKER_AVAILABLE = True
@@ -38,11 +43,12 @@ except Exception as e:
 
 # === Глобальные переменные ===
 MODEL = None
-INDEXES = {}        # {theme: faiss_index}
-IDS = {}            # {theme: [utterance_id1, ...]}
-DATA_LOOKUPS = {}   # {utterance_id: {text, speaker, dialog_id, turn_order, full_dialog_text}}
+INDEXES = IndexManager(log=logger)  # индексы тем: загружаются при первом поиске, выгружаются по LRU
+DATA_LOOKUPS = {}   # {utterances.rowid (метка в индексе): {id, text, speaker, dialog_id, turn_order, full_dialog_text}}
+LOOKUPS_MAX_ROWID = 0  # наибольший rowid реплики в DATA_LOOKUPS — с него догружаются новые
 CHAT_DB_CONN = None
 CURRENT_THEME = "all"
+LOADED_INDEXES_AT = None  # MAX(built_at) из faiss_indexes на момент загрузки индексов
 
 # === Инициализация БД для чата и QA ===
 def init_chat_db():
@@ -73,7 +79,8 @@ def load_models():
             logger.warning(f"⚠️ Ошибка проверки CUDA: {e}, используем CPU")
     
     try:
-        MODEL = SentenceTransformer(config.EMBEDDING_MODEL_NAME, device=device)
+        # Тот же бэкенд, что у pipeline: запрос и реплики кодируются одинаково
+        MODEL = load_sentence_transformer(config.EMBEDDING_MODEL_NAME, device=device)
         MODEL.max_seq_length = config.EMBEDDING_MODEL_MAX_LENGTH
         logger.info(f"✅ Модель загружена на устройстве: {device}")
     except Exception as e:
@@ -88,41 +95,41 @@ def load_models():
             raise e2
 
 def load_faiss_indexes():
-    global INDEXES, IDS
-    logger.info("Загрузка FAISS-индексов...")
-    INDEXES = {}
-    IDS = {}
+    """Перечитывает список индексов из faiss_indexes; сами индексы открываются при первом поиске."""
+    global LOADED_INDEXES_AT
     conn = sqlite3.connect(config.DATABASE_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT theme, index_path, ids_path FROM faiss_indexes")
-    rows = cursor.fetchall()
-    conn.close()
-    
-    for theme, index_path, ids_path in rows:
-        if Path(index_path).exists() and Path(ids_path).exists():
-            try:
-                INDEXES[theme] = faiss.read_index(index_path)
-                with open(ids_path, 'r', encoding='utf-8') as f:
-                    IDS[theme] = json.load(f)
-                logger.info(f"✅ Загружен индекс: {theme} ({len(IDS[theme])} реплик)")
-            except Exception as e:
-                logger.error(f"❌ Ошибка загрузки индекса {theme}: {e}")
+    try:
+        indexer.ensure_index_columns(conn)
+        INDEXES.refresh(conn)
+    finally:
+        conn.close()
+    LOADED_INDEXES_AT = INDEXES.built_at
+    logger.info(f"✅ Доступно FAISS-индексов: {len(INDEXES)} (бюджет памяти {config.GUI_INDEX_MEMORY_MB or '∞'} МБ)")
+
+def indexes_built_at():
+    """Время последнего обновления индексов (indexer.py или ingest_daemon.py)."""
+    conn = sqlite3.connect(config.DATABASE_PATH)
+    try:
+        return conn.execute("SELECT MAX(built_at) FROM faiss_indexes").fetchone()[0]
+    finally:
+        conn.close()
 
 def load_data_lookups():
-    global DATA_LOOKUPS
+    global DATA_LOOKUPS, LOOKUPS_MAX_ROWID
     logger.info("Загрузка данных реплик и диалогов...")
     DATA_LOOKUPS = {}
     conn = sqlite3.connect(config.DATABASE_PATH)
     cursor = conn.cursor()
     
-    cursor.execute("SELECT id, dialog_id, speaker, text, turn_order FROM utterances")
+    cursor.execute("SELECT rowid, id, dialog_id, speaker, text, turn_order FROM utterances")
     utterances = cursor.fetchall()
     
     cursor.execute("SELECT id, text FROM dialogs")
     dialog_texts = {row[0]: row[1] for row in cursor.fetchall()}
     
-    for utterance_id, dialog_id, speaker, text, turn_order in utterances:
-        DATA_LOOKUPS[utterance_id] = {
+    for rowid, utterance_id, dialog_id, speaker, text, turn_order in utterances:
+        DATA_LOOKUPS[rowid] = {
+            "id": utterance_id,
             "text": text,
             "speaker": speaker,
             "dialog_id": dialog_id,
@@ -130,9 +137,35 @@ def load_data_lookups():
             "full_dialog_text": dialog_texts.get(dialog_id, "")
         }
     
+    LOOKUPS_MAX_ROWID = max(DATA_LOOKUPS, default=0)
     conn.close()
     logger.info(f"✅ Загружено {len(DATA_LOOKUPS)} реплик.")
 
+def load_new_lookups():
+    """Догружает в DATA_LOOKUPS реплики, добавленные в БД после загрузки (rowid растут)."""
+    global LOOKUPS_MAX_ROWID
+    conn = sqlite3.connect(config.DATABASE_PATH)
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT u.rowid, u.id, u.dialog_id, u.speaker, u.text, u.turn_order, d.text
+        FROM utterances u JOIN dialogs d ON u.dialog_id = d.id
+        WHERE u.rowid > ?
+    """, (LOOKUPS_MAX_ROWID,))
+    rows = cursor.fetchall()
+    conn.close()
+    for rowid, utterance_id, dialog_id, speaker, text, turn_order, dialog_text in rows:
+        DATA_LOOKUPS[rowid] = {
+            "id": utterance_id,
+            "text": text,
+            "speaker": speaker,
+            "dialog_id": dialog_id,
+            "turn_order": turn_order,
+            "full_dialog_text": dialog_text or ""
+        }
+    LOOKUPS_MAX_ROWID = max(LOOKUPS_MAX_ROWID, max((row[0] for row in rows), default=0))
+    logger.info(f"✅ Догружено {len(rows)} новых реплик.")
+    return len(rows)
+
 
 # === Утилиты UI ===
 def set_ui_busy(is_busy: bool):
@@ -170,11 +203,11 @@ def run_indexer_background():
             status_label.config(text="🔧 Построение FAISS индексов...")
             root.update_idletasks()
             init_db.init_db()
-            indexer.main()
+            indexer.main([])
             status_label.config(text="✅ Индексация завершена. Перезагружаю индексы...")
             load_faiss_indexes()
             load_data_lookups()
-            themes_for_combo = ["all"] + [t for t in INDEXES.keys() if t != "all"]
+            themes_for_combo = ["all"] + [t for t in INDEXES.themes() if t != "all"]
             theme_menu['values'] = themes_for_combo
             if themes_for_combo:
                 theme_var.set(themes_for_combo[0])
@@ -194,7 +227,7 @@ def reload_indexes_and_data():
         root.update_idletasks()
         load_faiss_indexes()
         load_data_lookups()
-        themes_for_combo = ["all"] + [t for t in INDEXES.keys() if t != "all"]
+        themes_for_combo = ["all"] + [t for t in INDEXES.themes() if t != "all"]
         theme_menu['values'] = themes_for_combo
         if themes_for_combo:
             theme_var.set(themes_for_combo[0])
@@ -205,6 +238,32 @@ def reload_indexes_and_data():
     finally:
         set_ui_busy(False)
 
+def check_index_updates():
+    """Периодически перечитывает индексы, если их обновили indexer.py или ingest_daemon.py."""
+    def schedule():
+        root.after(int(config.GUI_INDEX_RELOAD_SECONDS * 1000), check_index_updates)
+
+    def worker():
+        try:
+            load_faiss_indexes()
+            added = load_new_lookups()
+            theme_menu['values'] = ["all"] + [t for t in INDEXES.themes() if t != "all"]
+            status_label.config(text=f"🔄 Индексы обновлены, новых реплик: {added}.")
+        except Exception as e:
+            logger.error(f"Ошибка обновления индексов: {e}")
+        finally:
+            schedule()
+
+    try:
+        changed = indexes_built_at() != LOADED_INDEXES_AT
+    except Exception as e:
+        logger.warning(f"Не удалось проверить обновление индексов: {e}")
+        changed = False
+    if changed:
+        threading.Thread(target=worker, daemon=True).start()
+    else:
+        schedule()
+
 # === HyDE ===
 def generate_hypothetical_answer(query):
     try:
@@ -248,31 +307,70 @@ def rerank_results(query, candidates):
     return candidates
 
 # === Поиск по репликам ===
-def find_similar_utterances(query, theme="all", top_k=5):
-    if theme not in INDEXES:
+def filtered_labels(filters):
+    """Метки (utterances.rowid) реплик диалогов, прошедших фильтры (SQL по индексам dialogs)."""
+    where, params = filter_sql(filters)
+    cursor = CHAT_DB_CONN.cursor()
+    cursor.execute(f"""
+        SELECT u.rowid FROM dialogs d JOIN utterances u ON u.dialog_id = d.id
+        WHERE {where}
+    """, params)
+    return np.fromiter((row[0] for row in cursor), dtype=np.int64)
+
+def find_similar_utterances(query, theme="all", top_k=5, filters=None):
+    """Ближайшие реплики; filters — фильтры по метаданным диалога (dialog_metadata.FILTERS)."""
+    try:
+        index = INDEXES.get(theme)
+    except Exception as e:
+        logger.error(f"❌ Ошибка загрузки индекса {theme}: {e}")
+        return []
+    if index is None:
         logger.error(f"Индекс для темы '{theme}' не загружен.")
         return []
     
     # ✅ Просто кодируем запрос — без HyDE
     query_vector = MODEL.encode([query], convert_to_tensor=False)[0].astype('float32')
     
-    index = INDEXES[theme]
-    ids_list = IDS[theme]
-    distances, indices = index.search(np.array([query_vector]), top_k)
+    # Индекс может быть построен по усечённым векторам (Matryoshka)
+    query_vector = truncate_embeddings(query_vector, index.d)
+    search_params = None
+    if filters and any(filters.values()):
+        # Поиск только среди реплик, отобранных SQL-фильтром
+        allowed = filtered_labels(filters)
+        if not len(allowed):
+            return []
+        search_params = selector_parameters(index, faiss.IDSelectorBatch(allowed))
+    distances, indices = index.search(np.array([query_vector]), top_k, params=search_params)
     
     candidates = []
-    for i, idx in enumerate(indices[0]):
-        if idx >= len(ids_list): continue
-        utterance_id = ids_list[idx]
-        if utterance_id not in DATA_LOOKUPS: continue
-        item = DATA_LOOKUPS[utterance_id].copy()
-        item["id"] = utterance_id
+    for i, label in enumerate(indices[0].tolist()):
+        if label not in DATA_LOOKUPS: continue  # -1 — недобор результатов
+        item = DATA_LOOKUPS[label].copy()
         item["faiss_score"] = float(distances[0][i])
         candidates.append(item)
     
     # ✅ Без reranker
     return candidates
 
+# === Статистика индексов ===
+def show_index_stats():
+    """Загруженные индексы, память под них и счётчики менеджера — на вкладке «Статистика»."""
+    status = INDEXES.status()
+    budget = f"{status['budget_mb']} МБ" if status['budget_mb'] else "без ограничения"
+    lines = [
+        f"🗂️ Индексов FAISS: {status['available']}, в памяти: {len(status['resident'])}",
+        f"💾 Память под индексы: {status['used_mb']} МБ из {budget}",
+        f"📊 Поисков по загруженным: {status['hits']}, загрузок: {status['loads']}, выгружено: {status['evictions']}",
+        "",
+        "В памяти (от недавних к давним):",
+    ]
+    for item in status['resident']:
+        lines.append(f"  📁 {item['theme']}: {item['vectors']} реплик, {item['size_mb']} МБ{' (mmap)' if item['mmap'] else ''}")
+    if not status['resident']:
+        lines.append("  — индексы загружаются при первом поиске по теме")
+    text_stats.delete(1.0, tk.END)
+    text_stats.insert(tk.END, "\n".join(lines))
+
 # === Форматирование контекста с соседними репликами ===
 def format_context_for_llm(results):
     context_parts = []
@@ -331,6 +429,11 @@ def run_ask():
     top_k = int(top_k_var.get())
     chunk_size = int(chunk_size_var.get())
     selected_method_name = method_var.get()
+    filters = {
+        "operator_login": operator_var.get().strip(),
+        "date_from": date_from_var.get().strip(),
+        "date_to": date_to_var.get().strip(),
+    }
 
     ask_btn.config(state=tk.DISABLED, text="Ищу...")
     status_label.config(text=f"🔍 Поиск релевантных реплик (тема: {theme})...")
@@ -342,7 +445,7 @@ def run_ask():
 
     def worker():
         try:
-            results = find_similar_utterances(question, theme=theme, top_k=top_k)
+            results = find_similar_utterances(question, theme=theme, top_k=top_k, filters=filters)
             if not results:
                 answer_text = "Извините, не удалось найти релевантные фрагменты."
                 context_text = "Нет найденных реплик."
@@ -453,7 +556,8 @@ def process_user_message(user_message):
 def create_gui():
     global root, status_label, ask_btn, btn_send, entry, text_answer, text_context
     global top_k_var, chunk_size_var, method_var, theme_var, entry_chat, chat_history, theme_menu
-    global export_answer_btn, export_context_btn
+    global operator_var, date_from_var, date_to_var
+    global export_answer_btn, export_context_btn, text_stats
 
     root = tk.Tk()
     root.title("CallCenter AI Анализатор v3 (реплики + HyDE + Reranker)")
@@ -495,6 +599,17 @@ def create_gui():
     theme_menu = ttk.Combobox(settings_frame, textvariable=theme_var, values=["Загрузка..."], state="readonly", width=15)
     theme_menu.pack(side=tk.LEFT, padx=2)
 
+    # Фильтры по метаданным диалога: оператор и период звонка (ГГГГ-ММ-ДД, "по" — не включительно)
+    tk.Label(settings_frame, text="Оператор:", bg=dark_frame_bg, fg=dark_fg).pack(side=tk.LEFT)
+    operator_var = tk.StringVar()
+    tk.Entry(settings_frame, textvariable=operator_var, width=12, bg=dark_entry_bg, fg=dark_fg, insertbackground=dark_fg).pack(side=tk.LEFT, padx=2)
+    tk.Label(settings_frame, text="с", bg=dark_frame_bg, fg=dark_fg).pack(side=tk.LEFT)
+    date_from_var = tk.StringVar()
+    tk.Entry(settings_frame, textvariable=date_from_var, width=10, bg=dark_entry_bg, fg=dark_fg, insertbackground=dark_fg).pack(side=tk.LEFT, padx=2)
+    tk.Label(settings_frame, text="по", bg=dark_frame_bg, fg=dark_fg).pack(side=tk.LEFT)
+    date_to_var = tk.StringVar()
+    tk.Entry(settings_frame, textvariable=date_to_var, width=10, bg=dark_entry_bg, fg=dark_fg, insertbackground=dark_fg).pack(side=tk.LEFT, padx=2)
+
     tk.Label(settings_frame, text="Метод:", bg=dark_frame_bg, fg=dark_fg).pack(side=tk.LEFT)
     method_var = tk.StringVar(value=config.GUI_DEFAULT_METHOD)
     method_menu = ttk.Combobox(settings_frame, textvariable=method_var, values=config.ANALYSIS_METHODS, state="readonly", width=12)
@@ -563,6 +678,13 @@ def create_gui():
     btn_send = tk.Button(input_frame, text="Отправить", command=on_send_click, state=tk.DISABLED, bg=dark_button_bg, fg=dark_fg)
     btn_send.pack(side=tk.RIGHT)
 
+    tab_stats = ttk.Frame(notebook)
+    notebook.add(tab_stats, text='Статистика')
+    tk.Button(tab_stats, text="Обновить", command=show_index_stats, bg=dark_button_bg, fg=dark_fg).pack(anchor=tk.W, padx=5, pady=5)
+    text_stats = scrolledtext.ScrolledText(tab_stats, wrap=tk.WORD, font=('Arial', 10), bg=dark_entry_bg, fg=dark_fg, insertbackground=dark_fg)
+    text_stats.pack(padx=5, pady=5, fill=tk.BOTH, expand=True)
+    notebook.bind("<<NotebookTabChanged>>", lambda event: show_index_stats() if notebook.select() == str(tab_stats) else None)
+
     # Загрузка
     def delayed_init():
         init_chat_db()
@@ -570,7 +692,7 @@ def create_gui():
         load_models()
         load_faiss_indexes()
         load_data_lookups()
-        themes_for_combo = ["all"] + [t for t in INDEXES.keys() if t != "all"]
+        themes_for_combo = ["all"] + [t for t in INDEXES.themes() if t != "all"]
         theme_menu['values'] = themes_for_combo
         if themes_for_combo:
             theme_var.set(themes_for_combo[0])
@@ -582,6 +704,8 @@ def create_gui():
         if not INDEXES:
             if messagebox.askyesno("Индексы не найдены", "Не найдены индексы FAISS. Построить сейчас?"):
                 run_indexer_background()
+        if config.GUI_INDEX_RELOAD_SECONDS > 0:
+            check_index_updates()
 
     root.after(100, delayed_init)
     root.mainloop()
@@ -593,18 +593,6 @@ class CallCenterGUI:
                 conn = get_db_connection()
                 cursor = conn.cursor()
                 
-                # Получаем список диалогов для обработки
-                cursor.execute("SELECT id FROM dialogs")
-                dialog_ids = [row[0] for row in cursor.fetchall()]
-                
-                self.log_message(f"📊 Найдено {len(dialog_ids)} диалогов для обработки")
-                
-                # Обрабатываем диалоги батчами
-                embeddings = processor.process_dialogs_batch(dialog_ids, conn)
-                
-                # Сохраняем эмбеддинги в БД
-                processor.save_embeddings_to_db(embeddings, "embeddings", conn)
-                
                 # Обрабатываем реплики
                 cursor.execute("SELECT id FROM utterances")
                 utterance_ids = [row[0] for row in cursor.fetchall()]
@@ -617,6 +605,10 @@ class CallCenterGUI:
                 # Сохраняем эмбеддинги реплик в БД
                 processor.save_embeddings_to_db(utterance_embeddings, "utterance_embeddings", conn)
                 
+                # Векторы диалогов — пулинг векторов реплик, без повторного кодирования диалогов
+                from dialog_vectors import build_dialog_vectors
+                build_dialog_vectors(conn, log=self.log_message)
+                
                 conn.close()
                 
                 self.log_message("✅ Эмбеддинги созданы успешно")
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""Ленивая загрузка FAISS-индексов тем с бюджетом памяти (LRU).
+
+GUI не открывает все индексы при старте: индекс темы читается при первом
+поиске по ней, а индексы, к которым дольше всего не обращались, выгружаются,
+когда сумма их размеров превышает GUI_INDEX_MEMORY_MB. Аналитик обычно
+работает с двумя-тремя темами, а индекс "all" повторяет векторы всех тем —
+держать в памяти всё сразу незачем.
+
+Размер индекса оценивается по размеру его файла: прочитанный в память
+индекс занимает примерно столько же, а отображённый (FAISS_MMAP) при
+поиске подтягивает свои страницы в страничный кэш — это верхняя оценка.
+Последний запрошенный индекс остаётся в памяти, даже если один не
+укладывается в бюджет.
+
+Каталог (пути, типы, параметры поиска) перечитывается из faiss_indexes
+методом refresh; загруженный индекс, чей файл или параметры поиска
+сменились, выгружается и при следующем запросе читается заново.
+"""
+
+import logging
+import threading
+from collections import OrderedDict, namedtuple
+from pathlib import Path
+
+import config
+from index_types import read_index, apply_search_parameters
+
+logger = logging.getLogger(__name__)
+
+# Запись каталога: всё, что нужно, чтобы открыть индекс темы
+IndexEntry = namedtuple("IndexEntry", "index_path index_type search_params built_at size")
+
+
+class IndexManager:
+    """Индексы тем, загружаемые по требованию и вытесняемые по LRU.
+
+    Безопасен для вызова из нескольких потоков: загрузка и вытеснение идут
+    под блокировкой, а поиск — по объекту индекса, который get() вернул
+    вызывающему; вытеснение лишь убирает индекс из менеджера.
+    """
+
+    def __init__(self, memory_mb=None, log=None):
+        self.memory_mb = config.GUI_INDEX_MEMORY_MB if memory_mb is None else memory_mb
+        self.log = log or logger
+        self.catalog = {}
+        self.resident = OrderedDict()  # {theme: (IndexEntry, index, отображён ли в память)}, от давних к свежим
+        self.built_at = None
+        self.hits = 0
+        self.loads = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    @property
+    def budget(self) -> int:
+        """Бюджет памяти в байтах (0 — без ограничения)."""
+        return int(self.memory_mb * 1024 ** 2)
+
+    def refresh(self, conn):
+        """Перечитывает каталог из faiss_indexes; индексы не открываются."""
+        rows = conn.execute(
+            "SELECT theme, index_path, built_at, search_params, indexed_rowid, index_type FROM faiss_indexes"
+        ).fetchall()
+        catalog = {}
+        for theme, index_path, built_at, search_params, indexed_rowid, index_type in rows:
+            if indexed_rowid is None:
+                # Результаты такого индекса — позиции, а не rowid реплик
+                self.log.warning(f"⚠️ Индекс {theme} старого формата, перестройте индексы: python indexer.py")
+                continue
+            path = Path(index_path)
+            if not path.exists():
+                self.log.warning(f"⚠️ Файл индекса {theme} не найден: {index_path}")
+                continue
+            catalog[theme] = IndexEntry(index_path, index_type, search_params, built_at, path.stat().st_size)
+
+        with self.lock:
+            self.catalog = catalog
+            self.built_at = max((row[2] for row in rows), default=None)
+            for theme, (entry, _, _) in list(self.resident.items()):
+                current = catalog.get(theme)
+                # Каждое сохранение индекса пишет новый файл, так что смена пути — признак обновления
+                if current is None or (current.index_path, current.search_params) != (entry.index_path, entry.search_params):
+                    del self.resident[theme]
+                    self.log.info(f"🔄 Индекс {theme} обновлён, будет перечитан при следующем поиске")
+
+    def themes(self) -> list:
+        """Темы с индексами: "all" первой, остальные по алфавиту."""
+        themes = sorted(self.catalog)
+        if "all" in self.catalog:
+            themes.remove("all")
+            themes.insert(0, "all")
+        return themes
+
+    def __contains__(self, theme) -> bool:
+        return theme in self.catalog
+
+    def __len__(self) -> int:
+        return len(self.catalog)
+
+    def get(self, theme):
+        """Индекс темы (загружается при первом обращении) или None, если его нет."""
+        with self.lock:
+            if theme in self.resident:
+                self.resident.move_to_end(theme)
+                self.hits += 1
+                return self.resident[theme][1]
+            entry = self.catalog.get(theme)
+            if entry is None:
+                return None
+            # С FAISS_MMAP векторы не копируются в память процесса, а читаются из страничного кэша
+            index, mapped = read_index(entry.index_path, entry.index_type)
+            # nprobe / efSearch, заданные при построении (или исправленные в БД)
+            apply_search_parameters(index, entry.search_params)
+            self.resident[theme] = (entry, index, mapped)
+            self.loads += 1
+            self.log.info(f"✅ Загружен индекс: {theme} ({index.ntotal} реплик, {entry.size / 1024 ** 2:.1f} МБ{', mmap' if mapped else ''})")
+            self._evict()
+            return index
+
+    def _evict(self):
+        """Выгружает давно не использованные индексы, пока не уложимся в бюджет."""
+        if not self.budget:
+            return
+        while len(self.resident) > 1 and self.used_bytes() > self.budget:
+            theme, _ = self.resident.popitem(last=False)
+            self.evictions += 1
+            self.log.info(f"📤 Индекс {theme} выгружен (бюджет {self.memory_mb} МБ)")
+
+    def used_bytes(self) -> int:
+        return sum(entry.size for entry, _, _ in self.resident.values())
+
+    def status(self) -> dict:
+        """Состояние для вкладки статистики."""
+        with self.lock:
+            return {
+                "budget_mb": self.memory_mb,
+                "used_mb": round(self.used_bytes() / 1024 ** 2, 1),
+                "resident": [
+                    {"theme": theme, "vectors": index.ntotal, "size_mb": round(entry.size / 1024 ** 2, 1), "mmap": mapped}
+                    for theme, (entry, index, mapped) in reversed(self.resident.items())
+                ],
+                "available": len(self.catalog),
+                "hits": self.hits,
+                "loads": self.loads,
+                "evictions": self.evictions,
+            }
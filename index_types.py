@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+"""Типы FAISS-индексов реплик и параметры поиска по ним.
+
+FAISS_INDEX_TYPE выбирает структуру индекса (все — по скалярному
+произведению нормализованных векторов, т.е. по косинусу):
+
+    "IndexFlatIP"     — точный перебор;
+    "IndexIVFFlat"    — FAISS_NLIST кластеров (0 — ~4·√N), поиск по FAISS_NPROBE ближайшим;
+    "IndexIVFPQ"      — то же, векторы сжаты PQ до FAISS_PQ_M байт (при 8 битах);
+    "OPQ+IndexIVFPQ"  — IVF-PQ с обученным поворотом OPQ (точнее PQ при том же размере);
+    "IndexHNSWFlat"   — граф HNSW (FAISS_M связей), поиск с FAISS_EF_SEARCH.
+
+Индексы меньше FAISS_FLAT_MAX_VECTORS строятся точными: перебор такого
+числа векторов и так занимает миллисекунды. IVF и OPQ обучаются на
+случайной выборке из FAISS_TRAIN_SAMPLE векторов.
+
+Параметры поиска (nprobe, efSearch) сохраняются в faiss_indexes.search_params
+(JSON) и применяются GUI при загрузке индекса; их можно менять в БД без
+перестройки индекса.
+
+GUI открывает индексы через read_index: при FAISS_MMAP файл индекса
+отображается в память только для чтения, и процессы GUI на одном сервере
+делят одну копию векторов в страничном кэше ОС.
+
+Векторы добавляются с метками — rowid реплик (utterances.rowid), а не по
+порядку: IVF хранит метки в списках сам, Flat и HNSW оборачиваются в
+IndexIDMap2. Поэтому индекс можно дописывать и удалять из него реплики
+(кроме HNSW, который удаления не поддерживает).
+"""
+
+import json
+
+import faiss
+import numpy as np
+
+import config
+
+INDEX_TYPES = ("IndexFlatIP", "IndexIVFFlat", "IndexIVFPQ", "OPQ+IndexIVFPQ", "IndexHNSWFlat")
+
+# Минимум обучающих точек на кластер IVF, ниже которого FAISS предупреждает о плохих центроидах
+MIN_POINTS_PER_CENTROID = 39
+
+# Строк матрицы, копируемых за раз при построении индекса по выборке строк (rows)
+ADD_CHUNK_ROWS = 65536
+
+
+def index_spec(count, dimension, index_type=None) -> str:
+    """Строка faiss.index_factory для индекса из count векторов размерности dimension."""
+    index_type = index_type or config.FAISS_INDEX_TYPE
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Неизвестный FAISS_INDEX_TYPE: {index_type} (допустимо: {', '.join(INDEX_TYPES)})")
+    if index_type == "IndexFlatIP" or count < config.FAISS_FLAT_MAX_VECTORS:
+        return "Flat"
+    if index_type == "IndexHNSWFlat":
+        return f"HNSW{config.FAISS_M},Flat"
+
+    # По умолчанию ~4·√N кластеров; не больше, чем позволяет выборка для обучения
+    nlist = config.FAISS_NLIST or int(4 * np.sqrt(count))
+    nlist = max(1, min(nlist, min(count, config.FAISS_TRAIN_SAMPLE) // MIN_POINTS_PER_CENTROID))
+    if index_type == "IndexIVFFlat":
+        return f"IVF{nlist},Flat"
+    m, nbits = config.FAISS_PQ_M, config.FAISS_PQ_NBITS
+    if dimension % m:
+        raise ValueError(f"FAISS_PQ_M={m} должно делить размерность векторов {dimension}")
+    spec = f"IVF{nlist},PQ{m}x{nbits}"
+    return spec if index_type == "IndexIVFPQ" else f"OPQ{m},{spec}"
+
+
+def training_sample(matrix, size, seed=0):
+    """Равномерная выборка size строк без повторов (порядок строк сохраняется)."""
+    if len(matrix) <= size:
+        return matrix
+    rows = np.sort(np.random.default_rng(seed).choice(len(matrix), size, replace=False))
+    return matrix[rows]
+
+
+def _ivf(index):
+    try:
+        return faiss.extract_index_ivf(index)
+    except Exception:  # не IVF
+        return None
+
+
+def _base(index):
+    """Индекс под обёрткой IndexIDMap/IndexIDMap2 (или сам индекс)."""
+    index = faiss.downcast_index(index)
+    if isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        return faiss.downcast_index(index.index)
+    return index
+
+
+def _hnsw(index):
+    index = _base(index)
+    return index if isinstance(index, faiss.IndexHNSW) else None
+
+
+def create_index(matrix, index_type=None, labels=None, rows=None):
+    """Строит индекс FAISS_INDEX_TYPE по нормализованной матрице (обучение + добавление).
+
+    labels — int64-метки строк (rowid реплик); без них результаты поиска —
+    номера строк матрицы. rows — номера строк matrix, из которых строится
+    индекс (labels тогда соответствуют rows): выборка не копируется целиком,
+    а добавляется порциями по ADD_CHUNK_ROWS строк.
+    """
+    count = len(matrix) if rows is None else len(rows)
+    dimension = matrix.shape[1]
+    spec = index_spec(count, dimension, index_type)
+    if spec == "Flat":
+        index = faiss.IndexFlatIP(dimension)
+    else:
+        index = faiss.index_factory(dimension, spec, faiss.METRIC_INNER_PRODUCT)
+    hnsw = _hnsw(index)
+    if hnsw is not None:
+        hnsw.hnsw.efConstruction = config.FAISS_EF_CONSTRUCTION
+    if not index.is_trained:
+        if rows is None:
+            index.train(training_sample(matrix, config.FAISS_TRAIN_SAMPLE))
+        else:
+            index.train(matrix[training_sample(rows, config.FAISS_TRAIN_SAMPLE)])
+    if labels is not None:
+        labels = np.asarray(labels, dtype=np.int64)
+        if _ivf(index) is None:
+            index = faiss.IndexIDMap2(index)
+    if rows is None:
+        chunks = ((matrix, labels),)
+    else:
+        chunks = (
+            (matrix[rows[start:start + ADD_CHUNK_ROWS]], None if labels is None else labels[start:start + ADD_CHUNK_ROWS])
+            for start in range(0, count, ADD_CHUNK_ROWS)
+        )
+    for part, part_labels in chunks:
+        if part_labels is None:
+            index.add(part)
+        else:
+            index.add_with_ids(part, part_labels)
+
+    ivf = _ivf(index)
+    if ivf is not None:
+        apply_search_parameters(index, {"nprobe": min(config.FAISS_NPROBE, ivf.nlist)})
+    elif hnsw is not None:
+        apply_search_parameters(index, {"efSearch": config.FAISS_EF_SEARCH})
+    return index
+
+
+def read_index(path, index_type=None, mmap=None):
+    """Читает индекс с диска; с mmap (по умолчанию FAISS_MMAP) — отображением файла в память.
+
+    IVF отображает инвертированные списки (IO_FLAG_MMAP), Flat и HNSW —
+    массив векторов (IO_FLAG_MMAP_IFC); флаги выбираются по index_type из
+    faiss_indexes. Отображённый индекс только для чтения: дописывание в него
+    аварийно завершает процесс. Если тип не поддерживает отображение (или
+    неизвестен), индекс читается в память целиком.
+
+    Returns:
+        (index, отображён ли файл в память).
+    """
+    mmap = config.FAISS_MMAP if mmap is None else mmap
+    if mmap and index_type in INDEX_TYPES:
+        flags = faiss.IO_FLAG_MMAP if "IVF" in index_type else faiss.IO_FLAG_MMAP_IFC
+        try:
+            return faiss.read_index(str(path), flags | faiss.IO_FLAG_READ_ONLY), True
+        except RuntimeError:  # сборка FAISS без поддержки отображения для этого типа
+            pass
+    return faiss.read_index(str(path)), False
+
+
+def describe(index) -> str:
+    """Краткое имя структуры индекса для faiss_indexes.index_type."""
+    name = type(_base(index)).__name__
+    ivf = _ivf(index)
+    if name == "IndexPreTransform" and ivf is not None:
+        return f"OPQ+{type(faiss.downcast_index(ivf)).__name__}"
+    return name
+
+
+def matches_config(index, count) -> bool:
+    """Совпадает ли тип индекса с тем, что create_index построил бы для count векторов."""
+    expected = "IndexFlatIP" if index_spec(count, index.d) == "Flat" else config.FAISS_INDEX_TYPE
+    return describe(index) == expected
+
+
+def supports_removal(index) -> bool:
+    """Можно ли удалять векторы из индекса (remove_ids); HNSW — нельзя."""
+    return _hnsw(index) is None
+
+
+def index_metadata(index):
+    """(тип индекса, параметры поиска) для записи в faiss_indexes."""
+    return describe(index), search_parameters(index)
+
+
+def search_parameters(index) -> dict:
+    """Текущие параметры поиска индекса: {"nprobe": ...}, {"efSearch": ...} или {}."""
+    ivf = _ivf(index)
+    if ivf is not None:
+        return {"nprobe": ivf.nprobe}
+    hnsw = _hnsw(index)
+    if hnsw is not None:
+        return {"efSearch": hnsw.hnsw.efSearch}
+    return {}
+
+
+def apply_search_parameters(index, params):
+    """Применяет параметры поиска (dict или JSON из faiss_indexes.search_params)."""
+    if isinstance(params, str):
+        params = json.loads(params)
+    if params:
+        faiss.ParameterSpace().set_index_parameters(index, ",".join(f"{name}={value}" for name, value in params.items()))
+
+
+def selector_parameters(index, selector):
+    """SearchParameters с фильтром ID, сохраняющие nprobe/efSearch индекса.
+
+    IVF не принимает базовый faiss.SearchParameters, а nprobe/efSearch из
+    параметров запроса заменяют заданные в индексе, поэтому они копируются.
+    """
+    ivf = _ivf(index)
+    if ivf is not None:
+        return faiss.SearchParametersIVF(sel=selector, nprobe=ivf.nprobe)
+    hnsw = _hnsw(index)
+    if hnsw is not None:
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=hnsw.hnsw.efSearch)
+    return faiss.SearchParameters(sel=selector)
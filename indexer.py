@@ -1,19 +1,38 @@
 """Индексация эмбеддингов реплик (utterances) в FAISS. Поддержка тематических индексов.
-   Оптимизирован: батчи, логи, проверка, экономия памяти."""
+   Оптимизирован: батчи, логи, проверка, экономия памяти.
+
+   Векторы хранятся в индексах с метками utterances.rowid, рядом —
+   ids_<тема>.npy: метки индекса в порядке добавления (int64, 8 байт на
+   вектор; np.load(..., mmap_mode="r") открывает его без чтения целиком).
+   Метка сама ведёт к реплике: SELECT ... FROM utterances WHERE rowid = ?.
+   faiss_indexes.indexed_rowid — наибольший
+   utterance_embeddings.rowid, просмотренный при построении (high-water mark):
+   python indexer.py --update дописывает только векторы после него и убирает
+   реплики удалённых диалогов, без полной перестройки.
+
+   rowid таблиц без INTEGER PRIMARY KEY SQLite может перенумеровать при
+   VACUUM — после VACUUM и migrate_vectors.py нужна полная перестройка."""
 
 import os
+import re
 import json
-import pickle
 import sqlite3
 import logging
+import argparse
 from pathlib import Path
+from collections import namedtuple
 from datetime import datetime  # Импорт для записи времени построения
 import faiss
 import numpy as np
 from tqdm import tqdm
+from concurrent.futures import ThreadPoolExecutor
 
 # === Импорт конфигурации ===
 import config
+from vector_codec import decode_matrix
+from matryoshka import output_dimension
+from ingest_journal import mark_indexed
+from index_types import create_index, index_metadata, matches_config, supports_removal
 
 # === Настройка логирования ===
 logging.basicConfig(
@@ -28,6 +47,10 @@ logger = logging.getLogger("Indexer")
 
 BATCH_SIZE = 1024  # Размер батча для добавления в FAISS
 
+# Результат read_vectors: матрица, метки (utterances.rowid), темы строк
+# и наибольший просмотренный utterance_embeddings.rowid
+IndexVectors = namedtuple("IndexVectors", "matrix labels themes max_rowid")
+
 def get_themes_from_db(conn):
     """Получает список всех уникальных тем из БД."""
     cursor = conn.cursor()
@@ -35,144 +58,413 @@ def get_themes_from_db(conn):
     themes = [row[0] for row in cursor.fetchall() if row[0]]
     return themes
 
-def build_faiss_index_for_theme(theme_name, conn, index_path, ids_path):
-    """Строит FAISS-индекс для заданной темы (или 'all') на основе реплик."""
-    logger.info(f"🔍 Начало построения индекса для темы: '{theme_name}'...")
+def index_paths(theme_name):
+    """(базовый путь индекса, путь .npy с метками индекса) для темы.
+
+    Сам индекс сохраняется рядом под именем с версией (versioned_index_path);
+    действующий путь — в faiss_indexes.index_path.
+    """
+    return (config.FAISS_INDEX_DIR / f"faiss_index_{theme_name}.index",
+            config.FAISS_INDEX_DIR / f"ids_{theme_name}.npy")
+
+def versioned_index_path(index_path):
+    """faiss_index_<тема>.<ГГГГММДДччммссмкс>.index рядом с базовым путём."""
+    index_path = Path(index_path)
+    return index_path.with_name(f"{index_path.stem}.{datetime.now():%Y%m%d%H%M%S%f}{index_path.suffix}")
+
+def remove_old_versions(index_path):
+    """Удаляет прежние версии индекса (и файл без версии от старых версий), кроме index_path.
+
+    Файл, открытый другим процессом через отображение в память, в Windows не
+    удаляется — он останется до следующего сохранения.
+    """
+    index_path = Path(index_path)
+    stem = re.sub(r"\.\d{20}$", "", index_path.stem)
+    pattern = re.compile(re.escape(stem) + r"(\.\d{20})?" + re.escape(index_path.suffix))
+    for path in index_path.parent.iterdir():
+        if path != index_path and pattern.fullmatch(path.name):
+            try:
+                path.unlink()
+            except OSError:
+                pass
+
+def save_index(index, labels, index_path, ids_path):
+    """Сохраняет индекс в новый файл с версией и атомарно заменяет метки; возвращает путь индекса.
+
+    Индекс не перезаписывается на месте: GUI держит прежний файл отображённым
+    в память (FAISS_MMAP), а в Windows такой файл нельзя заменить. Прежние
+    версии удаляет record_index после переключения faiss_indexes на новую.
+    Метки пишутся первыми: при дописывании индекса читатель, попавший между
+    заменами, найдёт в них все метки индекса.
+    """
+    os.makedirs(os.path.dirname(index_path), exist_ok=True)
+    tmp_ids = f"{ids_path}.tmp"
+    with open(tmp_ids, 'wb') as f:
+        np.save(f, np.asarray(labels, dtype=np.int64))
+    os.replace(tmp_ids, ids_path)
+    saved_path = versioned_index_path(index_path)
+    tmp_index = f"{saved_path}.tmp"
+    faiss.write_index(index, tmp_index)
+    os.replace(tmp_index, saved_path)
+    # JSON со списком ID от прежних версий больше не нужен
+    Path(ids_path).with_suffix(".json").unlink(missing_ok=True)
+    return saved_path
+
+def load_labels(ids_path):
+    """Метки индекса (int64) из .npy; None для JSON прежних версий — такой индекс нужно перестроить."""
+    if Path(ids_path).suffix != ".npy":
+        return None
+    return np.load(ids_path)
+
+def ensure_index_columns(conn):
+    """Добавляет в faiss_indexes колонки, появившиеся в новых версиях (тип индекса, параметры поиска, indexed_rowid)."""
+    existing = {row[1] for row in conn.execute("PRAGMA table_info(faiss_indexes)")}
+    for name, column_type in (("index_type", "TEXT"), ("search_params", "TEXT"), ("indexed_rowid", "INTEGER")):
+        if name not in existing:
+            conn.execute(f"ALTER TABLE faiss_indexes ADD COLUMN {name} {column_type}")
+
+def record_index(conn, theme_name, index_path, ids_path, metadata, indexed_rowid=None):
+    """Записывает метаданные индекса в faiss_indexes; built_at — сигнал GUI перечитать индекс.
 
-    # Запрос: подсчитываем количество реплик для темы
-    if theme_name == "all":
-        count_query = "SELECT COUNT(*) FROM utterance_embeddings ue JOIN utterances u ON ue.utterance_id = u.id"
-        fetch_query = """
-            SELECT ue.utterance_id, ue.vector
-            FROM utterance_embeddings ue
-            JOIN utterances u ON ue.utterance_id = u.id
-        """
+    index_path — путь, который вернул save_index; прежние версии файла индекса
+    после записи удаляются. metadata — (тип индекса, параметры поиска) из
+    index_types.index_metadata; indexed_rowid — high-water mark для --update
+    (None — индекс без меток rowid).
+    """
+    index_type, search_params = metadata
+    built_at = datetime.now().isoformat()
+    ensure_index_columns(conn)
+    conn.execute("""
+        INSERT OR REPLACE INTO faiss_indexes (theme, index_path, ids_path, built_at, index_type, search_params, indexed_rowid)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """, (theme_name, str(index_path), str(ids_path), built_at, index_type, json.dumps(search_params), indexed_rowid))
+    conn.commit()
+    remove_old_versions(index_path)
+    return built_at
+
+def read_vectors(conn, theme_name="all", with_themes=False, after_rowid=0):
+    """Читает векторы реплик темы (или всех, для 'all') за один проход по БД.
+
+    Args:
+        conn: Соединение с БД.
+        theme_name: Тема или 'all'.
+        with_themes: Вернуть тему диалога каждой строки (для build_all_indexes).
+        after_rowid: Читать только эмбеддинги с utterance_embeddings.rowid больше него.
+
+    Returns:
+        IndexVectors(matrix, labels, themes, max_rowid): L2-нормализованная
+        матрица float32, метки её строк (utterances.rowid, int64), темы строк
+        (None без with_themes; тема None — реплика без диалога) и наибольший
+        просмотренный utterance_embeddings.rowid. None, если реплик нет.
+    """
+    # Реплики читаются по возрастанию ue.rowid порциями (keyset pagination):
+    # каждая порция — поиск по первичному ключу, без повторного просмотра
+    # предыдущих строк, как при LIMIT/OFFSET. Верхняя граница rowid фиксируется
+    # вместе с подсчётом, поэтому строки, дописанные во время построения,
+    # в этот индекс не попадают и матрица не переполняется. CROSS JOIN
+    # закрепляет utterance_embeddings внешним циклом: иначе SQLite для темы
+    # начинает с dialogs и сортирует все реплики темы ради каждой порции.
+    if theme_name != "all":
+        count_join = join = "CROSS JOIN dialogs d ON u.dialog_id = d.id"
+        where, theme_params = "AND d.source_theme = ?", (theme_name,)
     else:
-        count_query = """
-            SELECT COUNT(*)
-            FROM utterance_embeddings ue
-            JOIN utterances u ON ue.utterance_id = u.id
-            JOIN dialogs d ON u.dialog_id = d.id
-            WHERE d.source_theme = ?
-        """
-        fetch_query = """
-            SELECT ue.utterance_id, ue.vector
-            FROM utterance_embeddings ue
-            JOIN utterances u ON ue.utterance_id = u.id
-            JOIN dialogs d ON u.dialog_id = d.id
-            WHERE d.source_theme = ?
-        """
+        # Реплики без диалога входят только в 'all'
+        count_join, where, theme_params = "", "", ()
+        join = "LEFT JOIN dialogs d ON u.dialog_id = d.id" if with_themes else ""
+    theme_column = "d.source_theme" if with_themes else "NULL"
+    count_query = f"""
+        SELECT COUNT(*), MAX(ue.rowid)
+        FROM utterance_embeddings ue
+        JOIN utterances u ON ue.utterance_id = u.id
+        {count_join}
+        WHERE ue.rowid > ? {where}
+    """
+    fetch_query = f"""
+        SELECT ue.rowid, ue.utterance_id, ue.vector, {theme_column}, u.rowid
+        FROM utterance_embeddings ue
+        CROSS JOIN utterances u ON ue.utterance_id = u.id
+        {join}
+        WHERE ue.rowid > ? AND ue.rowid <= ? {where}
+        ORDER BY ue.rowid
+        LIMIT ?
+    """
 
     cursor = conn.cursor()
-    cursor.execute(count_query, (theme_name,) if theme_name != "all" else ())
-    total = cursor.fetchone()[0]
-
+    total, max_rowid = cursor.execute(count_query, (after_rowid, *theme_params)).fetchone()
     if total == 0:
-        logger.warning(f"⚠️ Для темы '{theme_name}' не найдено реплик для индексации.")
-        return False
+        return None
 
     logger.info(f"📊 Найдено {total} реплик для индексации.")
 
-    # Создаём FAISS индекс
-    dimension = config.EMBEDDING_MODEL_DIMENSION
-    index = faiss.IndexFlatIP(dimension)  # Можно заменить на IndexIVFFlat при желании
-    # Нормализация будет происходить перед добавлением векторов
+    # Более длинные векторы (записанные до смены размерности) усекаются при чтении
+    dimension = output_dimension()
+    # Векторы декодируются сразу в матрицу на все реплики
+    matrix = np.empty((total, dimension), dtype=np.float32)
+    labels = np.empty(total, dtype=np.int64)
 
-    utterance_ids = []
-    offset = 0
+    themes = [] if with_themes else None
+    filled = 0
+    skipped = 0
+    last_rowid = after_rowid
 
     pbar = tqdm(total=total, desc=f"Индексация '{theme_name}'", unit="реплика")
 
-    # Цикл обработки батчей
-    while offset < total:
-        # Формируем параметры запроса
-        if theme_name == "all":
-            params = (BATCH_SIZE, offset)
-        else:
-            params = (theme_name, BATCH_SIZE, offset)
-
-        cursor.execute(fetch_query + " LIMIT ? OFFSET ?", params)
+    while filled < total:
+        cursor.execute(fetch_query, (last_rowid, max_rowid, *theme_params, min(BATCH_SIZE, total - filled)))
         rows = cursor.fetchall()
 
         if not rows:
             break
+        last_rowid = rows[-1][0]
 
-        vectors = []
-        batch_ids = []
+        _, valid = decode_matrix([row[2] for row in rows], dimension, out=matrix[filled:], truncate=True)
+        batch = [row for row, ok in zip(rows, valid) if ok]
+        if len(batch) < len(rows):
+            skipped += len(rows) - len(batch)
+            bad_ids = [row[1] for row, ok in zip(rows, valid) if not ok]
+            logger.warning(f"❌ Векторы в неизвестном формате или другой размерности: {bad_ids[:5]}...")
 
-        for row in rows:
-            utterance_id, vector_blob = row
-            try:
-                vector = pickle.loads(vector_blob)
-                if isinstance(vector, np.ndarray):
-                    vector = vector.astype('float32')
-                else:
-                    vector = np.array(vector, dtype='float32')
-                vectors.append(vector)
-                batch_ids.append(utterance_id)
-            except Exception as e:
-                logger.warning(f"❌ Ошибка десериализации вектора {utterance_id}: {e}")
-                continue
-
-        if vectors:
-            vectors = np.array(vectors)
-            faiss.normalize_L2(vectors)
-            index.add(vectors)
-            utterance_ids.extend(batch_ids)
-
-        pbar.update(len(batch_ids))
-        offset += BATCH_SIZE
+        labels[filled:filled + len(batch)] = [row[4] for row in batch]
+        if with_themes:
+            themes.extend(row[3] for row in batch)
+        filled += len(batch)
+        pbar.update(len(rows))
 
     pbar.close()
+    if skipped:
+        logger.warning(f"⚠️ Пропущено {skipped} векторов. Если БД создана старой версией pipeline, запустите migrate_vectors.py.")
+
+    matrix = matrix[:filled]
+    faiss.normalize_L2(matrix)
+    return IndexVectors(matrix, labels[:filled], themes, max_rowid)
+
+def write_index_files(theme_name, index, labels, index_path, ids_path):
+    """Сохраняет индекс и метки на диск.
+
+    Соединение с БД не нужно (вызывается из потоков).
 
-    # --- Сохранение индекса и ID ---
+    Returns:
+        (путь сохранённого индекса, index_metadata(index)) или None при ошибке.
+    """
     try:
-        # Убедимся, что директория существует
-        os.makedirs(os.path.dirname(index_path), exist_ok=True)
-        # Сохраняем FAISS индекс (преобразуем Path в str)
-        faiss.write_index(index, str(index_path))
-        # Сохраняем список ID
-        with open(ids_path, 'w', encoding='utf-8') as f:
-            json.dump(utterance_ids, f, ensure_ascii=False, indent=2)
-        logger.info(f"✅ Индекс для '{theme_name}' сохранён на диск: {index_path}, {len(utterance_ids)} реплик.")
+        saved_path = save_index(index, labels, index_path, ids_path)
+        metadata = index_metadata(index)
+        logger.info(f"✅ Индекс {metadata[0]} для '{theme_name}' сохранён на диск: {saved_path}, {len(labels)} реплик.")
+        return saved_path, metadata
     except Exception as e:
         logger.error(f"❌ Ошибка сохранения индекса/ID для '{theme_name}' на диск: {e}")
-        return False
+        return None
 
-    # --- Сохранение метаданных индекса в БД ---
+def register_index(theme_name, conn, index_path, ids_path, built_from, metadata, indexed_rowid=None):
+    """Записывает метаданные индекса в БД и отмечает батчи журнала темы как indexed."""
     try:
-        meta_cursor = conn.cursor()
-        meta_cursor.execute("""
-            INSERT OR REPLACE INTO faiss_indexes (theme, index_path, ids_path, built_at)
-            VALUES (?, ?, ?, ?)
-        """, (theme_name, str(index_path), str(ids_path), datetime.now().isoformat()))
-        conn.commit()
+        record_index(conn, theme_name, index_path, ids_path, metadata, indexed_rowid)
         logger.info(f"✅ Метаданные индекса для '{theme_name}' сохранены в БД.")
     except Exception as e:
         logger.error(f"❌ Ошибка сохранения метаданных индекса для '{theme_name}' в БД: {e}")
         conn.rollback() # Откатываем, если это было внутри транзакции
-        # Не возвращаем False, так как индекс на диске уже создан
+        # Индекс на диске уже создан
+
+    if theme_name != "all":
+        try:
+            mark_indexed(conn, theme_name, built_from)
+        except sqlite3.OperationalError as e:
+            # БД до появления журнала pipeline
+            logger.warning(f"⚠️ Журнал ingest_journal не обновлён: {e}")
 
+def build_faiss_index_for_theme(theme_name, conn, index_path, ids_path):
+    """Строит FAISS-индекс для заданной темы (или 'all') на основе реплик."""
+    logger.info(f"🔍 Начало построения индекса для темы: '{theme_name}'...")
+    # Батчи, закодированные до этого момента, войдут в индекс
+    built_from = datetime.now().isoformat()
+
+    data = read_vectors(conn, theme_name)
+    if data is None:
+        logger.warning(f"⚠️ Для темы '{theme_name}' не найдено реплик для индексации.")
+        return False
+
+    index = create_index(data.matrix, labels=data.labels)
+    saved = write_index_files(theme_name, index, data.labels, index_path, ids_path)
+    if saved is None:
+        return False
+    register_index(theme_name, conn, saved[0], ids_path, built_from, saved[1], data.max_rowid)
     return True
 
-def main():
-    """Основная функция для построения всех индексов."""
+def build_from_rows(theme_name, matrix, labels, rows=None):
+    """Строит индекс темы по строкам rows матрицы (по умолчанию — всем) и сохраняет его; результат write_index_files."""
+    return write_index_files(theme_name, create_index(matrix, labels=labels, rows=rows), labels, *index_paths(theme_name))
+
+def run_jobs(build, jobs, workers=None):
+    """{задание: build(задание)} в INDEXER_WORKERS потоках (0 или 1 — последовательно)."""
+    workers = config.INDEXER_WORKERS if workers is None else workers
+    if workers > 1:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return dict(zip(jobs, executor.map(build, jobs)))
+    return {job: build(job) for job in jobs}
+
+def build_all_indexes(conn, workers=None):
+    """Строит индексы всех тем и 'all' за один проход по БД.
+
+    Векторы читаются и декодируются один раз (как для 'all'); индекс темы
+    собирается из строк общей матрицы с этой темой порциями, без копии всей
+    выборки темы. Сначала строится и сохраняется 'all' (самый большой индекс),
+    затем индексы тем — в потоках: FAISS отпускает GIL на обучении и
+    добавлении, а процессам пришлось бы передавать каждому свою копию
+    матрицы. Так в памяти одновременно матрица и либо индекс 'all', либо
+    индексы тем, вместе не больше её. Метаданные в БД пишутся из вызывающего
+    потока.
+
+    Args:
+        conn: Соединение с БД.
+        workers: Потоков (по умолчанию INDEXER_WORKERS; 0 или 1 — последовательно).
+
+    Returns:
+        {тема: удалось ли построить}, включая 'all'.
+    """
+    logger.info("🔍 Построение индексов всех тем за один проход...")
+    built_from = datetime.now().isoformat()
+
+    data = read_vectors(conn, "all", with_themes=True)
+    if data is None:
+        logger.warning("⚠️ Не найдено реплик для индексации.")
+        return {}
+
+    positions = theme_positions(data.themes)
+
+    def build(theme_name):
+        rows = positions[theme_name]
+        return build_from_rows(theme_name, data.matrix, data.labels[rows], rows)
+
+    # 'all' — отдельно: его индекс освобождается до того, как начнут строиться индексы тем
+    built = {"all": build_from_rows("all", data.matrix, data.labels)}
+    themes = sorted(theme for theme in positions if theme != "all")
+    built.update(run_jobs(build, themes, workers))
+    jobs = ["all"] + themes
+
+    for theme_name in jobs:
+        if built[theme_name] is not None:
+            saved_path, metadata = built[theme_name]
+            register_index(theme_name, conn, saved_path, index_paths(theme_name)[1], built_from, metadata, data.max_rowid)
+    return {theme_name: saved is not None for theme_name, saved in built.items()}
+
+def theme_positions(themes):
+    """{тема: номера строк матрицы}, 'all' — все строки (реплики без диалога — только в 'all')."""
+    positions = {"all": np.arange(len(themes))}
+    by_theme = {}
+    for position, theme in enumerate(themes):
+        if theme:
+            by_theme.setdefault(theme, []).append(position)
+    positions.update((theme, np.asarray(rows)) for theme, rows in by_theme.items())
+    return positions
+
+def update_all_indexes(conn, workers=None):
+    """Дописывает индексы репликами, появившимися после последнего построения.
+
+    Из БД читаются только эмбеддинги с rowid больше indexed_rowid индексов,
+    а метки реплик, которых больше нет в utterances (удалённые диалоги),
+    удаляются из индексов. Целиком перестраиваются: темы без индекса, индексы
+    старого формата (без меток или с JSON вместо .npy), индексы другой размерности или типа
+    (например, Flat, переросший FAISS_FLAT_MAX_VECTORS) и HNSW, из которого
+    нужно удалить реплики. Центроиды IVF не переобучаются — после
+    многократного роста данных стоит перестроить индексы полностью.
+
+    Returns:
+        {тема: удалось ли обновить или построить}, включая 'all'.
+    """
+    logger.info("🔄 Обновление индексов новыми репликами...")
+    built_from = datetime.now().isoformat()
+    ensure_index_columns(conn)
+    registered = {
+        row[0]: row[1:] for row in conn.execute("SELECT theme, index_path, ids_path, indexed_rowid FROM faiss_indexes")
+    }
+
+    loaded, rebuild = {}, []
+    for theme_name in get_themes_from_db(conn) + ["all"]:
+        entry = registered.get(theme_name)
+        labels = None
+        if entry and entry[2] is not None and Path(entry[0]).exists() and Path(entry[1]).exists():
+            labels = load_labels(entry[1])
+        if labels is not None:
+            loaded[theme_name] = (faiss.read_index(entry[0]), labels, entry[2])
+        else:
+            rebuild.append(theme_name)
+    if "all" in rebuild:
+        # Общему индексу всё равно нужны все векторы — строим всё за один проход
+        logger.info("ℹ️ Общий индекс отсутствует или старого формата — полная перестройка.")
+        return build_all_indexes(conn, workers)
+
+    data = read_vectors(conn, "all", with_themes=True, after_rowid=min(entry[2] for entry in loaded.values()))
+    positions = theme_positions(data.themes) if data is not None else {}
+    # rowid всех реплик — по индексу utterances(dialog_id), без чтения текстов
+    alive = np.fromiter((row[0] for row in conn.execute("SELECT rowid FROM utterances")), dtype=np.int64)
+    alive.sort()
+    dimension = output_dimension()
+
+    changes = {}
+    for theme_name, (index, labels, _) in loaded.items():
+        kept = np.isin(labels, alive, assume_unique=True)
+        removed = len(labels) - int(kept.sum())
+        rows = positions.get(theme_name, np.empty(0, dtype=np.int64))
+        # Реплики, уже добавленные демоном приёма, пропускаются
+        rows = rows[~np.isin(data.labels[rows], labels)] if len(rows) else rows
+        if not removed and not len(rows):
+            continue
+        total = index.ntotal - removed + len(rows)
+        if index.d != dimension or not matches_config(index, total) or (removed and not supports_removal(index)):
+            rebuild.append(theme_name)
+        else:
+            changes[theme_name] = (kept, removed, rows)
+
+    def update(theme_name):
+        index, labels, _ = loaded[theme_name]
+        kept, removed, rows = changes[theme_name]
+        if removed:
+            index.remove_ids(faiss.IDSelectorBatch(labels[~kept]))
+            labels = labels[kept]
+        if len(rows):
+            index.add_with_ids(data.matrix[rows], data.labels[rows])
+            labels = np.concatenate([labels, data.labels[rows]])
+        logger.info(f"➕ '{theme_name}': добавлено {len(rows)}, удалено {removed}, всего {index.ntotal}.")
+        return write_index_files(theme_name, index, labels, *index_paths(theme_name))
+
+    updated = run_jobs(update, sorted(changes), workers)
+
+    result = {}
+    for theme_name, (_, _, indexed_rowid) in loaded.items():
+        if theme_name in rebuild:
+            continue
+        new_rowid = max(indexed_rowid, data.max_rowid) if data is not None else indexed_rowid
+        if theme_name in updated:
+            if updated[theme_name] is not None:
+                saved_path, metadata = updated[theme_name]
+                register_index(theme_name, conn, saved_path, index_paths(theme_name)[1], built_from, metadata, new_rowid)
+            result[theme_name] = updated[theme_name] is not None
+        else:
+            # Индекс не изменился: сдвигается только отметка, built_at остаётся — GUI не перечитывает индекс
+            conn.execute("UPDATE faiss_indexes SET indexed_rowid = ? WHERE theme = ?", (new_rowid, theme_name))
+            conn.commit()
+            result[theme_name] = True
+
+    for theme_name in rebuild:
+        logger.info(f"ℹ️ Индекс '{theme_name}' перестраивается целиком.")
+        result[theme_name] = build_faiss_index_for_theme(theme_name, conn, *index_paths(theme_name))
+    return result
+
+def main(argv=None):
+    """Основная функция для построения всех индексов (argv — аргументы командной строки, как у sys.argv[1:])."""
+    parser = argparse.ArgumentParser(description="Построение FAISS-индексов реплик")
+    parser.add_argument("--update", action="store_true",
+                        help="Дописать новые реплики и убрать удалённые вместо полной перестройки")
+    args = parser.parse_args(argv)
     logger.info("🚀 Начало построения FAISS-индексов для реплик...")
     
     # Подключение к БД
     conn = sqlite3.connect(config.DATABASE_PATH)
     
-    # Получаем список тем
-    themes = get_themes_from_db(conn)
-    themes.append("all")  # Добавляем общую индексацию
-
-    # Строим индекс для каждой темы
-    for theme in themes:
-        index_path = config.FAISS_INDEX_DIR / f"faiss_index_{theme}.index"
-        ids_path = config.FAISS_INDEX_DIR / f"ids_{theme}.json"
-        
-        success = build_faiss_index_for_theme(theme, conn, index_path, ids_path)
-        if not success:
+    # Все темы и 'all' — за один проход по эмбеддингам
+    built = update_all_indexes(conn) if args.update else build_all_indexes(conn)
+    for theme in get_themes_from_db(conn) + ["all"]:
+        if not built.get(theme):
             logger.error(f"❌ Не удалось построить индекс для темы '{theme}'.")
 
     conn.close()
@@ -0,0 +1,342 @@
+"""Режим демона: приём новых RTF из Input/<тема> и дописывание живых FAISS-индексов.
+
+Демон держит загруженную модель и открытые соединения, следит за папками Input
+(watchdog — inotify/ReadDirectoryChangesW, без него — опрос раз в
+DAEMON_POLL_SECONDS) и, когда поток новых файлов затихает на
+DAEMON_SETTLE_SECONDS, прогоняет их через тот же путь, что pipeline.py
+(парсинг, кодирование, db_writer, журнал ingest_journal). Закодированные
+батчи журнала сразу добавляются в индекс темы и в общий индекс "all" без
+полной перестройки (метки — utterances.rowid, как в indexer.py); на диск
+индексы сохраняются не чаще раза в DAEMON_INDEX_SAVE_SECONDS, и GUI
+перечитывает их по faiss_indexes.built_at.
+
+Запуск: python ingest_daemon.py (остановка — Ctrl+C).
+"""
+
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+import faiss
+import numpy as np
+
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+except ImportError:  # без watchdog работает опрос папок
+    Observer = None
+    FileSystemEventHandler = object
+
+import config
+import pipeline
+from pipeline import log_to_file_only
+from embedding_cache import EmbeddingCache, model_key
+from embedding_backend import cache_model_name
+from adaptive_batcher import AdaptiveBatcher
+from db_writer import DBWriter, open_connection, chunked
+from ingest_journal import resume_unfinished, encoded_batches, mark_batches_indexed
+from indexer import (
+    index_paths, save_index, load_labels, ensure_index_columns, record_index, build_faiss_index_for_theme
+)
+from index_types import index_metadata
+from vector_codec import decode_matrix
+from matryoshka import output_dimension
+
+
+def log(msg):
+    log_to_file_only(msg)
+    print(msg)
+
+
+def snapshot_input(input_root):
+    """{путь: (размер, mtime)} всех RTF в тематических папках."""
+    state = {}
+    for path in input_root.glob("*/*.rtf"):
+        try:
+            stat = path.stat()
+        except FileNotFoundError:  # файл убрали во время обхода
+            continue
+        state[str(path)] = (stat.st_size, stat.st_mtime)
+    return state
+
+
+class _ChangeHandler(FileSystemEventHandler):
+    def __init__(self, changed):
+        self.changed = changed
+
+    def on_any_event(self, event):
+        if not event.is_directory:
+            self.changed.set()
+
+
+class InputWatcher:
+    """Сигнал "в Input что-то изменилось" от watchdog или опроса."""
+
+    def __init__(self, input_root, poll_seconds=None, settle_seconds=None):
+        self.input_root = input_root
+        self.poll_seconds = poll_seconds or config.DAEMON_POLL_SECONDS
+        self.settle_seconds = settle_seconds or config.DAEMON_SETTLE_SECONDS
+        self.changed = threading.Event()
+        self.observer = None
+        self.snapshot = snapshot_input(input_root)
+        if Observer is not None:
+            try:
+                self.observer = Observer()
+                self.observer.schedule(_ChangeHandler(self.changed), str(input_root), recursive=True)
+                self.observer.start()
+            except Exception as e:
+                log_to_file_only(f"⚠️ watchdog недоступен ({e}), переходим на опрос папок.")
+                self.observer = None
+
+    @property
+    def mode(self):
+        return "watchdog" if self.observer is not None else "опрос"
+
+    def _poll(self, timeout):
+        """Ждёт изменения в режиме опроса не дольше timeout секунд."""
+        deadline = time.monotonic() + timeout
+        while True:
+            current = snapshot_input(self.input_root)
+            if current != self.snapshot:
+                self.snapshot = current
+                return True
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            time.sleep(min(self.poll_seconds, remaining))
+
+    def _wait(self, timeout):
+        if self.observer is None:
+            return self._poll(timeout)
+        if not self.changed.wait(timeout):
+            return False
+        self.changed.clear()
+        return True
+
+    def wait_for_changes(self, on_idle=None):
+        """Блокирует до изменения в Input, затем ждёт, пока файлы перестанут меняться.
+
+        on_idle вызывается раз в poll_seconds, пока изменений нет.
+        """
+        while not self._wait(self.poll_seconds):
+            if on_idle is not None:
+                on_idle()
+        # Копирование крупных выгрузок идёт частями — ждём затишья
+        while self._wait(self.settle_seconds):
+            pass
+
+    def stop(self):
+        if self.observer is not None:
+            self.observer.stop()
+            self.observer.join()
+
+
+class LiveIndex:
+    """Индекс темы в памяти демона и то, что нужно, чтобы его сохранить."""
+
+    def __init__(self, index, labels, built_at, indexed_rowid):
+        self.index = index
+        self.labels = [labels]  # порции меток; склеиваются при сохранении
+        self.added = set()      # метки, добавленные демоном после загрузки индекса
+        self.built_at = built_at
+        self.indexed_rowid = indexed_rowid
+
+    def is_known(self, label, embedding_rowid):
+        # Эмбеддинги до indexed_rowid (utterance_embeddings.rowid) вошли в индекс при построении
+        return embedding_rowid <= self.indexed_rowid or label in self.added
+
+
+class LiveIndexes:
+    """FAISS-индексы тем и "all", дописываемые демоном на месте.
+
+    Индекс держится в памяти между циклами и перечитывается с диска, только
+    если его перестроил indexer.py (изменился built_at в faiss_indexes).
+    Индекс, которого ещё нет, и индекс старого формата (без меток rowid или
+    с JSON вместо .npy) строятся целиком, как в indexer.py. indexed_rowid не сдвигается: его
+    ведёт indexer.py --update, который пропустит уже добавленные демоном реплики.
+
+    Запись индекса — это перезапись всего файла и меток, поэтому изменённые
+    индексы сохраняются не чаще раза в DAEMON_INDEX_SAVE_SECONDS (и при
+    остановке демона); между сохранениями главная копия — в памяти. Батчи
+    журнала переводятся в indexed только после сохранения: если демон упадёт
+    раньше, их реплики добавит indexer.py --update (indexed_rowid не сдвигался).
+    """
+
+    def __init__(self, conn, dimension=None, save_seconds=None):
+        self.conn = conn
+        self.dimension = dimension or output_dimension()
+        self.save_seconds = config.DAEMON_INDEX_SAVE_SECONDS if save_seconds is None else save_seconds
+        self.loaded = {}  # {тема: LiveIndex}
+        self.dirty = set()
+        self.pending_batches = []  # батчи журнала, добавленные в индексы, но ещё не сохранённые
+        self.saved_at = time.monotonic()
+        ensure_index_columns(conn)
+
+    def _load(self, theme):
+        row = self.conn.execute(
+            "SELECT index_path, ids_path, built_at, indexed_rowid FROM faiss_indexes WHERE theme = ?", (theme,)
+        ).fetchone()
+        built_at = row[2] if row else None
+        cached = self.loaded.get(theme)
+        if cached is not None and cached.built_at == built_at:
+            return cached
+        # Индекс перестроен indexer.py из БД — несохранённые добавления в нём уже есть
+        self.dirty.discard(theme)
+        if not (row and row[3] is not None and Path(row[0]).exists() and Path(row[1]).exists()):
+            return None
+        labels = load_labels(row[1])
+        if labels is None:
+            return None
+        cached = LiveIndex(faiss.read_index(row[0]), labels, built_at, row[3])
+        self.loaded[theme] = cached
+        return cached
+
+    def add(self, theme, labels, vectors, embedding_rowids):
+        """Добавляет нормализованные векторы с метками (utterances.rowid) в индекс темы; возвращает число добавленных.
+
+        embedding_rowids — utterance_embeddings.rowid векторов: по ним видно,
+        какие из них уже вошли в индекс при построении.
+        """
+        live = self._load(theme)
+        if live is None:
+            # Индекса темы ещё нет — строим по всем эмбеддингам темы, включая новые
+            self.loaded.pop(theme, None)
+            index_path, ids_path = index_paths(theme)
+            return len(labels) if build_faiss_index_for_theme(theme, self.conn, index_path, ids_path) else 0
+        # Индекс мог быть перестроен уже с этими репликами
+        keep = [
+            i for i, (label, embedding_rowid) in enumerate(zip(labels.tolist(), embedding_rowids.tolist()))
+            if not live.is_known(label, embedding_rowid)
+        ]
+        if not keep:
+            return 0
+        live.index.add_with_ids(vectors[keep], labels[keep])
+        live.labels.append(labels[keep])
+        live.added.update(labels[keep].tolist())
+        self.dirty.add(theme)
+        return len(keep)
+
+    def save(self, force=False):
+        """Сохраняет изменённые индексы, если с прошлого сохранения прошло save_seconds (или force)."""
+        if not (self.dirty or self.pending_batches):
+            return
+        if not force and time.monotonic() - self.saved_at < self.save_seconds:
+            return
+        for theme in sorted(self.dirty):
+            live = self.loaded[theme]
+            labels = np.concatenate(live.labels)
+            live.labels = [labels]
+            index_path, ids_path = index_paths(theme)
+            index_path = save_index(live.index, labels, index_path, ids_path)
+            live.built_at = record_index(
+                self.conn, theme, index_path, ids_path, index_metadata(live.index), live.indexed_rowid
+            )
+        if self.dirty:
+            log_to_file_only(f"💾 Сохранены индексы: {', '.join(sorted(self.dirty))}")
+        mark_batches_indexed(self.conn, self.pending_batches)
+        self.dirty.clear()
+        self.pending_batches = []
+        self.saved_at = time.monotonic()
+
+    def add_encoded_batches(self):
+        """Добавляет в индексы все закодированные батчи журнала и отмечает их indexed."""
+        pending = set(self.pending_batches)
+        batches = [batch for batch in encoded_batches(self.conn.cursor()) if batch[0] not in pending]
+        if not batches:
+            return 0
+        dialog_ids = [dialog_id for _, ids in batches for dialog_id in ids]
+        by_theme = {}
+        for chunk in chunked(dialog_ids):
+            placeholders = ",".join("?" * len(chunk))
+            rows = self.conn.execute(f"""
+                SELECT d.source_theme, u.rowid, ue.rowid, ue.vector
+                FROM utterance_embeddings ue
+                JOIN utterances u ON ue.utterance_id = u.id
+                JOIN dialogs d ON u.dialog_id = d.id
+                WHERE u.dialog_id IN ({placeholders})
+            """, chunk).fetchall()
+            for theme, label, embedding_rowid, vector in rows:
+                by_theme.setdefault(theme, []).append((label, embedding_rowid, vector))
+
+        added = 0
+        all_labels, all_rowids, all_vectors = [], [], []
+        for theme, rows in by_theme.items():
+            vectors, valid = decode_matrix([vector for _, _, vector in rows], self.dimension, truncate=True)
+            rows = [row for row, ok in zip(rows, valid) if ok]
+            labels = np.array([row[0] for row in rows], dtype=np.int64)
+            embedding_rowids = np.array([row[1] for row in rows], dtype=np.int64)
+            faiss.normalize_L2(vectors)
+            added += self.add(theme, labels, vectors, embedding_rowids)
+            all_labels.append(labels)
+            all_rowids.append(embedding_rowids)
+            all_vectors.append(vectors)
+        if any(len(labels) for labels in all_labels):
+            self.add("all", np.concatenate(all_labels), np.concatenate(all_vectors), np.concatenate(all_rowids))
+        self.pending_batches.extend(batch_id for batch_id, _ in batches)
+        return added
+
+
+def ingest_cycle(cursor, writer, encode_batch, executor, live_indexes):
+    """Один проход по темам Input: новые файлы → БД → живые индексы."""
+    run_id = datetime.now().strftime("%Y%m%d%H%M%S%f")
+    new_dialogs = 0
+    # Общие для всех тем цикла, как в pipeline.py: звонок, встреченный в двух темах,
+    # не уйдёт в writer дважды, пока первая запись ещё не в БД
+    submitted_dialog_ids = set()
+    for theme_folder in sorted(f for f in config.INPUT_ROOT.iterdir() if f.is_dir()):
+        new_dialogs += pipeline.process_theme(
+            theme_folder, run_id, cursor, writer, encode_batch, executor, submitted_dialog_ids
+        )
+    writer.flush()
+    added = live_indexes.add_encoded_batches()
+    live_indexes.save()
+    if new_dialogs or added:
+        log(f"📥 Новых диалогов: {new_dialogs}, реплик добавлено в индексы: {added}")
+
+
+def run_daemon():
+    pipeline.ensure_db_initialized()
+    executor = pipeline.create_parse_executor()
+    pool = None
+    try:
+        pool = pipeline.create_encoding_pool(pipeline.select_device())
+        _run_daemon(executor, pool)
+    finally:
+        if pool is not None:
+            pool.close()
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+
+def _run_daemon(executor, pool=None):
+    MODEL, device = (None, pipeline.select_device()) if pool is not None else pipeline.load_embedding_model()
+    conn = open_connection(config.DATABASE_PATH, pragmas=())
+    cursor = conn.cursor()
+    writer = DBWriter(config.DATABASE_PATH, config.PIPELINE_WRITER_QUEUE_SIZE, log=log_to_file_only).start()
+    embedding_cache = EmbeddingCache(conn, model_key(cache_model_name(device)), defer_writes=True)
+    encode_batch = pipeline.make_batch_encoder(MODEL, device, embedding_cache, AdaptiveBatcher(device), pool)
+    live_indexes = LiveIndexes(conn)
+    watcher = InputWatcher(config.INPUT_ROOT)
+    log(f"👀 Демон приёма запущен, слежение за {config.INPUT_ROOT} ({watcher.mode}). Остановка — Ctrl+C.")
+    try:
+        resume_unfinished(cursor, writer, encode_batch, log=log_to_file_only)
+        ingest_cycle(cursor, writer, encode_batch, executor, live_indexes)
+        while True:
+            # Отложенные индексы сохраняются и в простое, а не только со следующим приёмом
+            watcher.wait_for_changes(on_idle=live_indexes.save)
+            ingest_cycle(cursor, writer, encode_batch, executor, live_indexes)
+    except KeyboardInterrupt:
+        log("🛑 Демон приёма остановлен.")
+    finally:
+        watcher.stop()
+        writer.close()
+        try:
+            live_indexes.save(force=True)
+        except Exception as e:
+            log(f"❌ Не удалось сохранить индексы при остановке: {e}")
+        conn.close()
+
+
+if __name__ == "__main__":
+    run_daemon()
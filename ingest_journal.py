@@ -0,0 +1,164 @@
+"""Журнал приёма батчей pipeline (таблица ingest_journal).
+
+Каждый батч файлов проходит состояния:
+    parsed  — файлы разобраны, но запись в БД не удалась; файлы остаются в Input;
+    stored  — диалоги, реплики и манифест записаны, эмбеддингов ещё нет;
+    encoded — эмбеддинги записаны, файлы переносятся в processed;
+    indexed — тема батча переиндексирована в FAISS после его кодирования.
+
+Файлы батча переносятся только после перехода в encoded, и это отмечается
+флагом files_moved. После сбоя следующий запуск дозаписывает недостающие
+эмбеддинги батчей в состоянии stored и доделывает переносы — без повторного
+разбора RTF и без отката файлов в Input.
+"""
+
+import json
+from datetime import datetime
+
+from db_writer import chunked
+
+STATE_PARSED = "parsed"
+STATE_STORED = "stored"
+STATE_ENCODED = "encoded"
+STATE_INDEXED = "indexed"
+
+CREATE_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS ingest_journal (
+        batch_id TEXT PRIMARY KEY,
+        theme TEXT NOT NULL,
+        state TEXT NOT NULL,
+        dialog_ids TEXT NOT NULL,
+        moves TEXT NOT NULL,
+        files_moved INTEGER NOT NULL DEFAULT 0,
+        error TEXT,
+        created_at TEXT NOT NULL,
+        updated_at TEXT NOT NULL
+    );
+"""
+CREATE_INDEX_SQL = "CREATE INDEX IF NOT EXISTS idx_ingest_journal_state ON ingest_journal(state, theme);"
+
+
+def journal_row(batch_id, theme, state, dialog_ids, moves):
+    """Строка для ключа "journal" батча db_writer."""
+    return {
+        "batch_id": batch_id,
+        "theme": theme,
+        "state": state,
+        "dialog_ids": json.dumps(list(dialog_ids), ensure_ascii=False),
+        "moves": json.dumps([[str(source), str(target)] for source, target in moves], ensure_ascii=False),
+        "error": None,
+        "now": datetime.now().isoformat(),
+    }
+
+
+def state_update(batch_id, state):
+    """Строка для ключа "journal_state" батча db_writer."""
+    return {"batch_id": batch_id, "state": state, "now": datetime.now().isoformat()}
+
+
+def unfinished_batches(cursor):
+    """Батчи, прерванные до конца: без эмбеддингов или с неперенесёнными файлами."""
+    cursor.execute(
+        "SELECT batch_id, theme, state, dialog_ids, moves FROM ingest_journal "
+        "WHERE state = ? OR (state IN (?, ?) AND files_moved = 0) ORDER BY created_at",
+        (STATE_STORED, STATE_ENCODED, STATE_INDEXED)
+    )
+    return [
+        {"batch_id": batch_id, "theme": theme, "state": state,
+         "dialog_ids": json.loads(dialog_ids), "moves": json.loads(moves)}
+        for batch_id, theme, state, dialog_ids, moves in cursor.fetchall()
+    ]
+
+
+def pending_sources(cursor, theme) -> set:
+    """Пути в Input, которые уже записаны в БД, но ещё не перенесены.
+
+    Такие файлы не разбираются повторно: их доделывает resume_unfinished.
+    """
+    cursor.execute(
+        "SELECT moves FROM ingest_journal WHERE theme = ? AND state != ? AND files_moved = 0",
+        (theme, STATE_PARSED)
+    )
+    return {source for (moves,) in cursor.fetchall() for source, _ in json.loads(moves)}
+
+
+def missing_embeddings(cursor, dialog_ids=None):
+    """(id, текст) реплик без эмбеддингов — всех или только указанных диалогов."""
+    query = """
+        SELECT u.id, u.text
+        FROM utterances u
+        LEFT JOIN utterance_embeddings ue ON u.id = ue.utterance_id
+        WHERE ue.utterance_id IS NULL
+    """
+    if dialog_ids is None:
+        cursor.execute(query + " ORDER BY u.id")
+        return cursor.fetchall()
+    rows = []
+    for chunk in chunked(list(dialog_ids)):
+        placeholders = ",".join("?" * len(chunk))
+        cursor.execute(query + f" AND u.dialog_id IN ({placeholders}) ORDER BY u.id", chunk)
+        rows.extend(cursor.fetchall())
+    return rows
+
+
+def resume_unfinished(cursor, writer, encode_batch, log=print):
+    """Доделывает батчи, прерванные сбоем прошлого запуска.
+
+    Args:
+        cursor: Курсор для чтения БД.
+        writer: Запущенный DBWriter.
+        encode_batch: Функция list[str] -> (BLOB-ы эмбеддингов, строки кэша) или None.
+        log: Функция логирования.
+
+    Returns:
+        Число батчей, доведённых до encoded.
+    """
+    resumed = 0
+    for entry in unfinished_batches(cursor):
+        batch = {"batch_id": entry["batch_id"], "moves": entry["moves"]}
+        if entry["state"] == STATE_STORED:
+            missing = missing_embeddings(cursor, entry["dialog_ids"])
+            if missing:
+                encoded = encode_batch([text for _, text in missing])
+                if encoded is None:
+                    log(f"  ❌ Батч {entry['batch_id']}: эмбеддинги снова не получены, файлы остаются в Input.")
+                    continue
+                blobs, cache_rows = encoded
+                batch["embeddings"] = [(uid, blob) for (uid, _), blob in zip(missing, blobs)]
+                batch["cache"] = cache_rows
+            batch["journal_state"] = [state_update(entry["batch_id"], STATE_ENCODED)]
+            log(f"  🔁 Батч {entry['batch_id']}: дописано эмбеддингов {len(missing)}.")
+            resumed += 1
+        writer.submit(batch)
+    writer.flush()
+    return resumed
+
+
+def encoded_batches(cursor):
+    """(batch_id, dialog_ids) закодированных, но ещё не проиндексированных батчей."""
+    cursor.execute("SELECT batch_id, dialog_ids FROM ingest_journal WHERE state = ? ORDER BY created_at", (STATE_ENCODED,))
+    return [(batch_id, json.loads(dialog_ids)) for batch_id, dialog_ids in cursor.fetchall()]
+
+
+def mark_batches_indexed(conn, batch_ids):
+    """Переводит указанные батчи в indexed (инкрементальное добавление в индекс)."""
+    now = datetime.now().isoformat()
+    with conn:
+        conn.executemany(
+            "UPDATE ingest_journal SET state = ?, updated_at = ? WHERE batch_id = ? AND state = ?",
+            [(STATE_INDEXED, now, batch_id, STATE_ENCODED) for batch_id in batch_ids]
+        )
+
+
+def mark_indexed(conn, theme, built_from):
+    """Переводит в indexed закодированные батчи темы, попавшие в индекс.
+
+    Args:
+        built_from: Время (isoformat) начала чтения эмбеддингов для индекса;
+            батчи, закодированные позже, в индекс не вошли.
+    """
+    with conn:
+        conn.execute(
+            "UPDATE ingest_journal SET state = ?, updated_at = ? WHERE state = ? AND theme = ? AND updated_at <= ?",
+            (STATE_INDEXED, datetime.now().isoformat(), STATE_ENCODED, theme, built_from)
+        )
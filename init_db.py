@@ -1,6 +1,7 @@
 import sqlite3
 import os
 import config
+from dialog_metadata import ensure_dialog_metadata
 
 
 def init_db(db_path: str | None = None):
@@ -20,7 +21,12 @@ def init_db(db_path: str | None = None):
             text TEXT NOT NULL,
             metadata TEXT NOT NULL,
             source_theme TEXT NOT NULL,
-            processed_at TEXT NOT NULL
+            processed_at TEXT NOT NULL,
+            call_datetime TEXT,
+            operator_login TEXT,
+            client_number TEXT,
+            dialog_type TEXT,
+            participants TEXT
         );
         """,
 
@@ -56,7 +62,10 @@ def init_db(db_path: str | None = None):
             theme TEXT PRIMARY KEY,
             index_path TEXT NOT NULL,
             ids_path TEXT NOT NULL,
-            built_at TEXT NOT NULL
+            built_at TEXT NOT NULL,
+            index_type TEXT,
+            search_params TEXT,
+            indexed_rowid INTEGER
         );
         """,
 
@@ -108,11 +117,69 @@ def init_db(db_path: str | None = None):
             query_hash TEXT PRIMARY KEY,
             results TEXT NOT NULL
         );
+        """,
+
+        """
+        CREATE TABLE IF NOT EXISTS file_manifest (
+            path TEXT PRIMARY KEY,
+            theme TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            mtime REAL NOT NULL,
+            md5 TEXT NOT NULL,
+            status TEXT NOT NULL,
+            recorded_at TEXT NOT NULL
+        );
+        """,
+
+        """
+        CREATE INDEX IF NOT EXISTS idx_file_manifest_theme_md5 ON file_manifest(theme, md5);
+        """,
+
+        """
+        CREATE TABLE IF NOT EXISTS embedding_cache (
+            model TEXT NOT NULL,
+            text_hash TEXT NOT NULL,
+            vector BLOB NOT NULL,
+            PRIMARY KEY (model, text_hash)
+        );
+        """,
+
+        """
+        CREATE TABLE IF NOT EXISTS ingest_journal (
+            batch_id TEXT PRIMARY KEY,
+            theme TEXT NOT NULL,
+            state TEXT NOT NULL,
+            dialog_ids TEXT NOT NULL,
+            moves TEXT NOT NULL,
+            files_moved INTEGER NOT NULL DEFAULT 0,
+            error TEXT,
+            created_at TEXT NOT NULL,
+            updated_at TEXT NOT NULL
+        );
+        """,
+
+        """
+        CREATE INDEX IF NOT EXISTS idx_ingest_journal_state ON ingest_journal(state, theme);
+        """,
+
+        """
+        CREATE TABLE IF NOT EXISTS pipeline_runs (
+            run_id TEXT PRIMARY KEY,
+            started_at TEXT NOT NULL,
+            finished_at TEXT NOT NULL,
+            status TEXT NOT NULL,
+            wall_seconds REAL NOT NULL,
+            dialogs INTEGER NOT NULL,
+            utterances INTEGER NOT NULL,
+            record TEXT NOT NULL
+        );
         """
     ]
 
     for sql in tables_sql:
         cursor.execute(sql)
+    # Колонки метаданных в БД, созданной до их появления, индексы по ним и заполнение из JSON
+    ensure_dialog_metadata(conn)
 
     conn.commit()
     conn.close()
@@ -0,0 +1,32 @@
+"""Усечение эмбеддингов по Matryoshka.
+
+Qwen3-Embedding обучена так, что первые d компонент вектора сами являются
+эмбеддингом размерности d. Векторы усекаются до EMBEDDING_OUTPUT_DIMENSION
+перед записью в БД и повторно L2-нормализуются; размерность каждого вектора
+записана в его заголовке (vector_codec). Кэш эмбеддингов хранит полные
+векторы, поэтому смена размерности не требует повторного кодирования.
+Потерю полноты поиска оценивает benchmark_matryoshka.py.
+"""
+
+import numpy as np
+
+import config
+
+
+def output_dimension() -> int:
+    """Размерность векторов в БД и индексах."""
+    return config.EMBEDDING_OUTPUT_DIMENSION or config.EMBEDDING_MODEL_DIMENSION
+
+
+def truncate_embeddings(vectors, dim=None) -> np.ndarray:
+    """Первые dim компонент (по умолчанию output_dimension()) с L2-нормализацией.
+
+    Векторы не длиннее dim возвращаются без изменений (float32).
+    """
+    matrix = np.asarray(vectors, dtype=np.float32)
+    dim = dim or output_dimension()
+    if matrix.shape[-1] <= dim:
+        return matrix
+    matrix = matrix[..., :dim]
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
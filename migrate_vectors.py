@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""Миграция векторов в БД на формат vector_codec.
+
+Конвертирует BLOB-ы старых форматов:
+  - pickle.dumps(ndarray) (pipeline.py до перехода на vector_codec);
+  - "сырой" float32 tobytes() без заголовка (OptimizedEmbeddingProcessor, embedding_cache).
+
+Миграция идёт порциями по rowid с commit после каждой порции, уже
+сконвертированные строки пропускаются — поэтому прерванный запуск можно
+просто повторить. Pickle читается ограниченным unpickler-ом, который
+допускает только классы numpy, нужные для восстановления массива.
+
+Запуск:
+    python migrate_vectors.py [--batch-size N] [--dry-run]
+"""
+
+import io
+import sys
+import pickle
+import sqlite3
+import argparse
+
+import numpy as np
+
+import config
+from vector_codec import encode_vector, is_encoded
+
+# Таблицы с колонкой vector
+VECTOR_TABLES = ("utterance_embeddings", "embeddings", "embedding_cache")
+
+# Всё, что нужно pickle для восстановления ndarray/скаляров numpy 1.x и 2.x
+ALLOWED_PICKLE_GLOBALS = {
+    ("numpy", "ndarray"),
+    ("numpy", "dtype"),
+    ("numpy.core.multiarray", "_reconstruct"),
+    ("numpy.core.multiarray", "scalar"),
+    ("numpy._core.multiarray", "_reconstruct"),
+    ("numpy._core.multiarray", "scalar"),
+}
+
+
+class VectorUnpickler(pickle.Unpickler):
+    """Unpickler, который не загружает ничего, кроме массивов numpy."""
+
+    def find_class(self, module, name):
+        if (module, name) in ALLOWED_PICKLE_GLOBALS:
+            return super().find_class(module, name)
+        raise pickle.UnpicklingError(f"Запрещённый объект в pickle: {module}.{name}")
+
+
+def decode_legacy(blob, dim):
+    """Вектор float32 из BLOB старого формата или None, если формат не распознан."""
+    if blob[:1] == b"\x80":
+        try:
+            vector = np.asarray(VectorUnpickler(io.BytesIO(blob)).load(), dtype=np.float32).ravel()
+            if vector.shape[0] == dim:
+                return vector
+        except Exception:
+            pass
+    # "Сырой" float32 (может случайно начинаться с байта 0x80)
+    if len(blob) == dim * 4:
+        return np.frombuffer(blob, dtype="<f4")
+    return None
+
+
+def table_exists(conn, table):
+    row = conn.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?", (table,)).fetchone()
+    return row is not None
+
+
+def migrate_table(conn, table, dim, dtype, batch_size, dry_run=False):
+    """Конвертирует одну таблицу. Возвращает (converted, skipped, failed)."""
+    converted = skipped = failed = 0
+    last_rowid = -1
+    while True:
+        rows = conn.execute(
+            f"SELECT rowid, vector FROM {table} WHERE rowid > ? ORDER BY rowid LIMIT ?",
+            (last_rowid, batch_size)
+        ).fetchall()
+        if not rows:
+            break
+        last_rowid = rows[-1][0]
+
+        updates = []
+        for rowid, blob in rows:
+            if is_encoded(blob):
+                skipped += 1
+                continue
+            vector = decode_legacy(blob, dim)
+            if vector is None:
+                failed += 1
+                continue
+            updates.append((encode_vector(vector, dtype), rowid))
+
+        if updates and not dry_run:
+            conn.executemany(f"UPDATE {table} SET vector = ? WHERE rowid = ?", updates)
+            conn.commit()
+        converted += len(updates)
+        print(f"\r  {table}: сконвертировано {converted}, уже в новом формате {skipped}, не распознано {failed}", end="")
+    print()
+    return converted, skipped, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Миграция векторов в формат vector_codec")
+    parser.add_argument("--batch-size", type=int, default=5000, help="Строк за одну транзакцию")
+    parser.add_argument("--dry-run", action="store_true", help="Только подсчитать, ничего не записывать")
+    args = parser.parse_args()
+
+    dim = config.EMBEDDING_MODEL_DIMENSION
+    dtype = config.EMBEDDING_STORAGE_DTYPE
+    print(f"🔄 Миграция векторов в {config.DATABASE_PATH} (размерность {dim}, хранение {dtype})")
+
+    conn = sqlite3.connect(config.DATABASE_PATH)
+    total_failed = 0
+    try:
+        for table in VECTOR_TABLES:
+            if not table_exists(conn, table):
+                continue
+            _converted, _skipped, failed = migrate_table(conn, table, dim, dtype, args.batch_size, args.dry_run)
+            total_failed += failed
+    finally:
+        conn.close()
+
+    if total_failed:
+        print(f"⚠️ Не удалось распознать {total_failed} векторов — они оставлены как есть и будут пропущены индексатором.")
+        return 1
+    print("✅ Миграция завершена." if not args.dry_run else "✅ Проверка завершена (--dry-run).")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -10,6 +10,12 @@ import sqlite3
 from pathlib import Path
 import config
 from utils import get_db_connection
+from embedding_cache import EmbeddingCache, model_key
+from embedding_backend import load_sentence_transformer, resolve_backend, cache_model_name
+from vector_codec import encode_vector
+from matryoshka import truncate_embeddings
+from adaptive_batcher import AdaptiveBatcher, encode_texts
+from encoding_pool import EncodingPool
 import time
 
 logger = logging.getLogger(__name__)
@@ -17,7 +23,7 @@ logger = logging.getLogger(__name__)
 class OptimizedEmbeddingProcessor:
     """Оптимизированный процессор эмбеддингов с использованием GPU и батчевой обработки."""
     
-    def __init__(self, model_name: str = None, batch_size: int = 32, max_length: int = 2048):
+    def __init__(self, model_name: str = None, batch_size: int = 32, max_length: int = 2048, encode_workers: int = None):
         """
         Инициализация процессора.
         
@@ -25,16 +31,21 @@ class OptimizedEmbeddingProcessor:
             model_name: Название модели (по умолчанию из config)
             batch_size: Размер батча для обработки
             max_length: Максимальная длина последовательности
+            encode_workers: Процессов кодирования на CPU (по умолчанию PIPELINE_ENCODE_WORKERS)
         """
         self.model_name = model_name or config.EMBEDDING_MODEL_NAME
         self.batch_size = batch_size
         self.max_length = max_length
+        self.encode_workers = config.PIPELINE_ENCODE_WORKERS if encode_workers is None else encode_workers
         self.model = None
+        self.pool = None
         self.device = None
         self.conn = None
         
         # Определяем оптимальное устройство
         self._setup_device()
+        # Размер батча кодирования определяется бюджетом токенов по пику памяти
+        self.batcher = AdaptiveBatcher(self.device)
         
     def _setup_device(self):
         """Настройка устройства для обработки."""
@@ -54,9 +65,9 @@ class OptimizedEmbeddingProcessor:
             try:
                 logger.info(f"🔄 Загрузка модели {self.model_name} на {self.device}...")
                 
-                # Загружаем модель с оптимизацией памяти
-                self.model = SentenceTransformer(
-                    self.model_name, 
+                # Загружаем модель с оптимизацией памяти (на CPU — по возможности ONNX Runtime)
+                self.model = load_sentence_transformer(
+                    self.model_name,
                     device=self.device,
                     cache_folder='./model_cache'  # Кэш для модели
                 )
@@ -74,7 +85,7 @@ class OptimizedEmbeddingProcessor:
                     # Очищаем кэш после загрузки
                     torch.cuda.empty_cache()
                 
-                logger.info(f"✅ Модель загружена успешно на {self.device}")
+                logger.info(f"✅ Модель загружена успешно на {self.device} (бэкенд {resolve_backend(self.device)})")
                 
             except Exception as e:
                 logger.error(f"❌ Ошибка загрузки модели: {e}")
@@ -87,8 +98,19 @@ class OptimizedEmbeddingProcessor:
                 else:
                     raise e
     
+    def _get_pool(self):
+        """Пул процессов кодирования (только на CPU и при encode_workers > 0)."""
+        if self.device != "cpu" or self.encode_workers <= 0:
+            return None
+        if self.pool is None:
+            self.pool = EncodingPool(self.encode_workers, model_name=self.model_name, max_length=self.max_length)
+        return self.pool
+    
     def _unload_model(self):
         """Выгрузка модели из памяти."""
+        if self.pool is not None:
+            self.pool.close()
+            self.pool = None
         if self.model is not None:
             del self.model
             self.model = None
@@ -129,42 +151,34 @@ class OptimizedEmbeddingProcessor:
         if not texts:
             return np.array([])
         
-        # Загружаем модель если нужно
-        self._load_model_lazy()
+        # На CPU тексты кодирует пул процессов, иначе — модель в этом процессе
+        pool = self._get_pool()
+        if pool is None:
+            self._load_model_lazy()
         
         try:
             self._log_memory_usage("Начало обработки батча")
             
-            # Обрабатываем батчами
-            all_embeddings = []
-            
-            for i in range(0, len(texts), self.batch_size):
-                batch_texts = texts[i:i + self.batch_size]
-                
-                logger.info(f"🔄 Обработка батча {i//self.batch_size + 1}/{(len(texts) + self.batch_size - 1)//self.batch_size}")
-                
-                # Обрабатываем батч
-                batch_embeddings = self.model.encode(
-                    batch_texts,
-                    batch_size=min(self.batch_size, len(batch_texts)),
-                    show_progress_bar=False,
+            if pool is not None:
+                embeddings = pool.encode(texts, convert_to_numpy=True, normalize_embeddings=True)
+            else:
+                # Батчи по бюджету токенов: короткие тексты идут большими батчами,
+                # длинные — малыми; бюджет подстраивается по пику памяти
+                embeddings = encode_texts(
+                    self.model,
+                    texts,
+                    self.batcher,
+                    log=logger.info,
                     convert_to_numpy=True,
                     normalize_embeddings=True  # Нормализуем для лучшего качества
                 )
-                
-                all_embeddings.append(batch_embeddings)
-                
-                # Очищаем промежуточные данные
-                del batch_embeddings
-                gc.collect()
-                
-                if self.device == "cuda":
-                    torch.cuda.empty_cache()
-                
-                self._log_memory_usage(f"После батча {i//self.batch_size + 1}")
+            if embeddings is None:
+                raise MemoryError("Не удалось закодировать тексты даже по одному (OOM)")
             
-            # Объединяем все эмбеддинги
-            result = np.vstack(all_embeddings)
+            result = np.vstack(embeddings)
+            
+            if self.device == "cuda":
+                torch.cuda.empty_cache()
             
             self._log_memory_usage("Завершение обработки")
             
@@ -178,6 +192,9 @@ class OptimizedEmbeddingProcessor:
         """
         Обработка диалогов батчами.
         
+        Кодирует полный текст диалога — дорого; векторы диалогов для GUI
+        собираются из векторов реплик (dialog_vectors.build_dialog_vectors).
+        
         Args:
             dialog_ids: Список ID диалогов
             conn: Соединение с БД
@@ -194,8 +211,9 @@ class OptimizedEmbeddingProcessor:
         results = {}
         
         try:
-            # Загружаем модель
-            self._load_model_lazy()
+            # Модель в этом процессе нужна, только если нет пула кодирования
+            if self._get_pool() is None:
+                self._load_model_lazy()
             
             for i in range(0, len(dialog_ids), self.batch_size):
                 batch_ids = dialog_ids[i:i + self.batch_size]
@@ -261,10 +279,13 @@ class OptimizedEmbeddingProcessor:
         
         cursor = conn.cursor()
         results = {}
+        # Векторы нормализованы, поэтому ключ кэша отличается от pipeline
+        cache = EmbeddingCache(conn, model_key(cache_model_name(self.device, self.model_name), normalized=True))
         
         try:
-            # Загружаем модель
-            self._load_model_lazy()
+            # Модель в этом процессе нужна, только если нет пула кодирования
+            if self._get_pool() is None:
+                self._load_model_lazy()
             
             for i in range(0, len(utterance_ids), self.batch_size):
                 batch_ids = utterance_ids[i:i + self.batch_size]
@@ -287,8 +308,9 @@ class OptimizedEmbeddingProcessor:
                 batch_texts = [text for _, text in batch_data]
                 batch_utterance_ids = [utterance_id for utterance_id, _ in batch_data]
                 
-                # Обрабатываем эмбеддинги
-                batch_embeddings = self.process_texts_batch(batch_texts)
+                # Обрабатываем эмбеддинги (повторяющиеся тексты берутся из кэша)
+                batch_embeddings = cache.encode(batch_texts, self.process_texts_batch)
+                conn.commit()
                 
                 # Сохраняем результаты
                 for j, utterance_id in enumerate(batch_utterance_ids):
@@ -303,6 +325,7 @@ class OptimizedEmbeddingProcessor:
                 
                 self._log_memory_usage(f"После обработки батча {i//self.batch_size + 1}")
             
+            logger.info(f"♻️ Из кэша эмбеддингов: {cache.hits} реплик, закодировано: {cache.misses}")
             return results
             
         except Exception as e:
@@ -333,8 +356,8 @@ class OptimizedEmbeddingProcessor:
             # Подготавливаем данные для вставки
             data_to_insert = []
             for item_id, embedding in embeddings.items():
-                # Конвертируем в bytes для хранения в БД
-                embedding_bytes = embedding.astype(np.float32).tobytes()
+                # Конвертируем в bytes для хранения в БД (формат vector_codec)
+                embedding_bytes = encode_vector(truncate_embeddings(embedding), config.EMBEDDING_STORAGE_DTYPE)
                 data_to_insert.append((item_id, embedding_bytes))
             
             # Вставляем батчами
@@ -362,20 +385,8 @@ class OptimizedEmbeddingProcessor:
             raise e
     
     def get_optimal_batch_size(self) -> int:
-        """Определение оптимального размера батча для текущей конфигурации."""
-        if self.device == "cuda":
-            # Для RTX 3060 12GB оптимальный размер батча
-            gpu_memory = torch.cuda.get_device_properties(0).total_memory / 1024**3
-            
-            if gpu_memory >= 12:  # RTX 3060 12GB
-                return 64
-            elif gpu_memory >= 8:  # RTX 3070/3080 8GB
-                return 32
-            else:  # Меньше памяти
-                return 16
-        else:
-            # Для CPU
-            return 16
+        """Сколько текстов максимальной длины помещается в выученный бюджет токенов."""
+        return self.batcher.batch_size_for(self.max_length)
     
     def __del__(self):
         """Деструктор для очистки ресурсов."""
@@ -1,12 +1,18 @@
 """Обработка RTF-файлов, извлечение текста/метаданных, кодирование (sentence-transformers GPU batch) и сохранение в SQLite.
    ОБНОВЛЕНО: теперь сохраняет реплики (utterances) и их эмбеддинги отдельно.
    + Динамический батч, TF32, логирование, автоочистка, PYTORCH_CUDA_ALLOC_CONF.
+   + Парсинг RTF в пуле процессов параллельно с кодированием (ограниченная очередь).
+   + Многозвонковые экспорты "Rtf export, N call(s)" сохраняются как N диалогов.
+   + Кодирование микробатчами по длине в токенах; бюджет токенов подстраивается по пику памяти (adaptive_batcher).
+   + Кэш эмбеддингов по содержимому: повторяющиеся реплики кодируются один раз.
+   + Запись в SQLite в отдельном потоке (db_writer, WAL): одна транзакция на батч.
+   + Журнал ingest_journal: после сбоя дописываются только недостающие эмбеддинги, без повторного разбора.
+   + На CPU кодирование можно распределить по пулу процессов с привязкой к ядрам (encoding_pool).
 """
 
 import os
 import json
 import sqlite3
-import hashlib
 import logging
 from datetime import datetime
 from pathlib import Path
@@ -24,8 +30,28 @@ import torch
 torch.backends.cuda.matmul.allow_tf32 = True
 torch.backends.cudnn.allow_tf32 = True
 
-# === Для обработки RTF ===
-from striprtf.striprtf import rtf_to_text
+# === Парсинг RTF (выполняется в пуле процессов) ===
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from dialog_parser import (
+    hash_file,
+    extract_metadata_from_filename,
+    clean_dialog_text_no_filter,
+    iter_dialog_records,
+    iter_parsed_files,
+)
+from embedding_cache import EmbeddingCache, model_key, CREATE_TABLE_SQL as EMBEDDING_CACHE_TABLE_SQL
+from embedding_backend import load_sentence_transformer, resolve_backend, cache_model_name
+from vector_codec import encode_vector
+from matryoshka import truncate_embeddings
+from adaptive_batcher import AdaptiveBatcher, encode_texts
+from encoding_pool import EncodingPool
+from db_writer import DBWriter, open_connection, existing_ids, chunked
+import ingest_journal
+from ingest_journal import journal_row, state_update, pending_sources, resume_unfinished
+from dialog_metadata import dialog_columns, ensure_dialog_metadata
+import pipeline_metrics
+from pipeline_metrics import RunMetrics
 
 # === Импорт конфигурации ===
 import config
@@ -83,6 +109,34 @@ def ensure_db_initialized():
             );
         """)
         
+        # Манифест файлов: заменяет повторное хеширование папки processed
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS file_manifest (
+                path TEXT PRIMARY KEY,
+                theme TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                mtime REAL NOT NULL,
+                md5 TEXT NOT NULL,
+                status TEXT NOT NULL,
+                recorded_at TEXT NOT NULL
+            );
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_file_manifest_theme_md5 ON file_manifest(theme, md5);")
+        
+        # Кэш эмбеддингов по (модель, хеш текста)
+        cursor.execute(EMBEDDING_CACHE_TABLE_SQL)
+        
+        # Журнал состояний батчей для возобновления после сбоя
+        cursor.execute(ingest_journal.CREATE_TABLE_SQL)
+        cursor.execute(ingest_journal.CREATE_INDEX_SQL)
+        
+        # Замеры этапов по запускам
+        cursor.execute(pipeline_metrics.CREATE_TABLE_SQL)
+        
+        # Типизированные колонки метаданных: в старой БД — добавить и заполнить из JSON
+        # (даже если колонки уже добавил init_db из GUI)
+        ensure_dialog_metadata(conn)
+        
         conn.commit()
         conn.close()
         log_to_file_only("✅ Структура БД и таблиц utterances/utterance_embeddings в порядке.")
@@ -92,131 +146,191 @@ def ensure_db_initialized():
         raise e
 
 # === Загрузка модели sentence-transformers ===
+def select_device():
+    """EMBEDDING_MODEL_DEVICE, либо CPU, если CUDA недоступна."""
+    return torch.device(config.EMBEDDING_MODEL_DEVICE if torch.cuda.is_available() or config.EMBEDDING_MODEL_DEVICE != "cuda" else "cpu")
+
 def load_embedding_model():
     log_to_file_only(f"Загрузка модели {config.EMBEDDING_MODEL_NAME} на {config.EMBEDDING_MODEL_DEVICE}...")
     print(f"⏳ Загрузка модели {config.EMBEDDING_MODEL_NAME} на {config.EMBEDDING_MODEL_DEVICE}...")
     
-    device = torch.device(config.EMBEDDING_MODEL_DEVICE if torch.cuda.is_available() or config.EMBEDDING_MODEL_DEVICE != "cuda" else "cpu")
+    device = select_device()
+    
+    backend = resolve_backend(device)
     
     model_kwargs = {}
     if config.EMBEDDING_MODEL_PRECISION == "float16" and device.type == "cuda":
         model_kwargs["torch_dtype"] = torch.float16
         
-    model = SentenceTransformer(config.EMBEDDING_MODEL_NAME, device=str(device), model_kwargs=model_kwargs)
+    # Без GPU модель можно исполнять через ONNX Runtime (EMBEDDING_MODEL_BACKEND)
+    model = load_sentence_transformer(config.EMBEDDING_MODEL_NAME, device, backend, model_kwargs, log=log_to_file_only)
     model.max_seq_length = config.EMBEDDING_MODEL_MAX_LENGTH
+    precision = {"onnx": "float32", "onnx-int8": "int8"}.get(backend, config.EMBEDDING_MODEL_PRECISION)
     
-    log_to_file_only(f"✅ Модель загружена. Используется устройство: {device}, точность: {config.EMBEDDING_MODEL_PRECISION}")
-    print(f"✅ Модель загружена. Используется устройство: {device}, точность: {config.EMBEDDING_MODEL_PRECISION}")
+    log_to_file_only(f"✅ Модель загружена. Используется устройство: {device}, бэкенд: {backend}, точность: {precision}")
+    print(f"✅ Модель загружена. Используется устройство: {device}, бэкенд: {backend}, точность: {precision}")
     return model, device
 
-def hash_file(path: Path) -> str:
-    return hashlib.md5(path.read_bytes()).hexdigest()
-
-def extract_metadata_from_filename(filename_stem: str) -> dict:
-    import re
-    pattern = r'^(\d{4})(\d{2})(\d{2})(\d{2})(\d{2})(\d{2})_([A-Za-z0-9_]+)_([0-9]+)$'
-    match = re.match(pattern, filename_stem)
-    if match:
-        year, month, day, hour, minute, second, operator_login, client_number = match.groups()
-        if re.match(r'^\d{10,11}$', client_number):
-            return {
-                "date_from_filename": f"{year}-{month}-{day}",
-                "time_from_filename": f"{hour}:{minute}:{second}",
-                "operator_login_from_filename": operator_login,
-                "client_number_from_filename": client_number
-            }
-    return {}
-
-def clean_dialog_text_no_filter(text, file_metadata_from_name, file_id):
-    import re
-    from datetime import datetime
-    lines = [line.rstrip() for line in text.splitlines() if line.rstrip()]
-    if not lines:
-        return [], file_metadata_from_name
-    dialog_id = file_id
-    dialog_datetime = None
-    participants_line = None
-    participants = {}
-    dialog_type = "unknown"
-    for i, line in enumerate(lines):
-        id_datetime_match = re.match(r'^(\d+)\s*\((\d{2}\.\d{2}\.\d{4}\s\d{1,2}:\d{2}:\d{2})\)', line.strip())
-        if id_datetime_match:
-            dialog_id = id_datetime_match.group(1)
-            try:
-                dt_obj = datetime.strptime(id_datetime_match.group(2), '%d.%m.%Y %H:%M:%S')
-                dialog_datetime = dt_obj.isoformat()
-                dialog_type = "voice"
-            except ValueError:
-                pass
-            if i + 1 < len(lines):
-                participants_line = lines[i + 1].strip()
-                p_match = re.search(r'([A-Za-z0-9@._\-]+)\s*(->|<-)\s*([0-9a-fA-F\-]+)', participants_line)
-                if p_match:
-                    op_raw = p_match.group(1)
-                    arrow = p_match.group(2)
-                    client_raw = p_match.group(3)
-                    op_login = op_raw.split('@')[0] if '@' in op_raw else op_raw
-                    participants["operator_login"] = op_login
-                    participants["operator_raw"] = op_raw
-                    participants["arrow"] = arrow
-                    participants["client_id"] = client_raw
-                    if client_raw.isdigit() and len(client_raw) >= 10:
-                        participants["client_number"] = client_raw
-            break
-    if lines and "Rtf export" in lines[0] and "call(s)" in lines[0]:
-        dialog_type = "chat"
-    dialog_lines = []
-    i = 0
-    if participants_line:
-        try:
-            start_idx = lines.index(participants_line) + 1
-            i = start_idx
-        except ValueError:
-            i = 0
-    while i < len(lines):
-        line = lines[i]
-        if line.strip().lower() in ["rtf export, 1 call(s)", "порог чувствительности: 5,00 с"]:
-            i += 1
-            continue
-        if re.match(r'^\d+\s*\(\d{2}\.\d{2}\.\d{4}\s\d{1,2}:\d{2}:\d{2}\)', line.strip()) and i > 2:
-             break
-        time_match = re.search(r'\t(\d+:\d+:\d+)$', line)
-        line_text = line
-        line_time = None
-        if time_match:
-            line_time = time_match.group(1)
-            line_text = line[:time_match.start()].rstrip("\t")
-        line_text = line_text.strip()
-        if not line_text:
-            i += 1
-            continue
-        parts = line_text.split('\t', 1)
-        potential_speaker = parts[0].strip()
-        replica_text = parts[1].strip() if len(parts) > 1 else line_text
-        if potential_speaker and len(potential_speaker) < 100 and replica_text:
-            speaker = potential_speaker.split('@')[0] if '@' in potential_speaker else potential_speaker
-            time_str = f" [{line_time}]" if line_time else ""
-            dialog_lines.append(f"{speaker}: {replica_text}{time_str}")
-        elif dialog_lines and replica_text:
-            dialog_lines[-1] += f" {replica_text}"
-        else:
-             dialog_lines.append(line_text)
-        i += 1
-
-    final_metadata = file_metadata_from_name.copy()
-    final_metadata.update({
-        "dialog_id": dialog_id,
-        "dialog_datetime": dialog_datetime,
-        "participants_raw": participants_line,
-        "dialog_type": dialog_type,
-        "participants": participants
-    })
-    return dialog_lines, final_metadata  # Возвращаем список реплик
+# === Манифест обработанных файлов ===
+def bootstrap_manifest(cursor, theme_name, theme_proc_path):
+    """Строки манифеста для файлов, обработанных до его появления.
+
+    Возвращает строки только для темы без записей в манифесте, поэтому архив
+    processed/<тема> хешируется не больше одного раза.
+    """
+    cursor.execute("SELECT 1 FROM file_manifest WHERE theme = ? LIMIT 1", (theme_name,))
+    if cursor.fetchone() is not None:
+        return []
+    rows = []
+    for p in theme_proc_path.glob("*.rtf"):
+        stat = p.stat()
+        rows.append((str(p), theme_name, stat.st_size, stat.st_mtime, hash_file(p), "processed", datetime.now().isoformat()))
+    if rows:
+        log_to_file_only(f"🗂️ Манифест темы '{theme_name}' заполнен по архиву processed: {len(rows)} файлов.")
+    return rows
+
+def load_known_files(cursor, theme_name, paths) -> set:
+    """(путь, размер, mtime) из манифеста для файлов paths — для проверки без чтения содержимого.
+
+    Ищутся только файлы, лежащие сейчас в Input (по первичному ключу path,
+    порциями), а не вся история темы: время запуска не растёт с манифестом.
+    """
+    found = set()
+    for chunk in chunked([str(path) for path in paths]):
+        placeholders = ",".join("?" * len(chunk))
+        cursor.execute(
+            f"SELECT path, size, mtime FROM file_manifest WHERE path IN ({placeholders}) AND theme = ?",
+            [*chunk, theme_name]
+        )
+        found.update(cursor.fetchall())
+    return found
+
+def is_known_file(known_files, path: Path) -> bool:
+    """Файл уже встречался с тем же путём, размером и mtime."""
+    stat = path.stat()
+    return (str(path), stat.st_size, stat.st_mtime) in known_files
+
+def known_contents(cursor, theme_name, md5s) -> set:
+    """Какие из md5 уже обработаны в этой теме (одним запросом на порцию)."""
+    md5s = list(md5s)
+    found = set()
+    for chunk in chunked(md5s):
+        placeholders = ",".join("?" * len(chunk))
+        cursor.execute(
+            f"SELECT md5 FROM file_manifest WHERE theme = ? AND status != 'duplicate' AND md5 IN ({placeholders})",
+            [theme_name, *chunk]
+        )
+        found.update(row[0] for row in cursor.fetchall())
+    return found
+
+def manifest_row(path: Path, theme_name, parsed, status):
+    return (str(path), theme_name, parsed["size"], parsed["mtime"], parsed["md5"], status, datetime.now().isoformat())
 
 # === Основная логика обработки ===
+def create_parse_executor():
+    """Пул процессов для парсинга RTF. None — парсинг в текущем процессе."""
+    workers = config.PIPELINE_PARSE_WORKERS
+    if workers <= 0:
+        return None
+    executor = ProcessPoolExecutor(max_workers=workers)
+    # Первый submit запускает рабочие процессы — делаем это до загрузки модели,
+    # чтобы при fork они не наследовали CUDA-контекст
+    executor.submit(int).result()
+    log_to_file_only(f"⚙️ Пул парсинга RTF: {workers} процессов, очередь {config.PIPELINE_PARSE_QUEUE_SIZE} файлов.")
+    return executor
+
+def create_encoding_pool(device):
+    """Пул процессов кодирования на CPU. None — кодирование в текущем процессе."""
+    if config.PIPELINE_ENCODE_WORKERS <= 0 or device.type != "cpu":
+        return None
+    return EncodingPool(log=log_to_file_only)
+
+def make_batch_encoder(MODEL, device, embedding_cache, batcher, pool=None, metrics=None):
+    """Функция list[str] -> (BLOB-ы эмбеддингов, строки кэша для записи) или None.
+
+    С пулом (pool) промахи кэша кодируются в процессах пула, MODEL не используется.
+    В metrics кодирование промахов кэша — этап encode, упаковка векторов — pack_vectors.
+    """
+    metrics = metrics or RunMetrics()
+    if pool is not None:
+        encode_misses = pool.encode
+    else:
+        encode_misses = lambda misses: encode_texts(MODEL, misses, batcher, log=log_to_file_only, convert_to_tensor=False, device=device)
+
+    def timed_encode(misses):
+        with metrics.stage("encode", items=len(misses)):
+            return encode_misses(misses)
+
+    def encode_batch(texts):
+        hits_before = embedding_cache.hits
+        embeddings = embedding_cache.encode(texts, timed_encode)
+        if device.type == "cuda":
+            torch.cuda.empty_cache()
+            gc.collect()
+        if embeddings is None:
+            return None
+        log_to_file_only(f"  ♻️ Из кэша эмбеддингов: {embedding_cache.hits - hits_before} из {len(texts)} реплик")
+        # Кэш хранит полные векторы, в БД — усечённые до EMBEDDING_OUTPUT_DIMENSION
+        with metrics.stage("pack_vectors", items=len(texts)):
+            blobs = [encode_vector(emb, config.EMBEDDING_STORAGE_DTYPE) for emb in truncate_embeddings(embeddings)]
+        return blobs, embedding_cache.take_pending()
+    return encode_batch
+
+def iter_batches(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
 def process_thematic_folders():
     ensure_db_initialized()
-    MODEL, device = load_embedding_model()
+    executor = create_parse_executor()
+    pool = None
+    try:
+        pool = create_encoding_pool(select_device())
+        _process_thematic_folders(executor, pool)
+    finally:
+        if pool is not None:
+            pool.close()
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+def _process_thematic_folders(executor, pool=None):
+    run_id = datetime.now().strftime("%Y%m%d%H%M%S%f")
+    metrics = RunMetrics(run_id)
+    # Бюджет токенов учится по пику памяти и сохраняется между батчами и темами
+    batcher = AdaptiveBatcher(select_device())
+    status = "error"
+    try:
+        _process_run(executor, pool, metrics, batcher)
+        status = "ok"
+    finally:
+        record_run(metrics, status, batcher)
+
+def record_run(metrics, status, batcher=None):
+    """Сохраняет замеры запуска (JSON lines + pipeline_runs) и выводит итог по этапам."""
+    if batcher is not None and batcher.is_cuda and torch.cuda.is_available():
+        # Батчер сбрасывает счётчик пика перед каждым батчем — берём его максимум за запуск
+        peak = max(batcher.peak_bytes, torch.cuda.max_memory_allocated(batcher.device))
+        metrics.peak_gpu_mb = round(peak / (1024 * 1024), 1)
+    record = metrics.record(status)
+    try:
+        pipeline_metrics.save_run(record)
+    except Exception as e:
+        log_to_file_only(f"⚠️ Не удалось сохранить замеры запуска: {e}")
+    slowest = sorted(record["stages"].items(), key=lambda item: -item[1]["wall_s"])[:3]
+    msg = f"⏱️ Запуск {record['run_id']}: {record['wall_s']:.1f} с; дольше всего: " + ", ".join(
+        f"{name} {stage['wall_s']:.1f} с" for name, stage in slowest
+    ) + " (сравнение запусков: python pipeline_metrics.py)"
+    log_to_file_only(msg)
+    print(msg)
+
+def _process_run(executor, pool, metrics, batcher):
+    # С пулом кодирования модель загружают его процессы, основному она не нужна
+    with metrics.stage("model_load"):
+        MODEL, device = (None, select_device()) if pool is not None else load_embedding_model()
     
     log_to_file_only("🔍 Поиск тематических папок в Input...")
     theme_folders = [f for f in config.INPUT_ROOT.iterdir() if f.is_dir()]
@@ -231,182 +345,223 @@ def process_thematic_folders():
     log_to_file_only(msg)
     print(msg)
 
-    conn = sqlite3.connect(config.DATABASE_PATH)
+    # Основной поток только читает; всё пишет поток db_writer (WAL)
+    conn = open_connection(config.DATABASE_PATH, pragmas=())
     cursor = conn.cursor()
+    writer = DBWriter(config.DATABASE_PATH, config.PIPELINE_WRITER_QUEUE_SIZE, log=log_to_file_only, metrics=metrics).start()
+    # Повторяющиеся реплики ("Алло", "Да") кодируются один раз на весь корпус
+    embedding_cache = EmbeddingCache(conn, model_key(cache_model_name(device)), defer_writes=True)
+    encode_batch = make_batch_encoder(MODEL, device, embedding_cache, batcher, pool, metrics)
 
     total_new_dialogs = 0
+    # Отправленное писателю может быть ещё не записано — помним это в памяти
+    submitted_dialog_ids = set()
     
-    for theme_folder in theme_folders:
-        theme_name = theme_folder.name
-        msg = f"📂 Начало обработки темы: {theme_name}"
-        log_to_file_only(msg)
-        print(msg)
-        
-        theme_proc_path = config.PROCESSED_ROOT / theme_name
-        theme_proc_path.mkdir(parents=True, exist_ok=True)
-        
-        already_processed_files = {hash_file(p): p.stem for p in theme_proc_path.glob("*.rtf")}
-        files_to_process = [p for p in theme_folder.glob("*.rtf") if hash_file(p) not in already_processed_files]
-        
-        if not files_to_process:
-            msg = f"✅ Все файлы в '{theme_name}' уже обработаны."
+    try:
+        # Сначала доделываем батчи, прерванные прошлым запуском
+        with metrics.stage("resume"):
+            resumed = resume_unfinished(cursor, writer, encode_batch, log=log_to_file_only)
+        if resumed:
+            msg = f"🔁 Возобновлено прерванных батчей: {resumed}"
             log_to_file_only(msg)
             print(msg)
-            continue
+        for theme_folder in theme_folders:
+            total_new_dialogs += process_theme(
+                theme_folder, metrics.run_id, cursor, writer, encode_batch, executor, submitted_dialog_ids, metrics
+            )
+        with metrics.stage("writer_flush"):
+            writer.flush()
+    finally:
+        writer.close()
+        conn.close()
+        metrics.count("cache_hits", embedding_cache.hits)
+        metrics.count("cache_misses", embedding_cache.misses)
+        metrics.count("failed_batches", writer.failed_batches)
+
+    log_to_file_only(f"♻️ Кэш эмбеддингов: закодировано {embedding_cache.misses}, взято из кэша {embedding_cache.hits} реплик")
+    if writer.failed_batches:
+        log_to_file_only(f"⚠️ Не записано батчей: {writer.failed_batches} (их файлы остались в Input)")
+    final_msg = f"🏁 Завершена обработка всех тематических папок. Всего новых диалогов: {total_new_dialogs}"
+    log_to_file_only(final_msg)
+    print(final_msg)
+
+def process_theme(theme_folder, run_id, cursor, writer, encode_batch, executor, submitted_dialog_ids, metrics=None):
+    """Обрабатывает одну тематическую папку. Возвращает число новых диалогов.
 
-        msg = f"📁 Найдено {len(files_to_process)} новых файлов в '{theme_name}' для обработки."
+    Батч пишется двумя транзакциями: до кодирования — диалоги, реплики и
+    манифест (состояние stored), после — эмбеддинги и переход в encoded,
+    вслед за которым файлы переносятся в processed.
+    """
+    metrics = metrics or RunMetrics()
+    theme_name = theme_folder.name
+    msg = f"📂 Начало обработки темы: {theme_name}"
+    log_to_file_only(msg)
+    print(msg)
+    
+    theme_proc_path = config.PROCESSED_ROOT / theme_name
+    theme_proc_path.mkdir(parents=True, exist_ok=True)
+    
+    scan_started = metrics.clock()
+    bootstrap_rows = bootstrap_manifest(cursor, theme_name, theme_proc_path)
+    if bootstrap_rows:
+        writer.submit({"manifest": bootstrap_rows})
+        writer.flush()
+    # Файлы недоделанных батчей уже в БД — их не разбираем повторно
+    unfinished = pending_sources(cursor, theme_name)
+    candidates = [p for p in theme_folder.glob("*.rtf") if str(p) not in unfinished]
+    known_files = load_known_files(cursor, theme_name, candidates)
+    files_to_process = [p for p in candidates if not is_known_file(known_files, p)]
+    metrics.add_since("scan", scan_started, items=len(files_to_process))
+    metrics.count("files", len(files_to_process))
+    
+    if not files_to_process:
+        msg = f"✅ Все файлы в '{theme_name}' уже обработаны."
         log_to_file_only(msg)
+        print(msg)
+        return 0
+
+    msg = f"📁 Найдено {len(files_to_process)} новых файлов в '{theme_name}' для обработки."
+    log_to_file_only(msg)
 
-        BATCH_SIZE = config.PIPELINE_BATCH_SIZE
-        for i in tqdm(range(0, len(files_to_process), BATCH_SIZE), desc=f"Обработка '{theme_name}' (батчами по {BATCH_SIZE})", unit="батч"):
-            batch_files = files_to_process[i:i + BATCH_SIZE]
-            batch_dialogs_to_save = []
-            batch_utterances_to_save = []
-            batch_texts_to_encode = []
-            batch_ids_for_embeddings = []
+    new_dialogs = 0
+    submitted_md5s = set()
+    BATCH_SIZE = config.PIPELINE_BATCH_SIZE
+    parsed_files = iter_parsed_files(
+        files_to_process, theme_name, executor, config.PIPELINE_PARSE_QUEUE_SIZE,
+        observe=lambda ready: metrics.gauge("parse_ready", ready),
+    )
+    # Ожидание результатов пула парсинга (сам парсинг идёт в других процессах)
+    parsed_files = metrics.timed_iter("parse_wait", parsed_files)
+    total_batches = (len(files_to_process) + BATCH_SIZE - 1) // BATCH_SIZE
+    for batch_number, batch_results in enumerate(tqdm(iter_batches(parsed_files, BATCH_SIZE), total=total_batches, desc=f"Обработка '{theme_name}' (батчами по {BATCH_SIZE})", unit="батч")):
+        batch_id = f"{run_id}-{theme_name}-{batch_number:05d}"
+        batch_dialogs_to_save = []
+        batch_utterances_to_save = []
+        batch_texts_to_encode = []
+        batch_ids_for_embeddings = []
+        batch_manifest = []
+        batch_moves = []
+        
+        # Проверки существования — одним запросом на батч, а не на файл/диалог
+        with metrics.stage("dedup", items=len(batch_results)):
+            ok_results = [parsed for parsed in batch_results if not parsed["error"]]
+            known_md5s = known_contents(cursor, theme_name, {parsed["md5"] for parsed in ok_results}) | submitted_md5s
+            known_dialog_ids = existing_ids(
+                cursor, "dialogs", {dialog["dialog_id"] for parsed in ok_results for dialog in parsed["dialogs"]}
+            ) | submitted_dialog_ids
+        
+        # Этап 1: Приём разобранных файлов из пула
+        assemble_started = metrics.clock()
+        for parsed in batch_results:
+            file = Path(parsed["path"])
+            target = theme_proc_path / file.name
+            log_to_file_only(f"  📄 Обработка файла: {file.name}")
+            if parsed["error"]:
+                error_msg = f"  ❌ Ошибка при обработке файла {file.name}: {parsed['error']}"
+                log_to_file_only(error_msg)
+                print(error_msg)
+                if file.exists():
+                    batch_moves.append((file, target))
+                    if parsed.get("md5"):
+                        batch_manifest.append(manifest_row(target, theme_name, parsed, "error"))
+                continue
+            
+            if parsed["md5"] in known_md5s:
+                # Дубликат уже обработанного файла: остаётся в Input, но
+                # запоминается, чтобы в следующий раз не читать его повторно
+                log_to_file_only(f"  ⏭️ Файл {file.name} уже обработан ранее (совпадает содержимое).")
+                batch_manifest.append(manifest_row(file, theme_name, parsed, "duplicate"))
+                continue
+            known_md5s.add(parsed["md5"])
+            submitted_md5s.add(parsed["md5"])
             
-            # Этап 1: Обработка файлов
-            for file in batch_files:
-                try:
-                    log_to_file_only(f"  📄 Обработка файла: {file.name}")
-                    file_metadata = extract_metadata_from_filename(file.stem)
-                    file_metadata["source_theme"] = theme_name
-                    
-                    raw_text = rtf_to_text(file.read_text(encoding="utf-8", errors="ignore"))
-                    file_hash = hash_file(file)[:16]
-                    dialog_lines, dialog_metadata = clean_dialog_text_no_filter(raw_text, file_metadata, file_hash)
-                    
-                    final_metadata = file_metadata.copy()
-                    final_metadata.update(dialog_metadata)
-                    dialog_id = final_metadata.get("dialog_id", file_hash)
-                    
-                    cursor.execute("SELECT id FROM dialogs WHERE id = ?", (dialog_id,))
-                    if cursor.fetchone() is None:
-                        # Сохраняем диалог
-                        batch_dialogs_to_save.append({
-                            "id": dialog_id,
-                            "text": "\n".join(dialog_lines),
-                            "metadata": json.dumps(final_metadata, ensure_ascii=False),
-                            "source_theme": theme_name,
-                            "processed_at": datetime.now().isoformat()
-                        })
-                        total_new_dialogs += 1
-                        
-                        # Сохраняем каждую реплику
-                        for idx, line in enumerate(dialog_lines):
-                            if ": " in line:
-                                speaker_part, text_part = line.split(": ", 1)
-                                if " [" in text_part:
-                                    text_part = text_part.split(" [")[0]
-                            else:
-                                speaker_part = "Unknown"
-                                text_part = line
-                            
-                            utterance_id = f"{dialog_id}_u{idx+1:03d}"
-                            batch_utterances_to_save.append({
-                                "id": utterance_id,
-                                "dialog_id": dialog_id,
-                                "speaker": speaker_part,
-                                "text": text_part,
-                                "turn_order": idx + 1
-                            })
-                            batch_texts_to_encode.append(text_part)
-                            batch_ids_for_embeddings.append(utterance_id)
-                    
-                    # Перемещаем файл только после успешной подготовки данных
-                    file.rename(theme_proc_path / file.name)
-                        
-                except Exception as e:
-                    error_msg = f"  ❌ Ошибка при обработке файла {file.name}: {e}"
-                    log_to_file_only(error_msg)
-                    print(error_msg)
-                    if file.exists():
-                        file.rename(theme_proc_path / file.name)
-
-            # Этап 2: Сохранение диалогов
-            if batch_dialogs_to_save:
-                try:
-                    cursor.executemany("""
-                        INSERT INTO dialogs (id, text, metadata, source_theme, processed_at)
-                        VALUES (:id, :text, :metadata, :source_theme, :processed_at)
-                    """, batch_dialogs_to_save)
-                    conn.commit()
-                except Exception as e:
-                    log_to_file_only(f"  ❌ Ошибка при сохранении диалогов: {e}")
-                    conn.rollback()
-
-            # Этап 3: Сохранение реплик
-            if batch_utterances_to_save:
-                try:
-                    cursor.executemany("""
-                        INSERT INTO utterances (id, dialog_id, speaker, text, turn_order)
-                        VALUES (:id, :dialog_id, :speaker, :text, :turn_order)
-                    """, batch_utterances_to_save)
-                    conn.commit()
-                except Exception as e:
-                    log_to_file_only(f"  ❌ Ошибка при сохранении реплик: {e}")
-                    conn.rollback()
-
-            # === ЛОГИРОВАНИЕ ДЛИН РЕПЛИК ===
-            if batch_texts_to_encode:
-                lengths = [len(text) for text in batch_texts_to_encode]
-                log_to_file_only(f"  📏 Длины реплик: max={max(lengths)}, avg={sum(lengths)/len(lengths):.1f}")
-
-            # Этап 4: Кодирование и сохранение эмбеддингов реплик
-            if batch_texts_to_encode:
-                current_batch_size = min(BATCH_SIZE, len(batch_texts_to_encode))
-                while current_batch_size > 0:
-                    try:
-                        log_to_file_only(f"  🧠 Кодирование {len(batch_texts_to_encode)} реплик на {device} с батчем {current_batch_size}...")
-                        with torch.no_grad():
-                            batch_embeddings = MODEL.encode(
-                                batch_texts_to_encode,
-                                convert_to_tensor=False,
-                                show_progress_bar=False,
-                                device=device,
-                                batch_size=current_batch_size
-                            )
-                        break  # Успешно
-                    except torch.cuda.OutOfMemoryError as e:
-                        log_to_file_only(f"  ⚠️ CUDA OOM при батче {current_batch_size}. Пробуем уменьшить...")
-                        current_batch_size = max(1, current_batch_size // 2)
-                        torch.cuda.empty_cache()
-                        gc.collect()
-                else:
-                    log_to_file_only("  ❌ Не удалось закодировать реплики даже с батчем 1.")
-                    conn.rollback()
+            # Один файл может содержать несколько звонков ("Rtf export, N call(s)")
+            for dialog in parsed["dialogs"]:
+                dialog_id = dialog["dialog_id"]
+                if dialog_id in known_dialog_ids:
                     continue
+                known_dialog_ids.add(dialog_id)
+                submitted_dialog_ids.add(dialog_id)
+                
+                # Сохраняем диалог
+                batch_dialogs_to_save.append({
+                    "id": dialog_id,
+                    "text": "\n".join(dialog["dialog_lines"]),
+                    "metadata": json.dumps(dialog["metadata"], ensure_ascii=False),
+                    "source_theme": theme_name,
+                    "processed_at": datetime.now().isoformat(),
+                    **dialog_columns(dialog["metadata"])
+                })
+                new_dialogs += 1
+                
+                # Сохраняем каждую реплику
+                for idx, (speaker_part, text_part) in enumerate(dialog["utterances"]):
+                    utterance_id = f"{dialog_id}_u{idx+1:03d}"
+                    batch_utterances_to_save.append({
+                        "id": utterance_id,
+                        "dialog_id": dialog_id,
+                        "speaker": speaker_part,
+                        "text": text_part,
+                        "turn_order": idx + 1
+                    })
+                    batch_texts_to_encode.append(text_part)
+                    batch_ids_for_embeddings.append(utterance_id)
+            
+            # Файл переносится писателем только после commit батча
+            batch_moves.append((file, target))
+            batch_manifest.append(manifest_row(target, theme_name, parsed, "processed"))
 
-                # Сохранение эмбеддингов
-                try:
-                    import pickle
-                    embeddings_to_save = []
-                    for uid, emb in zip(batch_ids_for_embeddings, batch_embeddings):
-                        emb_blob = pickle.dumps(emb)
-                        embeddings_to_save.append((uid, emb_blob))
-                    
-                    cursor.executemany("""
-                        INSERT OR REPLACE INTO utterance_embeddings (utterance_id, vector)
-                        VALUES (?, ?)
-                    """, embeddings_to_save)
-                    conn.commit()
-                    
-                    if device.type == "cuda":
-                        torch.cuda.empty_cache()
-                        gc.collect()
-                        
-                except Exception as e:
-                    log_to_file_only(f"  ❌ Ошибка при кодировании/сохранении эмбеддингов реплик: {e}")
-                    conn.rollback()
-
-        msg = f"✅ Завершена обработка темы: {theme_name}."
-        log_to_file_only(msg)
-        print(msg)
+        metrics.add_since("assemble", assemble_started, items=len(batch_dialogs_to_save))
+        metrics.count("dialogs", len(batch_dialogs_to_save))
+        metrics.count("utterances", len(batch_utterances_to_save))
 
-    conn.close()
-    final_msg = f"🏁 Завершена обработка всех тематических папок. Всего новых диалогов: {total_new_dialogs}"
-    log_to_file_only(final_msg)
-    print(final_msg)
+        # === ЛОГИРОВАНИЕ ДЛИН РЕПЛИК ===
+        if batch_texts_to_encode:
+            lengths = [len(text) for text in batch_texts_to_encode]
+            log_to_file_only(f"  📏 Длины реплик: max={max(lengths)}, avg={sum(lengths)/len(lengths):.1f}")
+
+        if not batch_manifest and not batch_moves:
+            continue
+        dialog_ids = [dialog["id"] for dialog in batch_dialogs_to_save]
+        state = ingest_journal.STATE_STORED if batch_texts_to_encode else ingest_journal.STATE_ENCODED
+
+        # Этап 2: Запись диалогов, реплик и манифеста до кодирования (stored);
+        # без реплик батч сразу закодирован и его файлы переносятся
+        metrics.gauge("writer_queue", writer.queue.qsize())
+        with metrics.stage("writer_wait"):
+            writer.submit({
+                "dialogs": batch_dialogs_to_save,
+                "utterances": batch_utterances_to_save,
+                "manifest": batch_manifest,
+                "journal": [journal_row(batch_id, theme_name, state, dialog_ids, batch_moves)],
+                **({} if batch_texts_to_encode else {"moves": batch_moves, "batch_id": batch_id}),
+            })
+        if not batch_texts_to_encode:
+            continue
+
+        # Этап 3: Кодирование эмбеддингов реплик (с кэшем; сама модель — этап encode)
+        with metrics.stage("embed", items=len(batch_texts_to_encode)):
+            encoded = encode_batch(batch_texts_to_encode)
+        if encoded is None:
+            log_to_file_only(f"  ❌ Эмбеддинги батча {batch_id} не получены; файлы остаются в Input до следующего запуска.")
+            continue
+        blobs, cache_rows = encoded
+
+        # Этап 4: Эмбеддинги и переход в encoded одной транзакцией, затем перенос файлов
+        metrics.gauge("writer_queue", writer.queue.qsize())
+        with metrics.stage("writer_wait"):
+            writer.submit({
+                "embeddings": list(zip(batch_ids_for_embeddings, blobs)),
+                "cache": cache_rows,
+                "journal_state": [state_update(batch_id, ingest_journal.STATE_ENCODED)],
+                "moves": batch_moves,
+                "batch_id": batch_id,
+            })
+
+    msg = f"✅ Завершена обработка темы: {theme_name}."
+    log_to_file_only(msg)
+    print(msg)
+    return new_dialogs
 
 if __name__ == "__main__":
     process_thematic_folders()
\ No newline at end of file
@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+"""Замеры этапов pipeline и отчёт по запускам.
+
+Каждый этап (поиск файлов, ожидание парсинга, проверка дубликатов, сборка
+строк, кодирование, ожидание очереди записи, транзакции SQLite, перенос
+файлов) копит число вызовов, время по часам (wall), процессорное время потока
+(cpu) и число элементов; глубина очередей парсинга и записи снимается при
+каждом батче. По завершении запуска запись (этапы, очереди, пик памяти,
+ключевые настройки) дописывается в PIPELINE_RUNS_LOG (JSON lines) и в таблицу
+pipeline_runs.
+
+Сравнение запусков:
+    python pipeline_metrics.py [--last N]
+"""
+
+import sys
+import json
+import time
+import sqlite3
+import argparse
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+import config
+
+CREATE_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS pipeline_runs (
+        run_id TEXT PRIMARY KEY,
+        started_at TEXT NOT NULL,
+        finished_at TEXT NOT NULL,
+        status TEXT NOT NULL,
+        wall_seconds REAL NOT NULL,
+        dialogs INTEGER NOT NULL,
+        utterances INTEGER NOT NULL,
+        record TEXT NOT NULL
+    );
+"""
+
+# Настройки, влияющие на скорость; сравнение показывает, какие из них менялись
+CONFIG_KEYS = (
+    "EMBEDDING_MODEL_NAME",
+    "EMBEDDING_MODEL_BACKEND",
+    "EMBEDDING_MODEL_DEVICE",
+    "EMBEDDING_MODEL_PRECISION",
+    "EMBEDDING_OUTPUT_DIMENSION",
+    "EMBEDDING_STORAGE_DTYPE",
+    "PIPELINE_BATCH_SIZE",
+    "PIPELINE_PARSE_WORKERS",
+    "PIPELINE_ENCODE_WORKERS",
+    "PIPELINE_WRITER_QUEUE_SIZE",
+)
+
+
+def peak_rss_mb():
+    """Пик резидентной памяти основного процесса, МБ (на Windows — текущая через psutil).
+
+    Процессы пулов парсинга и кодирования сюда не входят — см. workers_peak_rss_mb.
+    """
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux — КБ, macOS — байты
+        return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+    if psutil is not None:
+        return psutil.Process().memory_info().rss / (1024 * 1024)
+    return None
+
+
+def _process_peak_rss(process):
+    """Пик RSS живого процесса в байтах: VmHWM (Linux), peak_wset (Windows), иначе текущий RSS."""
+    try:
+        with open(f"/proc/{process.pid}/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    memory = process.memory_info()
+    return getattr(memory, "peak_wset", None) or memory.rss
+
+
+def workers_peak_rss_mb():
+    """Сумма пиков RSS дочерних процессов (пулы парсинга и кодирования), МБ; None без psutil или пулов.
+
+    Пики процессов могли прийтись на разное время, поэтому сумма — верхняя оценка.
+    Снимается, пока пулы ещё живы (до их закрытия).
+    """
+    if psutil is None:
+        return None
+    total = 0
+    children = psutil.Process().children(recursive=True)
+    for child in children:
+        try:
+            total += _process_peak_rss(child)
+        except psutil.Error:  # процесс уже завершился
+            continue
+    return total / (1024 * 1024) if children else None
+
+
+class RunMetrics:
+    """Счётчики этапов одного запуска; этапы можно замерять из разных потоков."""
+
+    def __init__(self, run_id=None):
+        self.run_id = run_id or datetime.now().strftime("%Y%m%d%H%M%S%f")
+        self.started_at = datetime.now().isoformat()
+        self.start = time.perf_counter()
+        self.stages = {}  # {этап: [вызовы, wall, cpu, элементы]}
+        self.gauges = {}  # {очередь: [замеры, сумма, максимум]}
+        self.counters = {}
+        self.peak_gpu_mb = None
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def clock():
+        """Отметка начала этапа для add_since (когда блок неудобно оборачивать в with)."""
+        return time.perf_counter(), time.thread_time()
+
+    def add_since(self, name, started, items=0):
+        wall, cpu = started
+        self.add_stage(name, time.perf_counter() - wall, time.thread_time() - cpu, items)
+
+    @contextmanager
+    def stage(self, name, items=0):
+        """Замеряет блок как этап name; items — сколько элементов он обработал."""
+        started = self.clock()
+        try:
+            yield
+        finally:
+            self.add_since(name, started, items)
+
+    def add_stage(self, name, wall, cpu, items=0):
+        with self.lock:
+            stats = self.stages.setdefault(name, [0, 0.0, 0.0, 0])
+            stats[0] += 1
+            stats[1] += wall
+            stats[2] += cpu
+            stats[3] += items
+
+    def timed_iter(self, name, iterable):
+        """Итератор, время ожидания каждого элемента которого идёт в этап name."""
+        iterator = iter(iterable)
+        while True:
+            started = self.clock()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.add_since(name, started)
+                return
+            self.add_since(name, started, items=1)
+            yield item
+
+    def gauge(self, name, value):
+        """Снимок глубины очереди."""
+        with self.lock:
+            stats = self.gauges.setdefault(name, [0, 0, 0])
+            stats[0] += 1
+            stats[1] += value
+            stats[2] = max(stats[2], value)
+
+    def count(self, name, value=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def record(self, status="ok"):
+        """Запись запуска для JSON lines и pipeline_runs."""
+        wall = time.perf_counter() - self.start
+        stages = {
+            name: {
+                "calls": calls,
+                "wall_s": round(stage_wall, 3),
+                "cpu_s": round(stage_cpu, 3),
+                "items": items,
+                "items_per_s": round(items / stage_wall, 1) if items and stage_wall > 0 else None,
+            }
+            for name, (calls, stage_wall, stage_cpu, items) in self.stages.items()
+        }
+        gauges = {
+            name: {"mean": round(total / samples, 2), "max": peak}
+            for name, (samples, total, peak) in self.gauges.items()
+        }
+        rss = peak_rss_mb()
+        workers_rss = workers_peak_rss_mb()
+        return {
+            "run_id": self.run_id,
+            "started_at": self.started_at,
+            "finished_at": datetime.now().isoformat(),
+            "status": status,
+            "wall_s": round(wall, 3),
+            "counters": dict(self.counters),
+            "stages": stages,
+            "queues": gauges,
+            "peak_rss_mb": round(rss, 1) if rss is not None else None,
+            "workers_peak_rss_mb": round(workers_rss, 1) if workers_rss is not None else None,
+            "peak_gpu_mb": self.peak_gpu_mb,
+            "config": {key: getattr(config, key, None) for key in CONFIG_KEYS},
+        }
+
+
+def save_run(record, db_path=None, log_path=None):
+    """Дописывает запись в JSON lines и в таблицу pipeline_runs."""
+    log_path = log_path or config.PIPELINE_RUNS_LOG
+    with open(log_path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    conn = sqlite3.connect(str(db_path or config.DATABASE_PATH), timeout=60)
+    try:
+        with conn:
+            conn.execute(CREATE_TABLE_SQL)
+            conn.execute(
+                "INSERT OR REPLACE INTO pipeline_runs VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    record["run_id"], record["started_at"], record["finished_at"], record["status"],
+                    record["wall_s"], record["counters"].get("dialogs", 0),
+                    record["counters"].get("utterances", 0), json.dumps(record, ensure_ascii=False),
+                ),
+            )
+    finally:
+        conn.close()
+
+
+def load_runs(conn, last):
+    """Последние last запусков, от старых к новым."""
+    rows = conn.execute("SELECT record FROM pipeline_runs ORDER BY started_at DESC LIMIT ?", (last,)).fetchall()
+    return [json.loads(row[0]) for row in reversed(rows)]
+
+
+def change(current, previous, higher_is_worse=True, min_abs=0.0):
+    """Изменение к предыдущему запуску; ⚠️ — ухудшение больше чем на 20% (и не меньше min_abs)."""
+    if not previous or current is None:
+        return ""
+    delta = (current - previous) / previous
+    worse = (delta > 0.2 if higher_is_worse else delta < -0.2) and abs(current - previous) >= min_abs
+    return f" ({delta:+.0%}){' ⚠️' if worse else ''}"
+
+
+def format_comparison(runs):
+    """Строки отчёта: время запуска и этапов каждого запуска с изменением к предыдущему."""
+    lines = []
+    previous = None
+    for run in runs:
+        utterances = run["counters"].get("utterances", 0)
+        rate = utterances / run["wall_s"] if run["wall_s"] else 0
+        # Скорость сравнивается только между запусками, которые что-то обработали
+        prev_rate = utterances and previous and previous["wall_s"] and previous["counters"].get("utterances", 0) / previous["wall_s"]
+        lines.append(
+            f"🏁 {run['run_id']} [{run['status']}] {run['wall_s']:.1f} с, "
+            f"диалогов {run['counters'].get('dialogs', 0)}, реплик {utterances} "
+            f"({rate:.1f}/с{change(rate, prev_rate, higher_is_worse=False)}), пик RAM основного процесса {run.get('peak_rss_mb')} МБ"
+            + (f" (+ процессы пулов {run['workers_peak_rss_mb']} МБ)" if run.get("workers_peak_rss_mb") else "")
+        )
+        if previous:
+            changed = {
+                key: (previous["config"].get(key), value)
+                for key, value in run["config"].items() if previous["config"].get(key) != value
+            }
+            for key, (old, new) in changed.items():
+                lines.append(f"   ⚙️ {key}: {old} → {new}")
+        for name, stage in sorted(run["stages"].items(), key=lambda item: -item[1]["wall_s"]):
+            prev_stage = previous["stages"].get(name) if previous else None
+            rate = f", {stage['items_per_s']}/с" if stage["items_per_s"] else ""
+            lines.append(
+                f"   {name:<14} {stage['wall_s']:8.2f} с{change(stage['wall_s'], prev_stage and prev_stage['wall_s'], min_abs=1.0)}"
+                f" | cpu {stage['cpu_s']:.2f} с | {stage['items']} эл.{rate}"
+            )
+        for name, queue in run["queues"].items():
+            lines.append(f"   очередь {name}: средняя {queue['mean']}, максимум {queue['max']}")
+        previous = run
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сравнение запусков pipeline по этапам")
+    parser.add_argument("--last", type=int, default=5, help="Сколько последних запусков показать")
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(config.DATABASE_PATH)
+    try:
+        conn.execute(CREATE_TABLE_SQL)
+        runs = load_runs(conn, args.last)
+    finally:
+        conn.close()
+    if not runs:
+        print("ℹ️ Запусков pipeline ещё не записано.")
+        return 0
+    print("\n".join(format_comparison(runs)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
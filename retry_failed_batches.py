@@ -1,57 +1,59 @@
-"""Скрипт для поиска и повторной обработки диалогов без эмбеддингов."""
+"""Скрипт для дозаписи эмбеддингов реплик, у которых их нет.
+
+Сначала доделываются батчи из журнала ingest_journal (то же происходит в
+начале каждого запуска pipeline.py), затем кодируются реплики без эмбеддингов,
+оставшиеся от запусков до появления журнала. Файлы не переносятся, диалоги и
+реплики не удаляются.
+"""
 
-import sqlite3
 import config
-import os
-from pathlib import Path
+from pipeline import ensure_db_initialized, load_embedding_model, make_batch_encoder, iter_batches, log_to_file_only
+from embedding_cache import EmbeddingCache, model_key
+from embedding_backend import cache_model_name
+from adaptive_batcher import AdaptiveBatcher
+from db_writer import DBWriter, open_connection
+from ingest_journal import unfinished_batches, resume_unfinished, missing_embeddings
 
 def find_and_retry():
-    conn = sqlite3.connect(config.DATABASE_PATH)
+    ensure_db_initialized()
+    conn = open_connection(config.DATABASE_PATH, pragmas=())
     cursor = conn.cursor()
 
-    # Найти диалоги, у которых есть реплики, но нет эмбеддингов
-    cursor.execute("""
-        SELECT DISTINCT u.dialog_id
-        FROM utterances u
-        LEFT JOIN utterance_embeddings ue ON u.id = ue.utterance_id
-        WHERE ue.utterance_id IS NULL
-    """)
-    dialog_ids = [row[0] for row in cursor.fetchall()]
-
-    if not dialog_ids:
-        print("✅ Все диалоги имеют эмбеддинги.")
+    missing = missing_embeddings(cursor)
+    unfinished = len(unfinished_batches(cursor))
+    if not missing and not unfinished:
+        print("✅ Все реплики имеют эмбеддинги.")
+        conn.close()
         return
 
-    print(f"⚠️ Найдено {len(dialog_ids)} диалогов без эмбеддингов. Перемещаем файлы обратно...")
-
-    # Переместить файлы обратно в Input
-    for dialog_id in dialog_ids:
-        # Получаем путь к файлу из metadata
-        cursor.execute("SELECT metadata FROM dialogs WHERE id = ?", (dialog_id,))
-        row = cursor.fetchone()
-        if not row:
-            continue
-        try:
-            meta = json.loads(row[0])
-            theme = meta.get("source_theme", "unknown")
-            filename = f"{dialog_id}.rtf"  # или восстановить оригинальное имя
-            proc_path = config.PROCESSED_ROOT / theme / filename
-            input_path = config.INPUT_ROOT / theme / filename
-            if proc_path.exists():
-                proc_path.rename(input_path)
-                print(f"  Перемещён: {filename}")
-        except Exception as e:
-            print(f"  ❌ Ошибка перемещения {dialog_id}: {e}")
-
-    # Удалить записи из БД
-    placeholders = ','.join('?' * len(dialog_ids))
-    cursor.execute(f"DELETE FROM utterance_embeddings WHERE utterance_id IN (SELECT id FROM utterances WHERE dialog_id IN ({placeholders}))", dialog_ids)
-    cursor.execute(f"DELETE FROM utterances WHERE dialog_id IN ({placeholders})", dialog_ids)
-    cursor.execute(f"DELETE FROM dialogs WHERE id IN ({placeholders})", dialog_ids)
-    conn.commit()
-    conn.close()
-
-    print("✅ Подготовлено к повторной обработке. Запусти pipeline.py снова.")
+    print(f"⚠️ Реплик без эмбеддингов: {len(missing)}, недоделанных батчей в журнале: {unfinished}. Кодируем...")
+
+    MODEL, device = load_embedding_model()
+    writer = DBWriter(config.DATABASE_PATH, config.PIPELINE_WRITER_QUEUE_SIZE, log=log_to_file_only).start()
+    embedding_cache = EmbeddingCache(conn, model_key(cache_model_name(device)), defer_writes=True)
+    encode_batch = make_batch_encoder(MODEL, device, embedding_cache, AdaptiveBatcher(device))
+    try:
+        resumed = resume_unfinished(cursor, writer, encode_batch, log=print)
+        print(f"🔁 Доделано батчей из журнала: {resumed}")
+
+        # Реплики без эмбеддингов вне журнала (запуски до его появления)
+        failed = 0
+        for chunk in iter_batches(missing_embeddings(cursor), config.PIPELINE_BATCH_SIZE * 10):
+            encoded = encode_batch([text for _, text in chunk])
+            if encoded is None:
+                failed += len(chunk)
+                continue
+            blobs, cache_rows = encoded
+            writer.submit({"embeddings": [(uid, blob) for (uid, _), blob in zip(chunk, blobs)], "cache": cache_rows})
+        writer.flush()
+    finally:
+        writer.close()
+        conn.close()
+
+    if failed or writer.failed_batches:
+        print(f"⚠️ Не закодировано реплик: {failed}, не записано батчей: {writer.failed_batches}. Запусти скрипт снова.")
+    else:
+        print("✅ Недостающие эмбеддинги записаны. Перестрой индексы (indexer.py).")
 
 if __name__ == "__main__":
-    find_and_retry()
\ No newline at end of file
+    find_and_retry()
@@ -0,0 +1,221 @@
+"""Быстрое извлечение текста из RTF-экспортов звонков.
+
+Экспорты телефонии используют малое подмножество RTF: абзацы, табуляции,
+escape-последовательности \\'xx и \\uN. Для него декодер повторяет поведение
+striprtf.rtf_to_text символ в символ, но не ходит по тексту посимвольно:
+тело документа (ASCII, \\'xx, \\par, \\tab) в однобайтовой кодировке
+декодируется целыми участками через escape_decode/bytes.decode, остальное
+разбирается токенами (сплошной текст, серии \\'xx), а результат собирается
+списком вместо конкатенации строк.
+
+Всё, что выходит за подмножество (управляющие слова, дающие вывод кроме
+\\par/\\line/\\tab, картинки с \\bin, поля HYPERLINK), обрабатывается
+оригинальным striprtf — результат от этого не меняется.
+"""
+
+import re
+import codecs
+
+from striprtf.striprtf import rtf_to_text as striprtf_to_text
+from striprtf.striprtf import FONTTABLE, charset_map, destinations, specialchars
+
+# Управляющие слова с выводом, которые декодер обрабатывает сам
+FAST_OUTPUT_WORDS = frozenset(("par", "line", "tab"))
+
+TOKEN_RE = re.compile(
+    r"\\([a-z]{1,32})(-?\d{1,10})?[ ]?"   # управляющее слово с аргументом
+    r"|((?:\\'[0-9a-f]{2})+)"             # серия \'xx
+    r"|\\([^a-z])"                        # управляющий символ
+    r"|([{}])"                            # группа
+    r"|[\r\n]+"                           # переводы строк в RTF не значимы
+    r"|([^\\{}\r\n]+)"                    # сплошной текст
+    r"|(\\)",                             # одиночный "\" в конце текста
+    re.IGNORECASE,
+)
+
+# Участок тела документа, который можно декодировать целиком: ASCII-текст,
+# \'xx и \par/\line/\tab (\x01 и \x02 заняты под маркеры, см. decode_span)
+SPAN_RE = re.compile(
+    r"(?:[^\\{}\x01\x02]|\\'[0-9a-f]{2}|\\(?:par|line|tab)(?![a-z])(?:-?\d{1,10})?[ ]?)+",
+    re.IGNORECASE,
+)
+SPAN_NEWLINE_RE = re.compile(r"\\(?:par|line)(?![a-z])(?:-?\d{1,10})?[ ]?", re.IGNORECASE)
+SPAN_TAB_RE = re.compile(r"\\tab(?![a-z])(?:-?\d{1,10})?[ ]?", re.IGNORECASE)
+# Серия \'xx в самом конце текста striprtf так и не выводит
+TRAILING_HEX_RE = re.compile(r"(?:\\'[0-9a-f]{2})+\Z", re.IGNORECASE)
+# Однобайтовые кодировки: ASCII в них неизменен, а \'xx можно декодировать
+# одним вызовом без изменения результата
+SINGLE_BYTE_ENCODINGS = frozenset((
+    "cp1250", "cp1251", "cp1252", "cp1253", "cp1254", "cp1255", "cp1256", "cp1257", "cp1258",
+    "cp437", "cp850", "cp874",
+))
+
+# Поля ({\field ...}) striprtf переписывает регуляркой HYPERLINKS до разбора
+FIELD_RE = re.compile(r"\{\\field", re.IGNORECASE)
+FONTTABLE_START = re.compile(r"{[^{}]*\\fonttbl")
+BRACE = re.compile(r"[{}]")
+
+
+class UnsupportedRTF(Exception):
+    """Документ выходит за подмножество RTF, поддерживаемое быстрым декодером."""
+
+
+def font_table_group(text):
+    """Группа {\\fonttbl ...} документа (как в striprtf), или "" если её нет."""
+    start = FONTTABLE_START.search(text)
+    if not start:
+        return ""
+    depth = 1
+    for brace in BRACE.finditer(text, start.end()):
+        depth += 1 if brace.group() == "{" else -1
+        if depth == 0:
+            return text[start.start():brace.end()]
+    return text[start.start():]
+
+
+def decode_span(chunk, encoding, errors):
+    """Декодирует участок, совпавший с SPAN_RE, без разбора по токенам."""
+    chunk = SPAN_NEWLINE_RE.sub("\x01", chunk)
+    chunk = SPAN_TAB_RE.sub("\x02", chunk)
+    chunk = chunk.replace("\r", "").replace("\n", "")
+    if "\\" in chunk:
+        raw = codecs.escape_decode(chunk.replace("\\'", "\\x").encode("ascii"))[0]
+        chunk = raw.decode(encoding, errors=errors)
+    return chunk.replace("\x01", "\n").replace("\x02", "\t")
+
+
+def fast_rtf_to_text(text, encoding="cp1252", errors="strict"):
+    """Быстрый путь без fallback. Бросает UnsupportedRTF вне подмножества."""
+    if ("\\pict" in text and "\\bin" in text) or FIELD_RE.search(text):
+        raise UnsupportedRTF("\\pict/\\bin или \\field")
+
+    fonttbl = {}
+    for font_id, fcharset, _font_name in FONTTABLE.findall(font_table_group(text)):
+        fonttbl[font_id] = charset_map.get(int(fcharset), encoding)
+
+    stack = []
+    current_font = None
+    ignorable = False
+    suppress_output = False
+    ucskip = 1
+    curskip = 0
+    hexes = None
+    depth = 0
+    in_document = False
+    out = []
+    append = out.append
+
+    pos = 0
+    length = len(text)
+    closed = False
+    while pos < length and not closed:
+        limit = length
+        if not (curskip or ignorable or suppress_output or hexes):
+            span = SPAN_RE.match(text, pos)
+            if span:
+                chunk = span.group()
+                span_encoding = fonttbl.get(current_font, encoding)
+                if span_encoding in SINGLE_BYTE_ENCODINGS and chunk.isascii():
+                    pos = span.end()
+                    if pos == length:
+                        chunk = TRAILING_HEX_RE.sub("", chunk)
+                    append(decode_span(chunk, span_encoding, errors))
+                    continue
+                # Участок с не-ASCII текстом разбираем по токенам целиком
+                limit = span.end()
+
+        for match in TOKEN_RE.finditer(text, pos, limit):
+            pos = match.end()
+            word, arg, hex_run, char, brace, run, backslash = match.groups()
+            if hexes and not hex_run:
+                append(bytes.fromhex(hexes).decode(fonttbl.get(current_font, encoding), errors=errors))
+                hexes = None
+            if run is not None or backslash:
+                run = run if run is not None else backslash
+                if curskip:
+                    if curskip >= len(run):
+                        curskip -= len(run)
+                        continue
+                    run = run[curskip:]
+                    curskip = 0
+                if not ignorable and not suppress_output:
+                    append(run)
+            elif hex_run:
+                digits = hex_run.replace("\\'", "")
+                if curskip:
+                    skipped = min(curskip, len(digits) // 2)
+                    curskip -= skipped
+                    digits = digits[skipped * 2:]
+                if digits and not ignorable:
+                    hexes = digits
+            elif brace:
+                curskip = 0
+                if brace == "{":
+                    depth += 1
+                    in_document = True
+                    stack.append((ucskip, ignorable, suppress_output))
+                else:
+                    depth -= 1
+                    if stack:
+                        ucskip, ignorable, suppress_output = stack.pop()
+                    else:
+                        ucskip = 0
+                        ignorable = True
+                    if in_document and depth <= 0:
+                        closed = True
+                        break
+            elif char:
+                curskip = 0
+                if char in specialchars:
+                    if not ignorable:
+                        append(specialchars[char])
+                elif char == "*":
+                    ignorable = True
+            elif word:
+                curskip = 0
+                if word in destinations:
+                    ignorable = True
+                elif word == "ansicpg":
+                    encoding = f"cp{arg}"
+                    try:
+                        codecs.lookup(encoding)
+                    except LookupError:
+                        encoding = "utf8"
+                if ignorable or suppress_output:
+                    continue
+                if word in specialchars:
+                    if word not in FAST_OUTPUT_WORDS:
+                        raise UnsupportedRTF(f"\\{word}")
+                    append(specialchars[word])
+                elif word == "uc":
+                    ucskip = int(arg)
+                elif word == "u":
+                    if arg is not None:
+                        c = int(arg)
+                        if c < 0:
+                            c += 0x10000
+                        append(chr(c))
+                    curskip = ucskip
+                elif word == "f":
+                    current_font = arg
+                elif word == "fonttbl" or word == "colortbl":
+                    suppress_output = True
+            if limit == length and not (curskip or ignorable or suppress_output or hexes):
+                # Состояние снова простое — возвращаемся к декодированию участками
+                break
+        else:
+            pos = limit
+
+    return "".join(out)
+
+
+def rtf_to_text(text, encoding="cp1252", errors="strict"):
+    """Замена striprtf.rtf_to_text с тем же результатом.
+
+    Документы вне поддерживаемого подмножества (а также любые ошибки быстрого
+    пути) передаются в striprtf, чтобы поведение, включая исключения, совпадало.
+    """
+    try:
+        return fast_rtf_to_text(text, encoding=encoding, errors=errors)
+    except Exception:
+        return striprtf_to_text(text, encoding=encoding, errors=errors)
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""Синтетические экспорты звонков в формате телефонии.
+
+Файлы повторяют реальные выгрузки: RTF (cp1251 через \\'xx), заголовок
+"Rtf export, N call(s)", строка порога чувствительности, заголовок звонка
+"<id> (ДД.ММ.ГГГГ чч:мм:сс)", участники "оператор@домен -> клиент" (или "<-"
+для входящих), реплики "говорящий<TAB>текст<TAB>чч:мм:сс"; имя файла —
+"ГГГГММДДччммсс_логин_номер.rtf". Генерация детерминирована по seed, так что
+бенчмарки (benchmark_ingest.py, benchmark_rtf_decoder.py) сравнимы между запусками.
+
+Запуск:
+    python synthetic_exports.py <папка> [--themes 2] [--files 100] [--calls 3] [--replies 40] [--seed 42]
+
+Файлы пишутся в <папка>/<Тема>/, как в Input.
+"""
+
+import sys
+import random
+import argparse
+from pathlib import Path
+from datetime import datetime, timedelta
+
+PHRASES = [
+    "Здравствуйте, компания «Связь», меня зовут Анна, чем могу помочь?",
+    "Алло", "Да", "Спасибо, до свидания",
+    "У меня с утра не работает интернет, роутер перезагружал дважды.",
+    "Подскажите, пожалуйста, номер договора или адрес подключения.",
+    "Оформлю заявку на выезд мастера, он перезвонит вам в течение дня.",
+    "Почему с меня списали абонентскую плату дважды за этот месяц?",
+    "Сейчас проверю начисления, оставайтесь, пожалуйста, на линии.",
+    "Хочу сменить тариф на более дешёвый, телевидение мне не нужно.",
+    "Перезвоните мне, пожалуйста, вечером после шести.",
+    "Минуту, уточню информацию у технического специалиста.",
+    "Могу я ещё чем-нибудь помочь?",
+    "Нет, это всё, спасибо.",
+]
+
+BASE_DATETIME = datetime(2024, 2, 1, 9, 0, 0)
+
+
+def rtf_escape(text):
+    """Не-ASCII символы как \\'xx в cp1251, табуляция как \\tab."""
+    text = "".join(c if ord(c) < 128 else "\\'%02x" % c.encode("cp1251")[0] for c in text)
+    return text.replace("\t", "\\tab ")
+
+
+def render_rtf(lines):
+    body = "\\par\n".join(rtf_escape(line) for line in lines)
+    return (r"{\rtf1\ansi\ansicpg1251\deff0{\fonttbl{\f0\fnil\fcharset204 Calibri;}}" "\n"
+            r"\viewkind4\uc1\pard\f0\fs22\lang1049 " + body + "\\par\n}\n")
+
+
+def client_number(rng):
+    return f"79{rng.randint(100000000, 999999999)}"
+
+
+def call_lines(rng, call_id, started, operator, client, replies):
+    """Строки одного звонка: заголовок, участники, реплики с нарастающим временем."""
+    direction = "->" if rng.random() < 0.7 else "<-"
+    lines = [
+        f"{call_id} ({started:%d.%m.%Y %H:%M:%S})",
+        f"{operator}@corp.ru {direction} {client}",
+    ]
+    offset = 0
+    for reply in range(replies):
+        speaker = f"{operator}@corp.ru" if reply % 2 == 0 else client
+        phrase = PHRASES[0] if reply == 0 else rng.choice(PHRASES)
+        offset += rng.randint(1, 15)
+        lines.append(f"{speaker}\t{phrase}\t{offset // 3600:02d}:{offset // 60 % 60:02d}:{offset % 60:02d}")
+    return lines
+
+
+def synthetic_export(rng, calls=3, replies=40):
+    """Текст одного экспорта с calls звонками по replies реплик."""
+    lines = [f"Rtf export, {calls} call(s)", "Порог чувствительности: 5,00 с"]
+    for call in range(calls):
+        started = BASE_DATETIME + timedelta(minutes=call)
+        lines += call_lines(rng, rng.randint(100000, 999999), started, f"operator{call}", client_number(rng), replies)
+    return render_rtf(lines)
+
+
+def write_exports(root, themes=2, files=100, calls=3, replies=40, operators=20, seed=42, duplicates=0.0):
+    """Пишет files экспортов в каждую из themes папок root/<Тема>.
+
+    Идентификаторы звонков уникальны во всём наборе; число реплик звонка
+    случайно в пределах [replies / 2, replies * 3 / 2]. duplicates — доля
+    файлов, повторяющих содержимое уже записанного файла темы под другим именем
+    (pipeline помечает их как duplicate).
+
+    Returns:
+        {"files", "dialogs", "utterances", "bytes"} — без учёта дубликатов.
+    """
+    rng = random.Random(seed)
+    root = Path(root)
+    stats = {"files": 0, "dialogs": 0, "utterances": 0, "bytes": 0}
+    call_id = 100000
+    for theme in range(themes):
+        theme_dir = root / f"Тема_{theme + 1}"
+        theme_dir.mkdir(parents=True, exist_ok=True)
+        written = []
+        for _ in range(files):
+            started = BASE_DATETIME + timedelta(minutes=rng.randint(0, 60 * 24 * 30))
+            operator = f"operator{rng.randrange(operators)}"
+            client = client_number(rng)
+            name = f"{started:%Y%m%d%H%M%S}_{operator}_{client}.rtf"
+            if written and rng.random() < duplicates:
+                (theme_dir / name).write_bytes(rng.choice(written).read_bytes())
+                continue
+
+            file_calls = rng.randint(1, calls)
+            lines = [f"Rtf export, {file_calls} call(s)", "Порог чувствительности: 5,00 с"]
+            for call in range(file_calls):
+                call_id += 1
+                call_replies = rng.randint(max(1, replies // 2), max(1, replies * 3 // 2))
+                # Первый звонок — из имени файла, остальные — тем же оператором позже
+                lines += call_lines(
+                    rng, call_id, started + timedelta(minutes=5 * call), operator,
+                    client if call == 0 else client_number(rng), call_replies
+                )
+                stats["dialogs"] += 1
+                stats["utterances"] += call_replies
+            path = theme_dir / name
+            path.write_text(render_rtf(lines), encoding="utf-8")
+            written.append(path)
+            stats["files"] += 1
+            stats["bytes"] += path.stat().st_size
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Генерация синтетических экспортов звонков")
+    parser.add_argument("root", help="Папка, в которую пишутся <Тема>/<файл>.rtf")
+    parser.add_argument("--themes", type=int, default=2, help="Число тематических папок")
+    parser.add_argument("--files", type=int, default=100, help="Файлов на тему")
+    parser.add_argument("--calls", type=int, default=3, help="Максимум звонков в файле")
+    parser.add_argument("--replies", type=int, default=40, help="Среднее число реплик в звонке")
+    parser.add_argument("--operators", type=int, default=20, help="Число различных операторов")
+    parser.add_argument("--duplicates", type=float, default=0.0, help="Доля файлов-дубликатов")
+    parser.add_argument("--seed", type=int, default=42, help="Зерно генератора")
+    args = parser.parse_args()
+
+    stats = write_exports(
+        args.root, args.themes, args.files, args.calls, args.replies,
+        args.operators, args.seed, args.duplicates,
+    )
+    print(
+        f"✅ Записано файлов: {stats['files']}, диалогов: {stats['dialogs']}, "
+        f"реплик: {stats['utterances']}, объём: {stats['bytes'] / 1024 ** 2:.1f} МБ"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
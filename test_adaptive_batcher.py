@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""Тестирование адаптивного формирования батчей (adaptive_batcher)."""
+
+import sys
+from pathlib import Path
+
+# Добавляем текущую директорию в путь
+current_dir = Path(__file__).parent
+sys.path.insert(0, str(current_dir))
+
+
+class FakeTokenizer:
+    def __call__(self, texts, max_length, **kwargs):
+        return {"input_ids": [list(range(min(max_length, len(text.split()) + 2))) for text in texts]}
+
+
+class FakeModel:
+    """Модель-заглушка: "вектор" — длина текста; OOM, если батч больше memory_tokens."""
+
+    def __init__(self, memory_tokens):
+        self.tokenizer = FakeTokenizer()
+        self.max_seq_length = 512
+        self.memory_tokens = memory_tokens
+        self.batches = []
+
+    def encode(self, texts, batch_size, **kwargs):
+        padded = max(len(text.split()) + 2 for text in texts) * len(texts)
+        if padded > self.memory_tokens:
+            raise MemoryError("fake OOM")
+        self.batches.append(len(texts))
+        return [[float(len(text))] for text in texts]
+
+
+def check(name, condition, details=""):
+    status = "✅ ПРОЙДЕН" if condition else "❌ ПРОВАЛЕН"
+    print(f"{status} {name}")
+    if details and not condition:
+        print(f"    {details}")
+    return condition
+
+
+def main():
+    """Тестирование adaptive_batcher."""
+    print("🧪 Тестирование адаптивного батчера")
+    print("=" * 60)
+
+    from adaptive_batcher import AdaptiveBatcher, encode_texts
+
+    results = []
+    texts = ["Да"] * 200 + [" ".join(["слово"] * 300)] * 5 + ["Алло, добрый день"] * 50
+
+    # Бюджет позволяет всё: короткие реплики идут большими батчами, порядок сохраняется
+    batcher = AdaptiveBatcher("cpu", token_budget=4096, max_batch_size=256)
+    model = FakeModel(memory_tokens=10 ** 9)
+    vectors = encode_texts(model, texts, batcher)
+    results.append(check("Порядок векторов сохранён", [v[0] for v in vectors] == [float(len(t)) for t in texts]))
+    results.append(check("Длинные тексты — малым батчем, короткие — большим", model.batches[0] <= 13 and max(model.batches) >= 200, str(model.batches)))
+
+    # OOM: бюджет уменьшается и больше не превышает возможности "устройства"
+    batcher = AdaptiveBatcher("cpu", token_budget=100000, max_batch_size=256)
+    # Заглушка "занимает" память только в счётчике токенов: замер RSS здесь лишь поднимал бы бюджет
+    batcher.can_measure = lambda: False
+    model = FakeModel(memory_tokens=1000)
+    vectors = encode_texts(model, texts, batcher)
+    results.append(check("После OOM всё закодировано", vectors is not None and all(v is not None for v in vectors)))
+    results.append(check("Бюджет уменьшен после OOM", batcher.oom_count > 0 and batcher.token_budget <= 1000, str(batcher.token_budget)))
+
+    # Даже один текст не помещается — None
+    batcher = AdaptiveBatcher("cpu", token_budget=4096)
+    results.append(check("OOM на одном тексте даёт None", encode_texts(FakeModel(memory_tokens=10), texts, batcher) is None))
+
+    # Бюджет по наблюдаемой памяти: 1000 байт/токен при свободных 10 МБ -> ~10k токенов
+    batcher = AdaptiveBatcher("cpu", token_budget=8192, min_budget=512, max_budget=65536)
+    batcher.observe(padded_tokens=4096, used_bytes=4096 * 1000, headroom_bytes=10_000_000)
+    results.append(check("Бюджет по пику памяти", batcher.token_budget == 10_000, str(batcher.token_budget)))
+    batcher.observe(padded_tokens=4096, used_bytes=4096 * 10, headroom_bytes=10_000_000)
+    results.append(check("Снижение расхода учитывается постепенно", batcher.bytes_per_token == 802, str(batcher.bytes_per_token)))
+    batcher.observe(padded_tokens=4096, used_bytes=4096 * 5000, headroom_bytes=10_000_000)
+    results.append(check("Рост расхода учитывается сразу", batcher.token_budget == 2000, str(batcher.token_budget)))
+
+    batcher = AdaptiveBatcher("cpu", token_budget=1000, min_budget=512, max_budget=65536)
+    batcher.observe(padded_tokens=1000, used_bytes=1000, headroom_bytes=10_000_000)
+    results.append(check("Рост бюджета не более чем вдвое за шаг", batcher.token_budget == 2000, str(batcher.token_budget)))
+
+    # CPU: пик RSS ловится во время батча, хотя к концу encode память уже освобождена
+    import time
+    import numpy as np
+    import adaptive_batcher
+
+    if adaptive_batcher.psutil is None:
+        print("⚠️ psutil не установлен — замер памяти на CPU не проверяется")
+    else:
+        batcher = AdaptiveBatcher("cpu", token_budget=4096, min_budget=1, max_budget=10 ** 9)
+        with batcher.measure(padded_tokens=4096):
+            activations = np.ones(64 * 1024 ** 2, dtype=np.uint8)  # 64 МБ, как активации батча
+            time.sleep(0.05)
+            del activations
+        results.append(check(
+            "CPU: пик RSS за батч учтён",
+            batcher.bytes_per_token is not None and batcher.bytes_per_token * 4096 >= 48 * 1024 ** 2,
+            str(batcher.bytes_per_token)
+        ))
+
+    passed = sum(results)
+    print(f"\n📊 Пройдено {passed}/{len(results)}")
+    return 0 if passed == len(results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""Тестирование разбора экспортов звонков (dialog_parser)."""
+
+import sys
+from pathlib import Path
+
+# Добавляем текущую директорию в путь
+current_dir = Path(__file__).parent
+sys.path.insert(0, str(current_dir))
+
+SINGLE_CALL = (
+    "Rtf export, 1 call(s)\n"
+    "Порог чувствительности: 5,00 с\n"
+    "123456 (01.02.2024 10:11:12)\n"
+    "ivanov@corp.ru -> 79161234567\n"
+    "ivanov@corp.ru\tЗдравствуйте, компания\t00:00:01\n"
+    "79161234567\tАлло, да\t00:00:03\n"
+)
+
+MULTI_CALL = (
+    "Rtf export, 3 call(s)\n"
+    "Порог чувствительности: 5,00 с\n"
+    "111 (01.02.2024 10:00:00)\n"
+    "ivanov@corp.ru -> 79161234567\n"
+    "ivanov@corp.ru\tДобрый день\t00:00:01\n"
+    "222 (01.02.2024 11:00:00)\n"
+    "petrov@corp.ru <- 79160000000\n"
+    "petrov@corp.ru\tСлушаю вас\t00:00:02\n"
+    "79160000000\tСпасибо, до свидания\t00:00:05\n"
+    "333 (02.02.2024 09:30:00)\n"
+    "sidorov@corp.ru -> 79165555555\n"
+    "sidorov@corp.ru\tАлло\t00:00:01\n"
+)
+
+
+def check(name, condition, details=""):
+    status = "✅ ПРОЙДЕН" if condition else "❌ ПРОВАЛЕН"
+    print(f"{status} {name}")
+    if details and not condition:
+        print(f"    {details}")
+    return condition
+
+
+def main():
+    """Тестирование разбора экспортов."""
+    print("🧪 Тестирование разбора экспортов звонков")
+    print("=" * 60)
+
+    from dialog_parser import clean_dialog_text_no_filter, iter_dialog_records, split_utterance_line
+
+    results = []
+
+    # Один звонок: формат реплик и метаданные
+    lines, metadata = clean_dialog_text_no_filter(SINGLE_CALL, {"source_theme": "test"}, "file0001")
+    results.append(check(
+        "Один звонок: реплики",
+        lines == ["ivanov: Здравствуйте, компания [00:00:01]", "79161234567: Алло, да [00:00:03]"],
+        str(lines)
+    ))
+    results.append(check(
+        "Один звонок: метаданные",
+        metadata["dialog_id"] == "123456"
+        and metadata["dialog_datetime"] == "2024-02-01T10:11:12"
+        and metadata["participants"].get("client_number") == "79161234567"
+        and metadata["source_theme"] == "test",
+        str(metadata)
+    ))
+
+    # Несколько звонков в одном экспорте
+    records = list(iter_dialog_records(MULTI_CALL, {}, "file0002"))
+    results.append(check("Многозвонковый экспорт: 3 диалога", len(records) == 3, str(records)))
+    results.append(check(
+        "Многозвонковый экспорт: идентификаторы",
+        [m["dialog_id"] for _, m in records] == ["111", "222", "333"]
+    ))
+    results.append(check(
+        "Многозвонковый экспорт: реплики второго звонка",
+        records[1][0] == ["petrov: Слушаю вас [00:00:02]", "79160000000: Спасибо, до свидания [00:00:05]"],
+        str(records[1][0])
+    ))
+    results.append(check(
+        "Многозвонковый экспорт: участники по звонкам",
+        [m["participants"].get("operator_login") for _, m in records] == ["ivanov", "petrov", "sidorov"]
+    ))
+
+    # Текст без заголовков — один диалог с идентификатором файла
+    records = list(iter_dialog_records("просто текст\nоператор\tреплика\t00:01:02\n", {}, "file0003"))
+    results.append(check(
+        "Без заголовков: один диалог",
+        len(records) == 1 and records[0][1]["dialog_id"] == "file0003"
+    ))
+
+    # Пустой текст
+    results.append(check("Пустой текст", list(iter_dialog_records("", {}, "file0004")) == []))
+
+    results.append(check(
+        "Разбиение строки реплики",
+        split_utterance_line("ivanov: Добрый день [00:00:01]") == ("ivanov", "Добрый день")
+    ))
+
+    # Типизированные колонки метаданных и SQL-фильтры по ним
+    import json
+    import sqlite3
+    from dialog_metadata import dialog_columns, ensure_dialog_columns, backfill_dialog_columns, ensure_dialog_metadata, filter_sql
+
+    columns = dialog_columns(metadata)
+    results.append(check(
+        "Колонки метаданных из звонка",
+        columns["call_datetime"] == "2024-02-01T10:11:12" and columns["operator_login"] == "ivanov"
+        and columns["client_number"] == "79161234567" and columns["dialog_type"] == "chat",
+        str(columns)
+    ))
+    file_columns = dialog_columns({"date_from_filename": "2024-03-05", "time_from_filename": "08:00:00",
+                                   "operator_login_from_filename": "petrov", "client_number_from_filename": "79160000000"})
+    results.append(check(
+        "Колонки метаданных из имени файла",
+        file_columns["call_datetime"] == "2024-03-05T08:00:00" and file_columns["operator_login"] == "petrov",
+        str(file_columns)
+    ))
+
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE dialogs (id TEXT PRIMARY KEY, text TEXT, metadata TEXT, source_theme TEXT, processed_at TEXT)")
+    conn.execute("CREATE TABLE utterances (id TEXT PRIMARY KEY, dialog_id TEXT, speaker TEXT, text TEXT, turn_order INTEGER)")
+    conn.executemany("INSERT INTO dialogs VALUES (?, '', ?, 'test', '')", [
+        (m["dialog_id"], json.dumps(m, ensure_ascii=False)) for _, m in iter_dialog_records(MULTI_CALL, {}, "file0002")
+    ])
+    added = ensure_dialog_columns(conn)
+    backfill_dialog_columns(conn)
+    where, params = filter_sql({"operator_login": "ivanov", "date_from": "2024-02-01", "date_to": "2024-02-02"})
+    found = [row[0] for row in conn.execute(f"SELECT d.id FROM dialogs d WHERE {where} ORDER BY d.id", params)]
+    plan = " ".join(str(row) for row in conn.execute(f"EXPLAIN QUERY PLAN SELECT d.id FROM dialogs d WHERE {where}", params))
+    results.append(check(
+        "Миграция старой БД и фильтр по оператору и дате",
+        "operator_login" in added and found == ["111"] and "idx_dialogs_operator_datetime" in plan,
+        f"{found} {plan}"
+    ))
+
+    # Старая БД: колонки добавляет init_db (GUI при старте) — заполнение всё равно происходит
+    import tempfile
+    import init_db
+
+    old_rows = [(m["dialog_id"], json.dumps(m, ensure_ascii=False)) for _, m in iter_dialog_records(MULTI_CALL, {}, "file0002")]
+    with tempfile.TemporaryDirectory() as tmp:
+        for i, (label, upgrade) in enumerate((
+            ("init_db", lambda path, conn: init_db.init_db(path)),
+            ("колонки без заполнения", lambda path, conn: (ensure_dialog_columns(conn), ensure_dialog_metadata(conn))),
+        )):
+            path = Path(tmp) / f"old_{i}.db"
+            conn = sqlite3.connect(path)
+            conn.execute("CREATE TABLE dialogs (id TEXT PRIMARY KEY, text TEXT, metadata TEXT, source_theme TEXT, processed_at TEXT)")
+            conn.execute("CREATE TABLE utterances (id TEXT PRIMARY KEY, dialog_id TEXT, speaker TEXT, text TEXT, turn_order INTEGER)")
+            conn.executemany("INSERT INTO dialogs VALUES (?, '', ?, 'test', '')", old_rows)
+            conn.commit()
+            upgrade(path, conn)
+            found = [row[0] for row in conn.execute(f"SELECT d.id FROM dialogs d WHERE {where}", params)]
+            results.append(check(
+                f"Старая БД ({label}): колонки заполнены, повторно не заполняются",
+                found == ["111"] and ensure_dialog_metadata(conn) == 0,
+                str(found)
+            ))
+            conn.close()
+
+    # Синтетические экспорты разбираются в сгенерированное число диалогов и реплик
+    from dialog_parser import parse_rtf_file
+    from synthetic_exports import write_exports
+
+    with tempfile.TemporaryDirectory() as tmp:
+        stats = write_exports(tmp, themes=1, files=5, calls=3, replies=6, seed=1)
+        parsed = [parse_rtf_file(str(path), "test") for path in sorted(Path(tmp).rglob("*.rtf"))]
+    dialogs = [dialog for result in parsed for dialog in result["dialogs"]]
+    first = parsed[0]["dialogs"][0]["metadata"]
+    results.append(check(
+        "Синтетические экспорты: диалоги, реплики, метаданные имени файла",
+        len(dialogs) == stats["dialogs"] and sum(len(d["utterances"]) for d in dialogs) == stats["utterances"]
+        and first["operator_login_from_filename"] == first["participants"]["operator_login"],
+        f"{stats} {len(dialogs)} {first}"
+    ))
+
+    passed = sum(results)
+    print(f"\n📊 Пройдено {passed}/{len(results)}")
+    return 0 if passed == len(results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
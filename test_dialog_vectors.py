@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""Тестирование векторов диалогов из векторов реплик (dialog_vectors)."""
+
+import sys
+import sqlite3
+from pathlib import Path
+
+import numpy as np
+
+# Добавляем текущую директорию в путь
+current_dir = Path(__file__).parent
+sys.path.insert(0, str(current_dir))
+
+
+def check(name, condition, details=""):
+    status = "✅ ПРОЙДЕН" if condition else "❌ ПРОВАЛЕН"
+    print(f"{status} {name}")
+    if details and not condition:
+        print(f"    {details}")
+    return condition
+
+
+def normalize(vector):
+    return vector / np.linalg.norm(vector)
+
+
+def reference_pool(vectors, weights):
+    """Поэлементный пулинг одного диалога — эталон для сегментной редукции."""
+    return normalize((vectors * weights[:, None]).sum(axis=0))
+
+
+def main():
+    """Тестирование dialog_vectors."""
+    print("🧪 Тестирование векторов диалогов")
+    print("=" * 60)
+
+    import config
+    from dialog_vectors import segment_pool, speaker_role, build_dialog_vectors
+    from vector_codec import encode_vector, decode_vector
+
+    results = []
+    rng = np.random.default_rng(0)
+    dim = 8
+    sizes = [3, 1, 5]
+    vectors = rng.standard_normal((sum(sizes), dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    starts = np.cumsum([0] + sizes[:-1])
+    segments = [vectors[s:s + n] for s, n in zip(starts, sizes)]
+
+    pooled = segment_pool(vectors, starts, "mean")
+    expected = np.array([reference_pool(seg, np.ones(len(seg))) for seg in segments])
+    results.append(check("mean: совпадает с поэлементным расчётом", np.allclose(pooled, expected, atol=1e-6)))
+
+    weights = rng.uniform(0.1, 1.0, len(vectors)).astype(np.float32)
+    pooled = segment_pool(vectors, starts, "speaker", weights)
+    expected = np.array([reference_pool(seg, weights[s:s + n]) for seg, s, n in zip(segments, starts, sizes)])
+    results.append(check("speaker: взвешенное среднее", np.allclose(pooled, expected, atol=1e-6)))
+
+    temperature = 0.1
+    pooled = segment_pool(vectors, starts, "attention", temperature=temperature)
+    expected = []
+    for seg in segments:
+        scores = seg @ normalize(seg.mean(axis=0)) / temperature
+        expected.append(reference_pool(seg, np.exp(scores - scores.max())))
+    results.append(check("attention: softmax внутри диалога", np.allclose(pooled, np.array(expected), atol=1e-5)))
+
+    results.append(check(
+        "Роли: номер телефона — клиент",
+        speaker_role("79161234567") == "client" and speaker_role("+7 (916) 123-45-67") == "client"
+        and speaker_role("operator1") == "operator"
+    ))
+
+    # БД: диалог без векторов реплик пропускается
+    conn = sqlite3.connect(":memory:")
+    conn.executescript("""
+        CREATE TABLE dialogs (id TEXT PRIMARY KEY);
+        CREATE TABLE utterances (id TEXT PRIMARY KEY, dialog_id TEXT, speaker TEXT, text TEXT, turn_order INTEGER);
+        CREATE TABLE utterance_embeddings (utterance_id TEXT PRIMARY KEY, vector BLOB);
+        CREATE TABLE embeddings (dialog_id TEXT PRIMARY KEY, vector BLOB);
+    """)
+    conn.executemany("INSERT INTO dialogs VALUES (?)", [("d1",), ("d2",), ("d3",)])
+    for i, vector in enumerate(vectors[:4]):
+        dialog_id = "d1" if i < 3 else "d2"
+        conn.execute("INSERT INTO utterances VALUES (?, ?, ?, '', ?)", (f"u{i}", dialog_id, "operator1", i))
+        conn.execute("INSERT INTO utterance_embeddings VALUES (?, ?)", (f"u{i}", encode_vector(vector)))
+    conn.execute("INSERT INTO utterances VALUES ('u9', 'd3', 'operator1', '', 0)")
+
+    saved = (config.EMBEDDING_OUTPUT_DIMENSION, config.EMBEDDING_STORAGE_DTYPE)
+    config.EMBEDDING_OUTPUT_DIMENSION, config.EMBEDDING_STORAGE_DTYPE = dim, "float32"
+    try:
+        written = build_dialog_vectors(conn, "mean", log=lambda msg: None)
+    finally:
+        config.EMBEDDING_OUTPUT_DIMENSION, config.EMBEDDING_STORAGE_DTYPE = saved
+    rows = dict(conn.execute("SELECT dialog_id, vector FROM embeddings"))
+    results.append(check(
+        "БД: записаны векторы диалогов с репликами",
+        written == 2 and set(rows) == {"d1", "d2"}
+        and np.allclose(decode_vector(rows["d1"]), normalize(vectors[:3].mean(axis=0)), atol=1e-6)
+        and np.allclose(decode_vector(rows["d2"]), vectors[3], atol=1e-6),
+        str(sorted(rows))
+    ))
+
+    passed = sum(results)
+    print(f"\n📊 Пройдено {passed}/{len(results)}")
+    return 0 if passed == len(results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
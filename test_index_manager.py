@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""Тестирование ленивой загрузки индексов с бюджетом памяти (index_manager)."""
+
+import sys
+import sqlite3
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+# Добавляем текущую директорию в путь
+current_dir = Path(__file__).parent
+sys.path.insert(0, str(current_dir))
+
+
+def check(name, condition, details=""):
+    status = "✅ ПРОЙДЕН" if condition else "❌ ПРОВАЛЕН"
+    print(f"{status} {name}")
+    if details and not condition:
+        print(f"    {details}")
+    return condition
+
+
+def write_indexes(conn, folder, sizes, suffix=""):
+    """Flat-индексы тем {theme: векторов} с метками 1..N и строки faiss_indexes к ним."""
+    import faiss
+    from index_types import create_index
+
+    rng = np.random.default_rng(0)
+    for theme, count in sizes.items():
+        vectors = rng.standard_normal((count, 16)).astype(np.float32)
+        faiss.normalize_L2(vectors)
+        path = Path(folder) / f"faiss_index_{theme}{suffix}.index"
+        faiss.write_index(create_index(vectors, "IndexFlatIP", labels=np.arange(1, count + 1)), str(path))
+        conn.execute(
+            "INSERT OR REPLACE INTO faiss_indexes VALUES (?, ?, '', '2026-01-01', 'IndexFlatIP', '{}', ?)",
+            (theme, str(path), count)
+        )
+
+
+def main():
+    """Тестирование index_manager."""
+    print("🧪 Тестирование менеджера индексов")
+    print("=" * 60)
+
+    from index_manager import IndexManager
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = sqlite3.connect(":memory:")
+        conn.execute("""
+            CREATE TABLE faiss_indexes (theme TEXT PRIMARY KEY, index_path TEXT, ids_path TEXT, built_at TEXT,
+                                        index_type TEXT, search_params TEXT, indexed_rowid INTEGER)
+        """)
+        write_indexes(conn, tmp, {"all": 300, "t1": 100, "t2": 100, "t3": 100})
+        conn.execute("INSERT INTO faiss_indexes VALUES ('old', 'x.index', 'ids_old.json', '2025-01-01', NULL, NULL, NULL)")
+
+        manager = IndexManager(memory_mb=0)
+        manager.refresh(conn)
+        results.append(check(
+            "Каталог: индексы не открываются, старый формат пропущен",
+            manager.themes() == ["all", "t1", "t2", "t3"] and not manager.resident and "old" not in manager,
+            str(manager.themes())
+        ))
+
+        index = manager.get("t1")
+        _, found = index.search(np.ones((1, 16), dtype=np.float32), 3)
+        results.append(check(
+            "Индекс загружается при первом поиске, результаты — метки",
+            manager.status()["loads"] == 1 and found.min() >= 1 and manager.get("t1") is index
+            and manager.hits == 1 and manager.get("nope") is None
+        ))
+
+        # Бюджет на два индекса тем: третий вытесняет тот, к которому дольше не обращались
+        size = manager.catalog["t1"].size
+        manager = IndexManager(memory_mb=2.5 * size / 1024 ** 2)
+        manager.refresh(conn)
+        for theme in ("t1", "t2", "t1", "t3"):
+            manager.get(theme)
+        results.append(check(
+            "LRU: вытесняется давно не использованный",
+            list(manager.resident) == ["t1", "t3"] and manager.evictions == 1,
+            str(list(manager.resident))
+        ))
+
+        manager.get("all")
+        results.append(check(
+            "Индекс больше бюджета остаётся один",
+            list(manager.resident) == ["all"] and manager.status()["resident"][0]["vectors"] == 300,
+            str(manager.status())
+        ))
+
+        # Перестройка пишет новый файл: загруженный индекс выгружается и читается заново
+        manager.get("t1")
+        write_indexes(conn, tmp, {"t1": 120}, suffix=".2")
+        manager.refresh(conn)
+        results.append(check(
+            "refresh выгружает обновлённые индексы",
+            "t1" not in manager.resident and manager.get("t1").ntotal == 120,
+            str(list(manager.resident))
+        ))
+        # Отображённые файлы нужно закрыть до удаления временной папки (Windows)
+        del manager, index
+        conn.close()
+
+    passed = sum(results)
+    print(f"\n📊 Пройдено {passed}/{len(results)}")
+    return 0 if passed == len(results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
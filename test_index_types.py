@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""Тестирование типов FAISS-индексов и параметров поиска (index_types)."""
+
+import sys
+import json
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+# Добавляем текущую директорию в путь
+current_dir = Path(__file__).parent
+sys.path.insert(0, str(current_dir))
+
+
+def check(name, condition, details=""):
+    status = "✅ ПРОЙДЕН" if condition else "❌ ПРОВАЛЕН"
+    print(f"{status} {name}")
+    if details and not condition:
+        print(f"    {details}")
+    return condition
+
+
+def main():
+    """Тестирование index_types."""
+    print("🧪 Тестирование типов FAISS-индексов")
+    print("=" * 60)
+
+    import faiss
+    import config
+    import index_types
+    from index_types import (
+        index_spec, create_index, index_metadata, apply_search_parameters, selector_parameters,
+        matches_config, supports_removal, read_index
+    )
+
+    results = []
+    saved = (config.FAISS_FLAT_MAX_VECTORS, config.FAISS_NLIST, config.FAISS_NPROBE, config.FAISS_PQ_M)
+    config.FAISS_FLAT_MAX_VECTORS, config.FAISS_NLIST, config.FAISS_NPROBE, config.FAISS_PQ_M = 1000, 0, 8, 8
+    try:
+        results.append(check(
+            "Спецификации индексов",
+            index_spec(500, 64, "IndexIVFFlat") == "Flat"
+            and index_spec(10000, 64, "IndexIVFFlat") == "IVF256,Flat"
+            and index_spec(10000, 64, "OPQ+IndexIVFPQ") == "OPQ8,IVF256,PQ8x8"
+            and index_spec(10000, 64, "IndexHNSWFlat") == f"HNSW{config.FAISS_M},Flat",
+            index_spec(10000, 64, "IndexIVFFlat")
+        ))
+        try:
+            index_spec(10000, 60, "IndexIVFPQ")
+            results.append(check("PQ: размерность не делится на FAISS_PQ_M — ошибка", False))
+        except ValueError:
+            results.append(check("PQ: размерность не делится на FAISS_PQ_M — ошибка", True))
+
+        rng = np.random.default_rng(0)
+        # Кластеризованные данные, как у эмбеддингов реплик
+        centers = rng.standard_normal((50, 32)).astype(np.float32)
+        vectors = centers[rng.integers(0, 50, 5000)] + 0.3 * rng.standard_normal((5000, 32)).astype(np.float32)
+        faiss.normalize_L2(vectors)
+        queries = vectors[:50]
+        exact = faiss.IndexFlatIP(32)
+        exact.add(vectors)
+        _, expected = exact.search(queries, 10)
+
+        index = create_index(vectors, "IndexIVFFlat")
+        index_type, params = index_metadata(index)
+        _, found = index.search(queries, 10)
+        recall = np.mean([len(set(a) & set(b)) / 10 for a, b in zip(expected, found)])
+        results.append(check(
+            "IVF: параметры поиска и полнота",
+            index_type == "IndexIVFFlat" and params == {"nprobe": 8} and recall > 0.9,
+            f"{index_type} {params} recall={recall:.2f}"
+        ))
+
+        apply_search_parameters(index, json.dumps({"nprobe": 3}))
+        results.append(check("IVF: параметры из faiss_indexes применяются", index_metadata(index)[1] == {"nprobe": 3}))
+
+        allowed = np.arange(0, 5000, 2, dtype=np.int64)
+        search_params = selector_parameters(index, faiss.IDSelectorBatch(allowed))
+        _, found = index.search(queries, 10, params=search_params)
+        results.append(check(
+            "IVF: фильтр по ID сохраняет nprobe",
+            search_params.nprobe == 3 and (found[found >= 0] % 2 == 0).all(),
+            str(found[:2])
+        ))
+
+        index = create_index(vectors[:2000], "IndexHNSWFlat")
+        results.append(check(
+            "HNSW: тип и efSearch",
+            index_metadata(index) == ("IndexHNSWFlat", {"efSearch": config.FAISS_EF_SEARCH}),
+            str(index_metadata(index))
+        ))
+
+        # Метки — rowid реплик: поиск возвращает их, удаление и дописывание по меткам
+        labels = np.arange(5000, dtype=np.int64) * 3 + 7
+        for index_type in ("IndexIVFFlat", "IndexFlatIP"):
+            count = 4000 if index_type == "IndexIVFFlat" else 800
+            index = create_index(vectors[:count], index_type, labels=labels[:count])
+            index.remove_ids(faiss.IDSelectorBatch(labels[:10]))
+            index.add_with_ids(vectors[count:count + 5], labels[count:count + 5])
+            _, found = index.search(np.concatenate([vectors[10:15], vectors[count:count + 5]]), 1)
+            results.append(check(
+                f"{index_type}: метки rowid, удаление и дописывание",
+                index.ntotal == count - 5 and found[:, 0].tolist() == labels[10:15].tolist() + labels[count:count + 5].tolist()
+                and supports_removal(index) and matches_config(index, index.ntotal),
+                f"{index_metadata(index)} {found[:, 0]}"
+            ))
+
+        # Индекс по выборке строк (rows) строится порциями и совпадает с индексом по копии выборки
+        rows = np.arange(1, 5000, 2)
+        chunk_rows, index_types.ADD_CHUNK_ROWS = index_types.ADD_CHUNK_ROWS, 300
+        by_rows = create_index(vectors, "IndexIVFFlat", labels=labels[rows], rows=rows)
+        index_types.ADD_CHUNK_ROWS = chunk_rows
+        by_copy = create_index(vectors[rows], "IndexIVFFlat", labels=labels[rows])
+        results.append(check(
+            "IVF по выборке строк = по копии выборки",
+            by_rows.ntotal == len(rows)
+            and np.array_equal(by_rows.search(vectors[:20], 5)[1], by_copy.search(vectors[:20], 5)[1])
+        ))
+
+        index = create_index(vectors[:2000], "IndexHNSWFlat", labels=labels[:2000])
+        results.append(check(
+            "HNSW: метки rowid, удаление не поддерживается",
+            index_metadata(index)[0] == "IndexHNSWFlat" and not supports_removal(index)
+            and not matches_config(index, 500)
+        ))
+
+        # Отображённый в память индекс ищет так же, как прочитанный целиком
+        with tempfile.TemporaryDirectory() as tmp:
+            for index_type, count in (("IndexIVFFlat", 4000), ("IndexFlatIP", 800), ("IndexHNSWFlat", 2000)):
+                path = Path(tmp) / f"{index_type}.index"
+                faiss.write_index(create_index(vectors[:count], index_type, labels=labels[:count]), str(path))
+                loaded, _ = read_index(path, index_type, mmap=False)
+                mapped, is_mapped = read_index(path, index_type, mmap=True)
+                expected, found = loaded.search(queries, 10)[1], mapped.search(queries, 10)[1]
+                results.append(check(f"{index_type}: поиск по отображённому в память индексу", is_mapped and (expected == found).all()))
+                del mapped
+    finally:
+        config.FAISS_FLAT_MAX_VECTORS, config.FAISS_NLIST, config.FAISS_NPROBE, config.FAISS_PQ_M = saved
+
+    passed = sum(results)
+    print(f"\n📊 Пройдено {passed}/{len(results)}")
+    return 0 if passed == len(results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
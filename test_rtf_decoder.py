@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""Дифференциальное тестирование быстрого RTF-декодера против striprtf.
+
+Каждый документ корпуса декодируется обоими способами; вывод (или тип
+исключения) должен совпадать. Дополнительно проверяются реальные экспорты
+из Input/ и processed/, если они есть.
+"""
+
+import sys
+import random
+from pathlib import Path
+
+# Добавляем текущую директорию в путь
+current_dir = Path(__file__).parent
+sys.path.insert(0, str(current_dir))
+
+HEADER = r"{\rtf1\ansi\ansicpg1251\deff0\nouicompat{\fonttbl{\f0\fnil\fcharset204 Calibri;}{\f1\fnil\fcharset0 Arial;}}" "\n"
+HEADER += r"{\colortbl ;\red0\green0\blue255;}{\*\generator Riched20 10.0.19041}\viewkind4\uc1" "\n"
+
+
+def cp1251_escape(text):
+    """Кодирует не-ASCII символы как \\'xx (как делают экспорты телефонии)."""
+    return "".join(c if ord(c) < 128 else "\\'%02x" % c.encode("cp1251")[0] for c in text)
+
+
+def unicode_escape(text):
+    """Кодирует не-ASCII символы как \\uN? (RTF 1.5+)."""
+    out = []
+    for c in text:
+        code = ord(c)
+        if code < 128:
+            out.append(c)
+        else:
+            out.append("\\u%d?" % (code - 0x10000 if code > 32767 else code))
+    return "".join(out)
+
+
+def make_export(lines, escape=cp1251_escape):
+    body = "\\par\n".join(escape(line).replace("\t", "\\tab ") for line in lines)
+    return HEADER + r"\pard\sa200\sl276\slmult1\f0\fs22\lang1049 " + body + "\\par\n}\n"
+
+
+EXPORT_LINES = [
+    "Rtf export, 2 call(s)",
+    "Порог чувствительности: 5,00 с",
+    "123456 (01.02.2024 10:11:12)",
+    "ivanov@corp.ru -> 79161234567",
+    "ivanov@corp.ru\tЗдравствуйте, компания «Связь», меня зовут Иван.\t00:00:01",
+    "79161234567\tАлло, да. У меня не работает интернет!\t00:00:03",
+    "654321 (01.02.2024 11:00:00)",
+    "petrov@corp.ru <- 79160000000",
+    "petrov@corp.ru\tДобрый день — чем могу помочь?\t00:00:02",
+]
+
+RTF_CORPUS = [
+    ("экспорт cp1251 (\\'xx)", make_export(EXPORT_LINES)),
+    ("экспорт \\uN?", make_export(EXPORT_LINES, unicode_escape)),
+    ("пустой документ", r"{\rtf1}"),
+    ("пустая строка", ""),
+    ("без группы", "просто текст \\par вторая строка"),
+    ("\\uc0 и \\uc2", r"{\rtf1\uc0\u1055\u1088 \uc2\u1080??\u1074**\'e5\'f2 end}"),
+    ("\\u без аргумента", r"{\rtf1\u?x\'c0\'c1y}"),
+    ("отрицательный \\u", r"{\rtf1\u-3913?}"),
+    ("\\u пропускает \\'xx", r"{\rtf1\ansicpg1251\u1055\'cf\'f0\'e8}"),
+    ("\\uc2 пропускает \\'xx и текст", r"{\rtf1\ansicpg1251\uc2\u1055\'cf text\u1056\'cf\'f0\'e8 end}"),
+    ("символы \\{ \\} \\\\ \\~ \\- \\_", r"{\rtf1 a\{b\}c\\d\~e\-f\_g}"),
+    ("\\* направление", r"{\rtf1 a{\*\unknowndest skipped {nested}}b}"),
+    ("вложенные назначения", r"{\rtf1{\info{\title T}{\author A}}text}"),
+    ("смена шрифтов", r"{\rtf1\ansi{\fonttbl{\f0\fcharset204 A;}{\f1\fcharset161 B;}}\f0\'c0\f1\'c1\f2\'c2}"),
+    ("ansicpg неизвестный", r"{\rtf1\ansicpg99999 \'41\'42}"),
+    ("текст после закрытия документа", r"{\rtf1 inside}outside"),
+    ("лишняя закрывающая скобка", r"x}{y}z"),
+    ("одиночный \\ в конце", "{\\rtf1 abc}\\"),
+    ("обрыв документа", r"{\rtf1 abc\'c0"),
+    ("обрыв после \\'xx и перевода строки", "{\\rtf1 abc\\'e4\\'e0\n"),
+    ("\\' без hex", r"{\rtf1 a\'zz b}"),
+    ("перевод строки после \\", "{\\rtf1 a\\\nb\\\r\nc}"),
+    ("fallback: \\emdash и \\bullet", r"{\rtf1 a\emdash b\bullet c}"),
+    ("fallback: таблица", r"{\rtf1 \trowd a\cell b\cell\row}"),
+    ("fallback: \\sect и \\page", r"{\rtf1 a\sect b\page c}"),
+    ("fallback: гиперссылка",
+     r'{\rtf1{\field{\*\fldinst{HYPERLINK "http://example.com"}}{\fldrslt{link}}}}'),
+    ("fallback: картинка", r"{\rtf1 a{\pict\bin3 xyz}b}"),
+    ("\\uc без аргумента (исключение)", r"{\rtf1\uc\u1055?}"),
+    ("ошибка декодирования (исключение)", r"{\rtf1\ansicpg1252 \'81}"),
+]
+
+FUZZ_TOKENS = [
+    "{", "}", "\\par ", "\\par\n", "\\line ", "\\tab ", "\\'c0", "\\'e4\\'e0", "\\'8", "\\u1055?",
+    "\\u-200?", "\\u1056", "\\u1057 ", "\\uc0 ", "\\uc1 ", "\\uc2 ", "\\f0 ", "\\f1 ", "\\b ", "\\b0 ", "\\fs22 ",
+    "\\*", "\\fonttbl ", "\\colortbl ", "\\info ", "\\{", "\\}", "\\\\", "\\~", "\r\n", "\n",
+    "Привет", "abc", " ", "\t", "?", "ab?cd", "\\ansicpg1251 ", "\\pard\\plain ",
+]
+
+
+def fuzz_corpus(count=300, seed=20240201):
+    rng = random.Random(seed)
+    prefix = r"{\rtf1\ansi{\fonttbl{\f0\fcharset204 A;}{\f1\fcharset0 B;}}"
+    for i in range(count):
+        body = "".join(rng.choice(FUZZ_TOKENS) for _ in range(rng.randint(1, 60)))
+        yield f"fuzz #{i}", prefix + body + ("}" if rng.random() < 0.8 else "")
+
+
+def real_exports(limit=200):
+    import config
+    files = []
+    for root in (config.INPUT_ROOT, config.PROCESSED_ROOT):
+        files.extend(sorted(root.glob("*/*.rtf")))
+    for path in files[:limit]:
+        yield f"файл {path.name}", path.read_text(encoding="utf-8", errors="ignore")
+
+
+def decode(func, text):
+    try:
+        return "ok", func(text)
+    except Exception as e:
+        return "error", type(e).__name__
+
+
+def main():
+    """Сравнение быстрого декодера со striprtf."""
+    print("🧪 Дифференциальное тестирование rtf_decoder против striprtf")
+    print("=" * 60)
+
+    from striprtf.striprtf import rtf_to_text as striprtf_to_text
+    from rtf_decoder import rtf_to_text, fast_rtf_to_text, UnsupportedRTF
+
+    checked = 0
+    failed = 0
+    fallbacks = 0
+    documents = list(RTF_CORPUS) + list(fuzz_corpus()) + list(real_exports())
+    for name, text in documents:
+        expected = decode(striprtf_to_text, text)
+        checked += 1
+        # Сравниваем именно быстрый путь: fallback не должен маскировать ошибки
+        try:
+            actual = ("ok", fast_rtf_to_text(text))
+        except UnsupportedRTF:
+            fallbacks += 1
+            actual = decode(rtf_to_text, text)
+        except Exception as e:
+            actual = ("error", type(e).__name__)
+        if actual != expected:
+            failed += 1
+            print(f"❌ ПРОВАЛЕН {name}")
+            print(f"    striprtf: {expected!r}")
+            print(f"    rtf_decoder: {actual!r}")
+        elif not name.startswith("fuzz"):
+            print(f"✅ ПРОЙДЕН {name}")
+
+    print(f"\n📊 Проверено документов: {checked}, расхождений: {failed}, ушло в striprtf: {fallbacks}")
+    return 0 if failed == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
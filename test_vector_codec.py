@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""Тестирование формата векторов (vector_codec) и миграции старых BLOB-ов."""
+
+import sys
+import pickle
+import sqlite3
+from pathlib import Path
+
+import numpy as np
+
+# Добавляем текущую директорию в путь
+current_dir = Path(__file__).parent
+sys.path.insert(0, str(current_dir))
+
+
+class Evil:
+    """Объект, который не должен распаковываться при миграции."""
+
+    def __reduce__(self):
+        return (print, ("pickle выполнил код",))
+
+
+def check(name, condition, details=""):
+    status = "✅ ПРОЙДЕН" if condition else "❌ ПРОВАЛЕН"
+    print(f"{status} {name}")
+    if details and not condition:
+        print(f"    {details}")
+    return condition
+
+
+def main():
+    """Тестирование vector_codec и migrate_vectors."""
+    print("🧪 Тестирование формата векторов")
+    print("=" * 60)
+
+    from vector_codec import encode_vector, decode_vector, decode_matrix, is_encoded
+    from migrate_vectors import migrate_table
+
+    results = []
+    rng = np.random.default_rng(0)
+    dim = 16
+    vectors = rng.standard_normal((5, dim)).astype(np.float32)
+
+    blob = encode_vector(vectors[0])
+    results.append(check("float32: размер и заголовок", len(blob) == 8 + dim * 4 and is_encoded(blob)))
+    results.append(check("float32: точное восстановление", np.array_equal(decode_vector(blob), vectors[0])))
+
+    blob16 = encode_vector(vectors[0], "float16")
+    results.append(check(
+        "float16: вдвое меньше и близко к исходному",
+        len(blob16) == 8 + dim * 2 and np.allclose(decode_vector(blob16), vectors[0], atol=1e-2)
+    ))
+
+    try:
+        decode_vector(pickle.dumps(vectors[0]))
+        results.append(check("pickle отвергается декодером", False))
+    except ValueError:
+        results.append(check("pickle отвергается декодером", True))
+
+    matrix, valid = decode_matrix([encode_vector(v) for v in vectors], dim)
+    results.append(check("Матрица одним frombuffer", valid.all() and np.array_equal(matrix, vectors)))
+
+    mixed = [encode_vector(vectors[0]), encode_vector(vectors[1], "float16"), pickle.dumps(vectors[2]),
+             encode_vector(vectors[3][:8]), encode_vector(vectors[4])]
+    matrix, valid = decode_matrix(mixed, dim, out=np.empty((8, dim), dtype=np.float32))
+    results.append(check(
+        "Смешанные форматы: плохие строки пропущены",
+        valid.tolist() == [True, True, False, False, True]
+        and matrix.shape == (3, dim)
+        and np.array_equal(matrix[2], vectors[4]),
+        str(valid)
+    ))
+
+    short = vectors[:, :8] / np.linalg.norm(vectors[:, :8], axis=1, keepdims=True)
+    matrix, valid = decode_matrix([encode_vector(v) for v in vectors[:2]] + [encode_vector(short[2])], 8, truncate=True)
+    results.append(check(
+        "Matryoshka: префикс длинных векторов",
+        valid.all() and np.array_equal(matrix[:2], vectors[:2, :8]) and np.array_equal(matrix[2], short[2])
+    ))
+    results.append(check(
+        "Matryoshka: без truncate длинные векторы отвергаются",
+        not decode_matrix([encode_vector(vectors[0])], 8)[1].any()
+    ))
+    from matryoshka import truncate_embeddings
+    results.append(check(
+        "Matryoshka: усечение с нормализацией",
+        np.allclose(truncate_embeddings(vectors, 8), short) and truncate_embeddings(vectors[0], dim).shape == (dim,)
+    ))
+
+    # Миграция: pickle, "сырой" float32, уже новый формат, вредоносный pickle
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE utterance_embeddings (utterance_id TEXT PRIMARY KEY, vector BLOB NOT NULL)")
+    conn.executemany("INSERT INTO utterance_embeddings VALUES (?, ?)", [
+        ("u1", pickle.dumps(vectors[0])),
+        ("u2", vectors[1].tobytes()),
+        ("u3", encode_vector(vectors[2])),
+        ("u4", pickle.dumps(Evil())),
+        ("u5", pickle.dumps(vectors[4].tolist())),
+    ])
+    conn.commit()
+    converted, skipped, failed = migrate_table(conn, "utterance_embeddings", dim, "float32", batch_size=2)
+    results.append(check("Миграция: счётчики", (converted, skipped, failed) == (3, 1, 1), str((converted, skipped, failed))))
+    rows = dict(conn.execute("SELECT utterance_id, vector FROM utterance_embeddings"))
+    results.append(check(
+        "Миграция: значения сохранены",
+        all(np.array_equal(decode_vector(rows[u]), vectors[i]) for u, i in (("u1", 0), ("u2", 1), ("u3", 2), ("u5", 4)))
+    ))
+    results.append(check("Миграция: вредоносный pickle не тронут", not is_encoded(rows["u4"])))
+    converted, skipped, failed = migrate_table(conn, "utterance_embeddings", dim, "float32", batch_size=2)
+    results.append(check("Повторный запуск ничего не меняет", (converted, skipped, failed) == (0, 4, 1)))
+
+    passed = sum(results)
+    print(f"\n📊 Пройдено {passed}/{len(results)}")
+    return 0 if passed == len(results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
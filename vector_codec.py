@@ -0,0 +1,120 @@
+"""Формат хранения векторов в BLOB-колонках SQLite.
+
+Формат (little-endian):
+    байты 0-1  magic b"EV"
+    байт  2    версия формата (1)
+    байт  3    код типа: 1 — float32, 2 — float16
+    байты 4-7  размерность вектора (uint32)
+    далее      dim значений указанного типа
+
+Заголовок занимает 8 байт, поэтому данные выровнены и для float32, и для
+float16: матрица строк одного формата читается одним np.frombuffer без
+поэлементного разбора. Старые форматы (pickle.dumps(ndarray) и "сырой"
+tobytes() без заголовка) конвертирует migrate_vectors.py.
+"""
+
+import struct
+
+import numpy as np
+
+MAGIC = b"EV"
+VERSION = 1
+HEADER = struct.Struct("<2sBBI")
+HEADER_SIZE = HEADER.size  # 8 байт
+
+DTYPE_CODES = {
+    "float32": 1,
+    "float16": 2,
+}
+CODE_DTYPES = {code: np.dtype(name).newbyteorder("<") for name, code in DTYPE_CODES.items()}
+
+
+def encode_vector(vector, dtype: str = "float32") -> bytes:
+    """Сериализует вектор в BLOB с заголовком."""
+    if dtype not in DTYPE_CODES:
+        raise ValueError(f"Неподдерживаемый тип хранения вектора: {dtype}")
+    data = np.asarray(vector, dtype=CODE_DTYPES[DTYPE_CODES[dtype]]).ravel()
+    return HEADER.pack(MAGIC, VERSION, DTYPE_CODES[dtype], data.shape[0]) + data.tobytes()
+
+
+def read_header(blob):
+    """(dtype, dim) для BLOB в текущем формате, иначе None."""
+    if blob is None or len(blob) < HEADER_SIZE:
+        return None
+    magic, version, code, dim = HEADER.unpack_from(blob)
+    if magic != MAGIC or version != VERSION or code not in CODE_DTYPES:
+        return None
+    dtype = CODE_DTYPES[code]
+    if len(blob) != HEADER_SIZE + dim * dtype.itemsize:
+        return None
+    return dtype, dim
+
+
+def is_encoded(blob) -> bool:
+    return read_header(blob) is not None
+
+
+def decode_vector(blob) -> np.ndarray:
+    """Вектор из BLOB без копирования (массив только для чтения).
+
+    Raises:
+        ValueError: BLOB не в текущем формате (нужна миграция).
+    """
+    header = read_header(blob)
+    if header is None:
+        raise ValueError("BLOB не в формате vector_codec (запустите migrate_vectors.py)")
+    dtype, dim = header
+    return np.frombuffer(blob, dtype=dtype, count=dim, offset=HEADER_SIZE)
+
+
+def decode_matrix(blobs, dim: int, out=None, truncate=False):
+    """Собирает BLOB-ы в матрицу float32 (len(blobs), dim).
+
+    Если все строки в одном формате, матрица читается одним np.frombuffer по
+    склеенным байтам. Иначе строки разбираются по одной; некорректные строки
+    (другой формат или размерность) пропускаются.
+
+    Args:
+        blobs: Последовательность BLOB-ов.
+        dim: Ожидаемая размерность.
+        out: Необязательный предвыделенный float32-массив формы не меньше (len(blobs), dim).
+        truncate: Брать первые dim компонент более длинных векторов (Matryoshka);
+            нормализация — на стороне вызывающего.
+
+    Returns:
+        (matrix, valid), где matrix — первые valid.sum() строк out (или новый
+        массив), valid — булева маска разобранных BLOB-ов.
+    """
+    count = len(blobs)
+    if out is None:
+        out = np.empty((count, dim), dtype=np.float32)
+    valid = np.zeros(count, dtype=bool)
+    if count == 0:
+        return out[:0], valid
+
+    def usable(header):
+        return header is not None and (header[1] == dim or (truncate and header[1] > dim))
+
+    first = blobs[0]
+    header = read_header(first)
+    if usable(header):
+        dtype, stored_dim = header
+        row_size = HEADER_SIZE + stored_dim * dtype.itemsize
+        prefix = bytes(first[:HEADER_SIZE])
+        if all(len(blob) == row_size and blob[:HEADER_SIZE] == prefix for blob in blobs):
+            # Заголовок кратен размеру элемента: отрезаем его как первые столбцы
+            rows = np.frombuffer(b"".join(blobs), dtype=dtype).reshape(count, -1)
+            start = HEADER_SIZE // dtype.itemsize
+            out[:count] = rows[:, start:start + dim]
+            valid[:] = True
+            return out[:count], valid
+
+    filled = 0
+    for i, blob in enumerate(blobs):
+        header = read_header(blob)
+        if not usable(header):
+            continue
+        out[filled] = np.frombuffer(blob, dtype=header[0], count=dim, offset=HEADER_SIZE)
+        valid[i] = True
+        filled += 1
+    return out[:filled], valid